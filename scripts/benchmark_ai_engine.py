@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark the AI response engine against the local stub backend.
+
+Simulates many users asking questions at once and reports throughput and
+latency for a few batch sizes, without a database or a live model service.
+"""
+
+import sys
+import os
+import time
+import argparse
+import threading
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from ai_engine import ResponseEngine, StubBackend
+
+CLAUSES = [{
+    "document_id": 1, "ordinal": 0, "page_number": 1, "heading": "2. TERM AND TERMINATION",
+    "content": "2.2 Either party may terminate this Agreement on 30 days written notice.", "score": 1.0,
+}]
+
+
+def run(batch_size, users, questions_per_user, batch_latency, chunk_delay, max_in_flight):
+    engine = ResponseEngine()
+    engine.configure(
+        StubBackend(chunk_delay=chunk_delay, batch_latency=batch_latency),
+        max_batch_size=batch_size,
+        max_in_flight=max_in_flight,
+        max_pending_per_user=questions_per_user,
+        max_queue=users * questions_per_user,
+    )
+    latencies = []
+    lock = threading.Lock()
+
+    def user(n):
+        for i in range(questions_per_user):
+            started = time.perf_counter()
+            engine.generate(f"user-{n}", f"How do I terminate? ({i})", CLAUSES)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    stats = engine.stats()
+    print(f"batch≤{batch_size:<3} {len(latencies) / elapsed:8.1f} answers/s   "
+          f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms   "
+          f"avg batch {stats['avg_batch_size']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--questions", type=int, default=4, help="Questions per user, asked one after another")
+    parser.add_argument("--batch-latency", type=float, default=0.05, help="Simulated seconds per model call")
+    parser.add_argument("--chunk-delay", type=float, default=0.002, help="Simulated seconds per decoding step")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    args = parser.parse_args()
+
+    print(f"🚀 {args.users} users × {args.questions} questions, {args.max_in_flight} batches in flight")
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        run(batch_size, args.users, args.questions, args.batch_latency, args.chunk_delay, args.max_in_flight)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Apply versioned schema migrations to the ClauseEase AI database.
+
+    python scripts/migrate.py init       # one-time setup: create tables, then apply migrations
+    python scripts/migrate.py status     # applied and pending migrations
+    python scripts/migrate.py upgrade    # apply pending ones, with query plans before and after
+    python scripts/migrate.py plans      # query plans of the hot endpoints only
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from app import create_app, init_database
+from extensions import db
+from migrations import MIGRATIONS, applied_versions, upgrade, query_plans
+
+
+def print_plans(conn, args, title=None):
+    print(f"\n📊 Query plans {title}" if title else "\n📊 Query plans")
+    for endpoint, lines in query_plans(conn, args.email, args.document_id, args.chat_id).items():
+        print(f"\n  {endpoint}")
+        for line in lines:
+            print(f"    {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["init", "status", "upgrade", "plans"])
+    parser.add_argument("--target", type=int, help="Stop after this version (upgrade)")
+    parser.add_argument("--no-plans", action="store_true", help="Skip query plans (upgrade)")
+    parser.add_argument("--email", help="User for sample queries (default: the one with most documents)")
+    parser.add_argument("--document-id", type=int, help="Document for sample queries")
+    parser.add_argument("--chat-id", type=int, help="Chat for sample queries")
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.command == "init":
+        sys.exit(0 if init_database(app) else 1)
+
+    with app.app_context(), db.engine.connect() as conn:
+        if args.command == "plans":
+            print_plans(conn, args)
+            return
+
+        applied = applied_versions(conn)
+        if args.command == "status":
+            for version, description, _ in MIGRATIONS:
+                mark = "✅" if version in applied else "⏳"
+                print(f"{mark} {version:04d} {description}")
+            return
+
+        if all(version in applied for version, _, _ in MIGRATIONS):
+            print("✅ Schema is up to date")
+            return
+        if not args.no_plans:
+            print_plans(conn, args, "before")
+        done = upgrade(conn, args.target)
+        print(f"\n✅ Applied {len(done)} migration(s)")
+        if not args.no_plans:
+            print_plans(conn, args, "after")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+import asyncio
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+FALLBACK_RESPONSES = [
+    "Based on your document, I can see that this is an interesting topic. Could you be more specific about what you'd like to know?",
+    "I've analyzed the content and found several key points. What aspect would you like me to focus on?",
+    "The document contains valuable information about this subject. Let me know what specific questions you have.",
+    "I can help you understand this better. What particular section or concept would you like me to explain?",
+    "This is a comprehensive document with many insights. What specific area would you like to explore?"
+]
+
+
+class EngineBusy(Exception):
+    """Raised when the engine (or one user's share of it) is at capacity"""
+
+
+class EngineTimeout(Exception):
+    """Raised when a request waits or generates for longer than allowed"""
+
+
+# ---------------------------------------------------------------------------
+# Backends
+#
+# A backend exposes ``name``, ``version``, ``from_config(config)`` and
+# ``async generate_batch(prompts, emit)``. ``prompts`` is a list of
+# ``(question, clauses)`` pairs; the backend calls ``emit(index, text)`` for
+# every chunk of every answer, in order, and returns when all are complete.
+# ---------------------------------------------------------------------------
+
+class StubBackend:
+    """Deterministic local stand-in for a language model.
+
+    Answers from the retrieved clauses. ``batch_latency`` simulates the fixed
+    cost of one model call (paid once per batch) and ``chunk_delay`` one
+    decoding step (shared by every answer in the batch), so batching behaves
+    like it would against a real inference server.
+    """
+
+    name = "stub"
+    version = "stub-1"
+
+    def __init__(self, chunk_delay=0.0, batch_latency=0.0, words_per_chunk=3):
+        self.chunk_delay = chunk_delay
+        self.batch_latency = batch_latency
+        self.words_per_chunk = words_per_chunk
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            chunk_delay=config.get("AI_STUB_CHUNK_DELAY", 0.0),
+            batch_latency=config.get("AI_STUB_BATCH_LATENCY", 0.0),
+        )
+
+    def compose(self, question, clauses):
+        if not clauses:
+            return FALLBACK_RESPONSES[zlib.crc32(question.encode("utf-8")) % len(FALLBACK_RESPONSES)]
+        best = clauses[0]
+        excerpt = best["content"] if len(best["content"]) <= 600 else best["content"][:600].rsplit(" ", 1)[0] + "..."
+        where = f"\"{best['heading']}\" (page {best['page_number']})" if best["heading"] else f"page {best['page_number']}"
+        response = f"The most relevant part of your document is {where}:\n\n{excerpt}"
+        other_pages = sorted({c["page_number"] for c in clauses[1:]})
+        if other_pages:
+            label = "page" if len(other_pages) == 1 else "pages"
+            response += f"\n\nRelated clauses also appear on {label} {', '.join(map(str, other_pages))}."
+        return response
+
+    def chunks(self, question, clauses):
+        """Split the answer into small chunks, whitespace included"""
+        words = re.findall(r"\S+\s*", self.compose(question, clauses))
+        return ["".join(words[i:i + self.words_per_chunk]) for i in range(0, len(words), self.words_per_chunk)]
+
+    async def generate_batch(self, prompts, emit):
+        if self.batch_latency:
+            await asyncio.sleep(self.batch_latency)
+        answers = [self.chunks(question, clauses) for question, clauses in prompts]
+        for step in range(max((len(a) for a in answers), default=0)):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            for index, answer in enumerate(answers):
+                if step < len(answer):
+                    emit(index, answer[step])
+
+
+BACKENDS = {
+    "stub": StubBackend,
+}
+
+
+def create_backend(name, config):
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown AI backend '{name}'. Available: {', '.join(sorted(BACKENDS))}")
+    return backend_class.from_config(config)
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+_DONE = object()
+
+
+class GenerationRequest:
+    """One question waiting for (or receiving) an answer"""
+
+    def __init__(self, user_key, question, clauses):
+        self.user_key = user_key
+        self.question = question
+        self.clauses = clauses
+        self.future = Future()
+        self.chunks = queue.Queue()
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+
+    def finish(self, text):
+        if not self.future.done():
+            self.future.set_result(text)
+        self.chunks.put(_DONE)
+
+    def fail(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+        self.chunks.put(error)
+
+
+class ResponseEngine:
+    """Runs generation for all request threads on one asyncio loop.
+
+    Requests are queued per user and drained round-robin into micro-batches,
+    so one busy user cannot starve the rest. At most ``max_in_flight``
+    batches run against the backend at once and each batch is bounded by
+    ``timeout``. Flask threads only submit work and wait on the result.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.max_batch_size = 8
+        self.batch_window = 0.01
+        self.max_in_flight = 4
+        self.timeout = 60.0
+        self.queue_timeout = 30.0
+        self.max_queue = 256
+        self.max_pending_per_user = 4
+
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._queues = OrderedDict()  # user_key -> deque of requests, loop thread only
+        self._has_work = None
+        self._slots = None
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pending_per_user = {}
+        self._counters = {
+            "submitted": 0, "completed": 0, "failed": 0, "timeouts": 0,
+            "rejected": 0, "cancelled": 0, "batches": 0, "batched_requests": 0,
+        }
+        self._queued = 0
+        self._in_flight_batches = 0
+        self._queue_wait_total = 0.0
+        self._generation_total = 0.0
+
+    def init_app(self, app):
+        config = app.config
+        self.configure(
+            create_backend(config["AI_BACKEND"], config),
+            max_batch_size=config["AI_MAX_BATCH_SIZE"],
+            batch_window=config["AI_BATCH_WINDOW_MS"] / 1000,
+            max_in_flight=config["AI_MAX_IN_FLIGHT"],
+            timeout=config["AI_TIMEOUT"],
+            queue_timeout=config["AI_QUEUE_TIMEOUT"],
+            max_queue=config["AI_MAX_QUEUE"],
+            max_pending_per_user=config["AI_MAX_PENDING_PER_USER"],
+        )
+        app.extensions["response_engine"] = self
+
+    def configure(self, backend, **limits):
+        for name, value in limits.items():
+            if not hasattr(self, name):
+                raise TypeError(f"Unknown engine setting '{name}'")
+            setattr(self, name, value)
+        self.backend = backend
+
+    # -- request thread API -------------------------------------------------
+
+    def submit(self, user_key, question, clauses):
+        """Queue a question; raises ``EngineBusy`` instead of queueing unboundedly"""
+        self._ensure_started()
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise EngineBusy("The assistant is busy. Please try again in a moment.")
+            if self._pending_per_user.get(user_key, 0) >= self.max_pending_per_user:
+                self._counters["rejected"] += 1
+                raise EngineBusy("You already have several questions in progress. Please wait for them to finish.")
+            self._pending += 1
+            self._pending_per_user[user_key] = self._pending_per_user.get(user_key, 0) + 1
+            self._counters["submitted"] += 1
+        request = GenerationRequest(user_key, question, clauses)
+        self._loop.call_soon_threadsafe(self._enqueue, request)
+        return request
+
+    def generate(self, user_key, question, clauses):
+        """Submit a question and wait for the whole answer"""
+        request = self.submit(user_key, question, clauses)
+        try:
+            return request.future.result(timeout=self.queue_timeout + self.timeout)
+        except TimeoutError:
+            request.cancelled = True
+            raise EngineTimeout("The assistant took too long to answer.")
+
+    def iter_chunks(self, request):
+        """Yield a submitted request's answer chunks as they are generated"""
+        try:
+            while True:
+                item = request.chunks.get(timeout=self.queue_timeout + self.timeout)
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        except queue.Empty:
+            raise EngineTimeout("The assistant took too long to answer.")
+        finally:
+            if not request.future.done():
+                request.cancelled = True
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            pending = self._pending
+        batches = counters["batches"]
+        return {
+            "backend": self.backend.name if self.backend else None,
+            "backend_version": self.backend.version if self.backend else None,
+            "queue_depth": self._queued,
+            "pending": pending,
+            "users_waiting": len(self._queues),
+            "in_flight_batches": self._in_flight_batches,
+            "max_in_flight": self.max_in_flight,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": round(counters["batched_requests"] / batches, 2) if batches else 0,
+            "avg_queue_wait_ms": round(self._queue_wait_total / counters["batched_requests"] * 1000, 2) if counters["batched_requests"] else 0,
+            "avg_batch_ms": round(self._generation_total / batches * 1000, 2) if batches else 0,
+            **counters,
+        }
+
+    # -- event loop ---------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_loop, args=(ready,), name="ai-engine", daemon=True)
+                thread.start()
+                ready.wait()
+                self._thread = thread
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._has_work = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._loop.call_soon(ready.set)
+        self._loop.run_until_complete(self._dispatch())
+
+    def _enqueue(self, request):
+        self._queues.setdefault(request.user_key, deque()).append(request)
+        self._queued += 1
+        self._has_work.set()
+
+    def _release(self, request, outcome):
+        with self._lock:
+            self._pending -= 1
+            remaining = self._pending_per_user.get(request.user_key, 1) - 1
+            if remaining > 0:
+                self._pending_per_user[request.user_key] = remaining
+            else:
+                self._pending_per_user.pop(request.user_key, None)
+            self._counters[outcome] += 1
+
+    def _take_batch(self):
+        """Pop up to ``max_batch_size`` requests, one user at a time"""
+        batch = []
+        now = time.monotonic()
+        while self._queues and len(batch) < self.max_batch_size:
+            user_key, pending = next(iter(self._queues.items()))
+            request = pending.popleft()
+            self._queued -= 1
+            if pending:
+                self._queues.move_to_end(user_key)
+            else:
+                del self._queues[user_key]
+
+            if request.cancelled:
+                request.fail(EngineTimeout("Request was cancelled"))
+                self._release(request, "cancelled")
+            elif now - request.enqueued_at > self.queue_timeout:
+                request.fail(EngineTimeout("The assistant is busy. Please try again in a moment."))
+                self._release(request, "timeouts")
+            else:
+                batch.append(request)
+        if not self._queues:
+            self._has_work.clear()
+        return batch
+
+    async def _dispatch(self):
+        while True:
+            await self._has_work.wait()
+            await self._slots.acquire()
+            # Give concurrent requests a moment to join this batch
+            if self._queued < self.max_batch_size and self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            batch = self._take_batch()
+            if batch:
+                self._in_flight_batches += 1
+                self._loop.create_task(self._run_batch(batch))
+            else:
+                self._slots.release()
+
+    async def _run_batch(self, batch):
+        started = time.monotonic()
+        parts = [[] for _ in batch]
+
+        def emit(index, text):
+            parts[index].append(text)
+            batch[index].chunks.put(text)
+
+        try:
+            await asyncio.wait_for(
+                self.backend.generate_batch([(r.question, r.clauses) for r in batch], emit),
+                self.timeout,
+            )
+            for request, answer in zip(batch, parts):
+                request.finish("".join(answer))
+                self._release(request, "completed")
+        except asyncio.TimeoutError:
+            for request in batch:
+                request.fail(EngineTimeout("The assistant took too long to answer."))
+                self._release(request, "timeouts")
+        except Exception as e:
+            for request in batch:
+                request.fail(e)
+                self._release(request, "failed")
+        finally:
+            finished = time.monotonic()
+            with self._lock:
+                self._counters["batches"] += 1
+                self._counters["batched_requests"] += len(batch)
+                self._queue_wait_total += sum(started - r.enqueued_at for r in batch)
+                self._generation_total += finished - started
+            self._in_flight_batches -= 1
+            self._slots.release()
+
+
+response_engine = ResponseEngine()
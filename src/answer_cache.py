@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(question):
+    """Case, punctuation and spacing don't change the answer"""
+    return " ".join(TOKEN.findall(question.lower()))
+
+
+def make_key(content_hashes, question, *variant):
+    """Cache key for a question about a set of documents.
+
+    Documents are identified by content hash, so every user who uploaded the
+    same agreement shares entries. ``variant`` carries whatever else changes
+    the answer (backend version, retrieval mode).
+    """
+    parts = [",".join(sorted(content_hashes)), normalize_question(question), *map(str, variant)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """LRU + TTL cache of assistant answers with an optional SQLite tier.
+
+    Values are JSON-serializable dicts. The in-memory LRU is per process; the
+    SQLite file (``ANSWER_CACHE_PATH``) is shared by workers and survives
+    restarts.
+    """
+
+    PRUNE_EVERY = 500  # Disk writes between sweeps of expired rows
+
+    def __init__(self):
+        self.max_entries = 1024
+        self.ttl = 86400
+        self.path = None
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config["ANSWER_CACHE_SIZE"]
+        self.ttl = app.config["ANSWER_CACHE_TTL"]
+        self.path = app.config["ANSWER_CACHE_PATH"] or None
+        if self.path:
+            self._open_disk()
+        app.extensions["answer_cache"] = self
+
+    def _open_disk(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM answers WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._db.execute("DELETE FROM answers WHERE expires_at <= ?", (time.time(),))
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM answers")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk": bool(self._db),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+
+answer_cache = AnswerCache()
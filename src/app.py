@@ -1,18 +1,46 @@
 import os
+import json
 import time
-from datetime import datetime, timedelta
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
+import hashlib
+from collections import Counter
+
+PROCESS_STARTED = time.perf_counter()  # Boot timing baseline; see /healthz
+
+import tempfile
+from datetime import datetime
+from urllib.parse import quote
+from flask import Flask, Response, render_template, redirect, url_for, flash, request, jsonify, send_file, stream_with_context
 from flask_login import login_user, logout_user, current_user, login_required
 from flask_wtf import CSRFProtect
 from dotenv import load_dotenv
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import text
+from sqlalchemy import text, func, tuple_, select, delete
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 from extensions import db, login_manager, mail, limiter
-from models import User, Document, Chat, ChatMessage
+from models import User, Document, DocumentExtraction, DocumentPage, DocumentChunk, DocumentIndex, Chat, ChatMessage
 from forms import RegisterForm, LoginForm, ForgotPasswordForm, ResetPasswordForm, EmailOTPForm, ResendOTPForm
 from email_utils import generate_reset_token, verify_reset_token, send_password_reset
-from otp_utils import generate_otp, get_otp_expiry_time, send_email_otp, is_otp_expired
+from otp_utils import send_email_otp
+from upload_utils import UploadRequest
+from blob_store import BlobStore, acquire_blobs, release_blobs
+from extraction import extraction_service
+from retrieval import search_clauses, index_cache
+from embeddings import vector_store
+from ai_engine import response_engine, EngineBusy, EngineTimeout
+from answer_cache import answer_cache, make_key
+from pagination import encode_cursor, decode_cursor, page_size
+from db_health import db_monitor
+from password_hashing import password_hasher, HasherBusy
+from user_cache import user_cache
+from mail_outbox import mail_outbox
+from otp_store import otp_store, OTP_OK, OTP_EXPIRED, OTP_LOCKED
+from file_janitor import file_janitor
+from storage_ledger import storage_ledger, QuotaExceeded
+from upload_scanner import upload_scanner, record_file_state
+from resumable_uploads import resumable_uploads, UploadRejected
+from migrations import upgrade as upgrade_schema, schema_ready
+import rate_limit_storage  # Registers the sqlite:// rate limit storage scheme
 import phonenumbers
 
 load_dotenv()
@@ -44,23 +72,19 @@ def find_project_root():
 
 PROJECT_ROOT = find_project_root()
 UPLOAD_FOLDER = os.path.join(PROJECT_ROOT, 'uploads')  # Store in project root
+UPLOAD_STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, '.incoming')  # In-flight uploads, same filesystem for atomic renames
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')  # Content-addressed document store
+VECTOR_FOLDER = os.path.join(UPLOAD_FOLDER, '.vectors')  # Per-document clause embedding matrices
 ALLOWED_EXTENSIONS = {'pdf', 'docx', 'txt', 'rtf', 'md', 'odt', 'ppt', 'pptx'}
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_BULK_DELETE = 500  # Documents per /delete-documents call
+RETRIEVAL_TOP_K = 5  # Clauses retrieved per chat question
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_app():
-    app = Flask(__name__, 
-                template_folder='../templates',
-                static_folder='../static')
-
-    # Core config
-    app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-in-production")
-    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-    app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
-    
-    # Database configuration - EXCLUSIVELY use Neon PostgreSQL with connection pooling
+def configure_database(app):
+    """Point SQLAlchemy at ``DATABASE_URL``; exits when it is missing or not PostgreSQL"""
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         print("❌ ERROR: DATABASE_URL not found in .env file!")
@@ -134,6 +158,40 @@ def create_app():
     }
     
     print(f"🗄️  Database: {original_url.split('@')[1] if '@' in original_url else 'Connected'}")
+
+def create_app(test_config=None):
+    """Build the web app. Nothing here touches the database: connections open
+    on first use and schema setup is ``init_database`` (``scripts/migrate.py init``).
+
+    ``test_config`` replaces the PostgreSQL setup and overrides any setting,
+    so tests can run against SQLite in a temporary folder."""
+    boot_started = time.perf_counter()
+    app = Flask(__name__, 
+                template_folder='../templates',
+                static_folder='../static')
+    # Spool uploaded files straight into the staging folder while hashing them
+    app.request_class = UploadRequest
+
+    # Core config
+    app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-in-production")
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['UPLOAD_STAGING_FOLDER'] = UPLOAD_STAGING_FOLDER
+    app.config['BLOB_FOLDER'] = BLOB_FOLDER
+    app.config['VECTOR_FOLDER'] = VECTOR_FOLDER
+    app.config['RETRIEVAL_MODE'] = os.getenv("RETRIEVAL_MODE", "hybrid")  # bm25, vector or hybrid
+    app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+    # nginx ``internal`` location aliased to UPLOAD_FOLDER, e.g. /protected-uploads/; empty = serve files ourselves
+    app.config['DOWNLOAD_ACCEL_PREFIX'] = os.getenv("DOWNLOAD_ACCEL_PREFIX", "")
+    app.config['DOWNLOAD_MAX_AGE'] = int(os.getenv("DOWNLOAD_MAX_AGE", 3600))
+    app.config['BATCH_UPLOAD_MAX_FILES'] = int(os.getenv("BATCH_UPLOAD_MAX_FILES", 250))
+    # Per-file limits still apply; this caps the whole multi-file request body
+    app.config['ENDPOINT_BODY_LIMITS'] = {'upload_documents': int(float(os.getenv("BATCH_UPLOAD_MAX_MB", 500)) * 1024 * 1024)}
+    # Accounts allowed to run maintenance such as the orphan scan (comma separated)
+    app.config['OPERATOR_EMAILS'] = {email.strip().lower() for email in os.getenv("OPERATOR_EMAILS", "").split(",") if email.strip()}
+    
+    # Database configuration - EXCLUSIVELY use Neon PostgreSQL with connection pooling
+    if test_config is None:
+        configure_database(app)
     
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
@@ -149,18 +207,64 @@ def create_app():
     app.config["MAIL_TIMEOUT"] = 10  # 10 seconds timeout
     app.config["MAIL_USE_SSL"] = False
 
+    # AI backend configuration
+    app.config["AI_BACKEND"] = os.getenv("AI_BACKEND", "stub")
+    app.config["AI_STUB_CHUNK_DELAY"] = float(os.getenv("AI_STUB_CHUNK_DELAY", 0))  # Seconds between streamed chunks
+    app.config["AI_STUB_BATCH_LATENCY"] = float(os.getenv("AI_STUB_BATCH_LATENCY", 0))  # Simulated cost of one model call
+    app.config["AI_MAX_BATCH_SIZE"] = int(os.getenv("AI_MAX_BATCH_SIZE", 8))
+    app.config["AI_BATCH_WINDOW_MS"] = float(os.getenv("AI_BATCH_WINDOW_MS", 10))  # How long a batch waits to fill up
+    app.config["AI_MAX_IN_FLIGHT"] = int(os.getenv("AI_MAX_IN_FLIGHT", 4))  # Concurrent batches per backend
+    app.config["AI_TIMEOUT"] = float(os.getenv("AI_TIMEOUT", 60))
+    app.config["AI_QUEUE_TIMEOUT"] = float(os.getenv("AI_QUEUE_TIMEOUT", 30))
+    app.config["AI_MAX_QUEUE"] = int(os.getenv("AI_MAX_QUEUE", 256))
+    app.config["AI_MAX_PENDING_PER_USER"] = int(os.getenv("AI_MAX_PENDING_PER_USER", 4))
+    app.config["ANSWER_CACHE_SIZE"] = int(os.getenv("ANSWER_CACHE_SIZE", 1024))
+    app.config["ANSWER_CACHE_TTL"] = int(os.getenv("ANSWER_CACHE_TTL", 86400))  # Seconds
+    app.config["ANSWER_CACHE_PATH"] = os.getenv("ANSWER_CACHE_PATH", "")  # SQLite file for a persistent tier; empty = memory only
+
+    # Rate limiting: one moving window per key, shared by every worker on this host
+    app.config["RATELIMIT_STORAGE_URI"] = os.getenv(
+        "RATELIMIT_STORAGE_URI", "sqlite:///" + os.path.join(tempfile.gettempdir(), "clauseease-ratelimit.db")
+    )
+    app.config["RATELIMIT_STRATEGY"] = os.getenv("RATELIMIT_STRATEGY", "moving-window")
+    if app.config["RATELIMIT_STORAGE_URI"].startswith("sqlite:"):
+        app.config["RATELIMIT_STORAGE_OPTIONS"] = {
+            "lease_seconds": float(os.getenv("RATELIMIT_LEASE_SECONDS", 1)),  # How long a worker may hand out reserved hits
+            "lease_ratio": float(os.getenv("RATELIMIT_LEASE_RATIO", 0.5)),  # Only reserve while under this share of the limit
+        }
+
     # OTP configuration - using custom email and SMS verification
 
+    if test_config is not None:
+        app.config.update(test_config)
+
     # Init extensions
     db.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
     limiter.init_app(app)
+    extraction_service.init_app(app)
+    vector_store.init_app(app)
+    response_engine.init_app(app)
+    answer_cache.init_app(app)
+    db_monitor.init_app(app)
+    password_hasher.init_app(app)
+    user_cache.init_app(app)
+    mail_outbox.init_app(app)
+    otp_store.init_app(app)
+    file_janitor.init_app(app)
+    storage_ledger.init_app(app)
+    upload_scanner.init_app(app)
+    resumable_uploads.init_app(app)
     CSRFProtect(app)
 
     # Create upload folder if it doesn't exist
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    print(f"📁 Upload folder: {UPLOAD_FOLDER}")
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['BLOB_FOLDER'], exist_ok=True)
+    print(f"📁 Upload folder: {app.config['UPLOAD_FOLDER']}")
+    
+    blob_store = BlobStore(app.config['BLOB_FOLDER'], app.config['UPLOAD_STAGING_FOLDER'])
 
     # Define database helper functions first
     def test_database_connection():
@@ -173,25 +277,6 @@ def create_app():
         except Exception as e:
             return False, str(e)
     
-    def wait_for_database(max_attempts=5, delay=2):
-        """Wait for database to become available"""
-        for attempt in range(max_attempts):
-            try:
-                print(f"🔄 Database connection attempt {attempt + 1}/{max_attempts}")
-                db.session.execute(text("SELECT 1"))
-                db.session.commit()
-                print("✅ Database connection successful")
-                return True
-            except Exception as e:
-                print(f"❌ Attempt {attempt + 1} failed: {str(e)[:100]}")
-                if attempt < max_attempts - 1:
-                    print(f"⏳ Waiting {delay} seconds before retry...")
-                    time.sleep(delay)
-                else:
-                    print("❌ All database connection attempts failed")
-                    return False
-        return False
-
     def recover_database_connection():
         """Attempt to recover database connection"""
         try:
@@ -206,62 +291,27 @@ def create_app():
         except Exception as e:
             return False
 
-    # Initialize database tables
-    with app.app_context():
-        try:
-            # Wait a moment for database engine to fully initialize
-            time.sleep(1)
-            
-            # Test connection with retry mechanism
-            print("🔍 Testing database connection...")
-            if not wait_for_database(max_attempts=5, delay=2):
-                raise Exception("Database connection failed after multiple attempts")
-            
-            # Create all tables
-            print("🔨 Creating database tables...")
-            db.create_all()
-            print("✅ Database tables created")
-            
-            # Final connection test
-            db.session.execute(text("SELECT 1"))
-            db.session.commit()
-            print("✅ Database fully connected and ready")
-            
-        except Exception as e:
-            error_msg = str(e)
-            print(f"❌ Database connection failed")
-            print(f"   🔍 Error details: {error_msg}")
-            
-            # Provide specific error guidance
-            if "authentication failed" in error_msg.lower():
-                print("   🔧 Issue: Authentication failed - check username/password")
-            elif "connection refused" in error_msg.lower():
-                print("   🔧 Issue: Connection refused - check if database is running")
-            elif "ssl" in error_msg.lower():
-                print("   🔧 Issue: SSL connection problem - check network")
-            elif "timeout" in error_msg.lower():
-                print("   🔧 Issue: Connection timeout - check internet")
-            elif "database" in error_msg.lower() and "does not exist" in error_msg.lower():
-                print("   🔧 Issue: Database doesn't exist - check database name")
-            elif "psycopg2" in error_msg.lower():
-                print("   🔧 Issue: psycopg2 driver not installed")
-                print("   💡 Install with: pip install psycopg2-binary")
-            elif "no module named" in error_msg.lower():
-                print("   🔧 Issue: Missing Python module")
-                print("   💡 Install with: pip install -r requirements.txt")
-            else:
-                print(f"   🔧 Unknown error: {error_msg[:100]}...")
-            
-            print("💡 Check your DATABASE_URL in .env file")
-            print("💡 Ensure your Neon database is running and accessible")
-            print("💡 Run: python test_database.py for detailed diagnostics")
-        
-        print("🚀 App ready!")
+    boot = app.extensions["boot"] = {
+        "create_app_ms": None,
+        "first_request_ms": None,  # Since the app module was imported
+    }
+    schema_state = {"ready": False}  # Cached once true; schema only moves forward
+
+    @app.before_request
+    def record_first_request():
+        if boot["first_request_ms"] is None:
+            boot["first_request_ms"] = round((time.perf_counter() - PROCESS_STARTED) * 1000, 1)
+            print(f"⚡ First request {boot['first_request_ms']} ms after startup")
 
     @login_manager.user_loader
     def load_user(user_email):
+        # Sessions get a cached read-only snapshot; routes that modify a user load the model
+        snapshot = user_cache.get(user_email)
+        if snapshot is not None:
+            return snapshot
         try:
-            return db.session.get(User, user_email)
+            user = db.session.get(User, user_email)
+            return user_cache.put(user) if user else None
         except Exception as e:
             print(f"❌ Database error in user loader: {e}")
             # Try to refresh the connection
@@ -269,7 +319,8 @@ def create_app():
                 db.session.rollback()
                 db.session.close()
                 db.session.execute(text("SELECT 1"))  # Test connection
-                return db.session.get(User, user_email)
+                user = db.session.get(User, user_email)
+                return user_cache.put(user) if user else None
             except:
                 print(f"❌ Failed to recover database connection in user loader")
                 return None
@@ -277,8 +328,11 @@ def create_app():
     @app.errorhandler(Exception)
     def handle_exception(e):
         """Global exception handler for database and other errors"""
+        if isinstance(e, HTTPException):
+            return e  # 404s, 429s from the rate limiter etc. keep their status
         if "SSL connection has been closed unexpectedly" in str(e) or "connection" in str(e).lower():
             print(f"🚨 Database connection error detected: {e}")
+            db_monitor.record_failure(e)
             print("🔄 Attempting to refresh database connection...")
             
             try:
@@ -297,17 +351,10 @@ def create_app():
     @app.route("/", methods=["GET", "POST"])
     def index():
         """Root route - always show login page first, regardless of authentication"""
-        # Test database connection before proceeding
-        db_connected, db_message = test_database_connection()
-        if not db_connected:
-            print(f"❌ Database not connected: {db_message}")
-            # Try to recover connection
-            if recover_database_connection():
-                print("✅ Database connection recovered, proceeding...")
-            else:
-                print("❌ Database connection recovery failed")
-                flash("Database connection error. Please check your internet connection and try again.", "error")
-                return render_template("login.html", form=LoginForm())
+        # Cached by the background health monitor - no database round trip here
+        if not db_monitor.available():
+            flash("Database connection error. Please check your internet connection and try again.", "error")
+            return render_template("login.html", form=LoginForm())
         
         # If user is already authenticated, redirect to home
         if current_user.is_authenticated:
@@ -340,6 +387,7 @@ def create_app():
                     
                 except Exception as db_error:
                     print(f"❌ Database connection error (attempt {attempt + 1}/{max_retries}): {db_error}")
+                    db_monitor.record_failure(db_error)
                     if attempt < max_retries - 1:
                         print(f"🔄 Retrying database connection...")
                         if recover_database_connection():
@@ -357,10 +405,25 @@ def create_app():
                 return redirect(url_for("register"))
             
             # Flow 2: User exists but wrong password
-            if not user.check_password(form.password.data):
+            try:
+                password_ok = user.check_password(form.password.data)
+            except HasherBusy as e:
+                flash(str(e), "error")
+                return render_template("login.html", form=form), 503
+            if not password_ok:
                 flash("Invalid password. Please try again.", "error")
                 return render_template("login.html", form=form)
             
+            # Upgrade hashes made with older cost parameters while we have the password
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                    password_hasher.record_rehash()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ Password rehash skipped for {user.email}: {e}")
+            
             # Flow 3: User exists, password correct, but not verified - redirect to verification
             if not user.email_verified:
                 print(f"🔐 UNVERIFIED USER LOGIN ATTEMPT:")
@@ -368,12 +431,8 @@ def create_app():
                 print(f"   📧 Email Verified: {user.email_verified}")
                 
                 # Generate new OTP for unverified user
-                verification_otp = generate_otp()
-                user.email_otp = verification_otp
-                user.email_otp_expires = datetime.utcnow() + timedelta(minutes=10)
-                
                 try:
-                    db.session.commit()
+                    verification_otp, otp_expires = otp_store.issue(user.email)
                 except Exception as commit_error:
                     print(f"❌ Error committing OTP: {commit_error}")
                     db.session.rollback()
@@ -386,7 +445,7 @@ def create_app():
                 print("🚨" * 20)
                 print(f"📧 Email: {user.email}")
                 print(f"🔐 OTP Code: {verification_otp}")
-                print(f"⏰ Expires: {user.email_otp_expires}")
+                print(f"⏰ Expires: {otp_expires}")
                 print("🚨" * 20)
                 
                 # Try to send email OTP
@@ -446,7 +505,11 @@ def create_app():
             user.phone = form.country_code.data + form.phone.data
             user.gender = form.gender.data
             user.date_of_birth = datetime.strptime(form.date_of_birth.data, '%Y-%m-%d').date()
-            user.set_password(form.password.data)
+            try:
+                user.set_password(form.password.data)
+            except HasherBusy as e:
+                flash(str(e), "error")
+                return render_template("register.html", form=form), 503
             
             print(f"📱 COMBINED PHONE: {user.phone}")
             print(f"📧 USER EMAIL: {user.email}")
@@ -470,15 +533,11 @@ def create_app():
                 return render_template("register.html", form=form)
             
             try:
-                # Auto-generate OTP for immediate verification
-                email_otp = generate_otp()
-                user.email_otp = email_otp
-                user.email_otp_expires = get_otp_expiry_time()
-                
-                # Save the user to database with OTP
+                # Save the user, then issue an OTP for immediate verification
                 db.session.add(user)
                 db.session.commit()
                 print(f"✅ User saved to database with email: {user.email}")
+                email_otp, otp_expires = otp_store.issue(user.email)
                 
                 # Show OTP in terminal prominently
                 print("\n" + "🚨" * 30)
@@ -487,7 +546,7 @@ def create_app():
                 print("🚨" * 30)
                 print(f"📧 Email: {user.email}")
                 print(f"🔐 OTP Code: {email_otp}")
-                print(f"⏰ Expires: {user.email_otp_expires}")
+                print(f"⏰ Expires: {otp_expires}")
                 print("🚨" * 30)
                 print("🚨🚨🚨 COPY THIS OTP TO VERIFY ACCOUNT 🚨🚨🚨")
                 print("🚨" * 30 + "\n")
@@ -594,13 +653,17 @@ def create_app():
         
         form = ResetPasswordForm()
         if form.validate_on_submit():
-            # Check if new password is the same as current password
-            if user.is_same_password(form.password.data):
-                flash("❌ Your new password cannot be the same as your current password! Please choose a different password.", "error")
-                return render_template("reset_password.html", form=form)
-            
-            # Set new password if it's different
-            user.set_password(form.password.data)
+            try:
+                # Check if new password is the same as current password
+                if user.is_same_password(form.password.data):
+                    flash("❌ Your new password cannot be the same as your current password! Please choose a different password.", "error")
+                    return render_template("reset_password.html", form=form)
+                
+                # Set new password if it's different
+                user.set_password(form.password.data)
+            except HasherBusy as e:
+                flash(str(e), "error")
+                return render_template("reset_password.html", form=form), 503
             db.session.commit()
             flash("✅ Password updated successfully! Please log in.", "success")
             return redirect(url_for("index"))
@@ -615,8 +678,6 @@ def create_app():
         print(f"\n🔍 VERIFICATION PAGE LOADED:")
         print(f"📧 User Email: {user.email}")
         print(f"📧 Email Verified: {user.email_verified}")
-        print(f"📧 Has OTP: {user.email_otp is not None}")
-        print(f"📧 OTP Value: {user.email_otp}")
         
         # Check if user is already verified
         if user.email_verified:
@@ -626,6 +687,10 @@ def create_app():
         email_form = EmailOTPForm()
         resend_form = ResendOTPForm()
         
+        def render_verify():
+            return render_template("verify_account.html", user=user, has_otp=otp_store.has_active(user.email),
+                                   email_form=email_form, resend_form=resend_form)
+        
         if request.method == "POST":
             print(f"\n🔍 POST REQUEST RECEIVED:")
             print(f"   Form data: {dict(request.form)}")
@@ -637,32 +702,24 @@ def create_app():
                 print(f"🔍 OTP VERIFICATION ATTEMPT:")
                 print(f"   📧 User: {user.email}")
                 print(f"   🔑 Submitted OTP: '{submitted_otp}'")
-                print(f"   🔑 Stored OTP: '{user.email_otp}'")
-                print(f"   ⏰ OTP Expires: {user.email_otp_expires}")
-                print(f"   ⏰ Current Time: {datetime.utcnow()}")
                 
-                # Check if OTP exists and is not expired
-                if not user.email_otp:
-                    flash("No OTP found. Please request a new one.", "error")
-                    return render_template("verify_account.html", user=user, email_form=email_form, resend_form=resend_form)
-                
-                if user.email_otp_expires and datetime.utcnow() > user.email_otp_expires:
-                    flash("OTP has expired. Please request a new one.", "error")
-                    return render_template("verify_account.html", user=user, email_form=email_form, resend_form=resend_form)
-                
-                # Verify OTP
-                if submitted_otp == user.email_otp:
+                # Verify OTP (counts the attempt; a correct code is consumed)
+                result = otp_store.verify(user.email, submitted_otp)
+                if result == OTP_OK:
                     print(f"✅ OTP VERIFICATION SUCCESSFUL!")
                     user.email_verified = True
-                    user.email_otp = None
-                    user.email_otp_expires = None
                     db.session.commit()
                     flash("Account verified successfully! You can now log in.", "success")
                     return redirect(url_for("login"))
+                
+                print(f"❌ OTP VERIFICATION FAILED: {result}")
+                if result == OTP_LOCKED:
+                    flash("Too many incorrect attempts. Please request a new OTP.", "error")
+                elif result == OTP_EXPIRED:
+                    flash("OTP has expired. Please request a new one.", "error")
                 else:
-                    print(f"❌ OTP VERIFICATION FAILED!")
                     flash("Invalid OTP. Please try again.", "error")
-                    return render_template("verify_account.html", user=user, email_form=email_form, resend_form=resend_form)
+                return render_verify()
             
             # Handle resend OTP
             elif request.form.get('submit') == 'resend':
@@ -670,10 +727,7 @@ def create_app():
                 print(f"   📧 User: {user.email}")
                 
                 # Generate new OTP
-                new_otp = generate_otp()
-                user.email_otp = new_otp
-                user.email_otp_expires = datetime.utcnow() + timedelta(minutes=10)
-                db.session.commit()
+                new_otp, _ = otp_store.issue(user.email)
                 
                 # Send new OTP
                 try:
@@ -688,9 +742,9 @@ def create_app():
                     print(f"❌ New OTP email error: {e}")
                     flash(f"New OTP: {new_otp} (Email delivery failed)", "warning")
                 
-                return render_template("verify_account.html", user=user, email_form=email_form, resend_form=resend_form)
+                return render_verify()
         
-        return render_template("verify_account.html", user=user, email_form=email_form, resend_form=resend_form)
+        return render_verify()
 
 
 
@@ -698,6 +752,84 @@ def create_app():
 
 
     
+    def register_uploads(user_email, uploads):
+        """Add documents, their first chats and extraction jobs for staged files.
+
+        ``uploads`` is a list of ``(filename, file_type, staged)`` where
+        ``staged`` is a hashed ``StoredFile`` in the staging folder.
+        Everything is inserted in one transaction with bulk statements; the
+        storage ledger is charged once for the batch (raising
+        ``QuotaExceeded``). Blob references are taken before the staged files
+        are moved into the blob store, so the file janitor can't remove a
+        blob between the two. On any failure, staged files are discarded and
+        blobs these uploads wrote are queued for the janitor. Returns
+        ``[(document, chat, stored)]`` in input order.
+        """
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        placed = []
+        try:
+            storage_ledger.charge(user_email, sum(staged.size for _, _, staged in uploads), count=len(uploads))
+            acquire_blobs([staged for _, _, staged in uploads])
+            for _, _, staged in uploads:
+                placed.append(blob_store.adopt(*staged))
+            created = {stored.sha256 for stored, is_new in placed if is_new}
+            if created:
+                # Writing a blob also restores documents whose copy had gone missing
+                record_file_state(Document.content_hash.in_(created), True)
+            
+            documents = [
+                Document(
+                    user_email=user_email,
+                    filename=f"{timestamp}_{filename}",
+                    original_filename=filename,
+                    file_path=stored.path,
+                    file_size=stored.size,
+                    file_type=file_type,
+                    content_hash=stored.sha256,
+                    file_checked_at=datetime.utcnow()
+                )
+                for (filename, file_type, _), (stored, _) in zip(uploads, placed)
+            ]
+            db.session.add_all(documents)
+            db.session.flush()  # One batched INSERT assigns the ids for the chats below
+            
+            # Create a new chat for each document
+            chats = [
+                Chat(user_email=user_email, document_id=document.id, title=f"Chat about {document.original_filename}")
+                for document in documents
+            ]
+            db.session.add_all(chats)
+            db.session.add_all([DocumentExtraction(document_id=document.id) for document in documents])
+            
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for _, _, staged in uploads[len(placed):]:
+                blob_store.discard(staged.path)
+            created = {stored.sha256 for stored, is_new in placed if is_new}
+            if created:
+                # The references were rolled back; the janitor removes the files unless re-acquired
+                for digest in created:
+                    file_janitor.schedule_blob(digest)
+                db.session.commit()
+                file_janitor.wake()
+            raise
+        
+        # Text extraction runs in the background once the rows are committed
+        extraction_service.submit_many([
+            (document.id, document.file_path, document.original_filename.rsplit('.', 1)[1].lower())
+            for document in documents
+        ])
+        return [(document, chat, stored) for document, chat, (stored, _) in zip(documents, chats, placed)]
+
+    def quota_exceeded_response(e):
+        return jsonify({
+            'error': 'Storage quota exceeded. Delete some documents and try again.',
+            'quota_bytes': e.quota,
+            'used_bytes': e.used,
+            'file_size': e.size
+        }), 413
+
     @app.route("/upload-document", methods=["POST"])
     @login_required
     def upload_document():
@@ -715,172 +847,219 @@ def create_app():
                 'accepted_formats': list(ALLOWED_EXTENSIONS)
             }), 400
         
+        user_email = current_user.email
+        filename = secure_filename(file.filename)
+        
         try:
-            # Create user-specific directory
-            user_email = current_user.email
-            user_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-            
-            print(f"📁 ATTEMPTING TO CREATE USER DIRECTORY:")
-            print(f"   📧 User: {user_email}")
-            print(f"   📂 Base Upload Folder: {app.config['UPLOAD_FOLDER']}")
-            print(f"   📂 User Directory: {user_dir}")
-            print(f"   📂 Base folder exists: {os.path.exists(app.config['UPLOAD_FOLDER'])}")
+            # Identical content is stored once; a re-upload only adds a reference
+            staged = blob_store.stage(file)
+            [(document, chat, stored)] = register_uploads(user_email, [(filename, file.content_type, staged)])
             
-            # Ensure base upload folder exists
-            if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                print(f"⚠️ Base upload folder doesn't exist, creating it...")
-                os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-                print(f"✅ Base upload folder created: {os.path.exists(app.config['UPLOAD_FOLDER'])}")
+            return jsonify({
+                'success': True,
+                'document_id': document.id,
+                'chat_id': chat.id,
+                'filename': filename,
+                'file_size': stored.size,
+                'sha256': stored.sha256
+            })
             
-            # Create user directory
-            try:
-                os.makedirs(user_dir, exist_ok=True)
-                print(f"✅ User directory creation attempted")
-            except Exception as dir_error:
-                print(f"❌ Error creating user directory: {dir_error}")
-                raise Exception(f"Failed to create user directory: {dir_error}")
-            
-            # Verify directory was created
-            if not os.path.exists(user_dir):
-                print(f"❌ User directory still doesn't exist after creation attempt")
-                raise Exception("User directory creation failed")
-            
-            print(f"📁 USER DIRECTORY CREATED SUCCESSFULLY:")
-            print(f"   📂 Directory: {user_dir}")
-            print(f"   ✅ Directory exists: {os.path.exists(user_dir)}")
-            print(f"   📂 Directory is writable: {os.access(user_dir, os.W_OK)}")
-            print(f"   📂 Directory contents: {os.listdir(user_dir) if os.path.exists(user_dir) else 'N/A'}")
-            
-            # Secure filename and save file
+        except QuotaExceeded as e:
+            return quota_exceeded_response(e)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Upload failed for {user_email}: {e}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route("/upload-documents", methods=["POST"])
+    @login_required
+    def upload_documents():
+        """Upload many files in one request; every part is a ``files`` field.
+
+        Parts are spooled to disk while the body is parsed. Accepted files are
+        added in one transaction and queued for extraction together; the
+        response has a result per file, in the order they were sent.
+        """
+        files = [f for f in request.files.getlist('files') if f.filename]
+        if not files:
+            return jsonify({'error': 'No files provided'}), 400
+        if len(files) > app.config['BATCH_UPLOAD_MAX_FILES']:
+            return jsonify({'error': f"At most {app.config['BATCH_UPLOAD_MAX_FILES']} files per batch"}), 400
+        
+        user_email = current_user.email
+        results = [{'filename': f.filename} for f in files]  # As sent, so clients can match them up
+        remaining = storage_ledger.usage(user_email)['remaining_bytes']
+        uploads, accepted = [], []
+        for result, file in zip(results, files):
             filename = secure_filename(file.filename)
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(user_dir, unique_filename)
-            
-            print(f"📄 ATTEMPTING TO SAVE FILE:")
-            print(f"   📁 User Dir: {user_dir}")
-            print(f"   📄 Original Name: {filename}")
-            print(f"   🔐 Stored Name: {unique_filename}")
-            print(f"   📍 Full Path: {file_path}")
-            print(f"   📂 Target directory writable: {os.access(user_dir, os.W_OK)}")
-            print(f"   📂 Current working directory: {os.getcwd()}")
-            print(f"   📂 File object type: {type(file)}")
-            
-            # Save file with multiple attempts
-            file_saved = False
-            save_errors = []
-            
-            # Method 1: Direct save
+            if not filename or not allowed_file(filename):
+                result.update(status='rejected', error='File type not allowed')
+                continue
+            size = getattr(file.stream, 'size', None)
+            if size is not None and size > MAX_FILE_SIZE:
+                result.update(status='rejected', error=f'File too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB')
+                continue
+            if remaining is not None and size is not None:
+                if size > remaining:
+                    result.update(status='rejected', error='Storage quota exceeded')
+                    continue
+                remaining -= size
             try:
-                print(f"🔄 Attempting direct file save...")
-                file.save(file_path)
-                print(f"✅ Direct file save successful")
-                file_saved = True
-            except Exception as save_error:
-                error_msg = f"Direct save failed: {save_error}"
-                print(f"❌ {error_msg}")
-                save_errors.append(error_msg)
-            
-            # Method 2: Copy file content if direct save failed
-            if not file_saved:
-                try:
-                    print(f"🔄 Attempting file copy method...")
-                    file.seek(0)  # Reset file pointer
-                    with open(file_path, 'wb') as f:
-                        f.write(file.read())
-                    print(f"✅ File copy method successful")
-                    file_saved = True
-                except Exception as copy_error:
-                    error_msg = f"File copy failed: {copy_error}"
-                    print(f"❌ {error_msg}")
-                    save_errors.append(error_msg)
-            
-            # Method 3: Stream copy if other methods failed
-            if not file_saved:
-                try:
-                    print(f"🔄 Attempting stream copy method...")
-                    file.seek(0)  # Reset file pointer
-                    with open(file_path, 'wb') as f:
-                        chunk = file.read(8192)  # 8KB chunks
-                        while chunk:
-                            f.write(chunk)
-                            chunk = file.read(8192)
-                    print(f"✅ Stream copy method successful")
-                    file_saved = True
-                except Exception as stream_error:
-                    error_msg = f"Stream copy failed: {stream_error}"
-                    print(f"❌ {error_msg}")
-                    save_errors.append(error_msg)
-            
-            if not file_saved:
-                print(f"❌ ALL FILE SAVE METHODS FAILED:")
-                for error in save_errors:
-                    print(f"   ❌ {error}")
-                raise Exception(f"All file save methods failed: {'; '.join(save_errors)}")
-            
-            # Verify file was saved
-            if not os.path.exists(file_path):
-                print(f"❌ File doesn't exist after save operation")
-                raise Exception("File save operation failed")
-            
-            # Get file size
+                staged = blob_store.stage(file)
+            except OSError as e:
+                app.logger.error(f"Storing {filename} failed for {user_email}: {e}")
+                result.update(status='failed', error='Could not store file')
+                continue
+            uploads.append((filename, file.content_type, staged))
+            accepted.append(result)
+        
+        if uploads:
             try:
-                file_size = os.path.getsize(file_path)
-                print(f"✅ File size retrieved: {file_size} bytes")
-            except Exception as size_error:
-                print(f"❌ Error getting file size: {size_error}")
-                file_size = 0
-            
-            print(f"📄 FILE SAVED SUCCESSFULLY:")
-            print(f"   📁 User Dir: {user_dir}")
-            print(f"   📄 Original Name: {filename}")
-            print(f"   🔐 Stored Name: {unique_filename}")
-            print(f"   📍 Full Path: {file_path}")
-            print(f"   ✅ File exists: {os.path.exists(file_path)}")
-            print(f"   📏 File size: {file_size} bytes")
-            print(f"   📂 Directory contents after save: {os.listdir(user_dir)}")
-            
-            # Save document to database
-            document = Document(
-                user_email=current_user.email,
-                filename=unique_filename,
-                original_filename=filename,
-                file_path=file_path,
-                file_size=os.path.getsize(file_path),
-                file_type=file.content_type
+                for result, (document, chat, stored) in zip(accepted, register_uploads(user_email, uploads)):
+                    result.update(status='uploaded', document_id=document.id, chat_id=chat.id,
+                                  file_size=stored.size, sha256=stored.sha256)
+            except QuotaExceeded as e:
+                return quota_exceeded_response(e)  # Another upload took the space meanwhile
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Batch upload failed for {user_email}: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        uploaded = sum(1 for result in results if result['status'] == 'uploaded')
+        return jsonify({
+            'success': uploaded > 0,
+            'uploaded': uploaded,
+            'rejected': len(results) - uploaded,
+            'results': results
+        }), 200 if uploaded else 400
+
+    def upload_session_json(session):
+        return {
+            'upload_id': session.id,
+            'filename': session.filename,
+            'file_size': session.total_size,
+            'chunk_size': session.chunk_size,
+            'chunk_count': session.chunk_count,
+            'received_chunks': resumable_uploads.received(session),
+            'expires_at': session.expires_at.isoformat()
+        }
+
+    @app.route("/upload-sessions", methods=["POST"])
+    @login_required
+    def create_upload_session():
+        """Start a resumable upload: {"filename", "size", "file_type"?, "sha256"?, "chunk_size"?}"""
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename') or '')
+        if not filename or not allowed_file(filename):
+            return jsonify({
+                'error': f"File type not allowed. Accepted formats: {', '.join(ALLOWED_EXTENSIONS)}",
+                'accepted_formats': list(ALLOWED_EXTENSIONS)
+            }), 400
+        size = data.get('size')
+        
+        try:
+            # Fail early rather than after the last chunk; the final charge still enforces it
+            usage = storage_ledger.usage(current_user.email)
+            if usage['remaining_bytes'] is not None and isinstance(size, int) and size > usage['remaining_bytes']:
+                raise QuotaExceeded(usage['bytes_used'], usage['quota_bytes'], size)
+            session = resumable_uploads.create(
+                current_user.email, filename,
+                (data.get('file_type') or 'application/octet-stream')[:50],
+                size, sha256=data.get('sha256'), chunk_size=data.get('chunk_size')
             )
-            db.session.add(document)
+            return jsonify({'success': True, **upload_session_json(session)}), 201
             
-            # Create a new chat for this document
-            chat = Chat(
-                user_email=current_user.email,
-                document_id=document.id,
-                title=f"Chat about {filename}"
-            )
-            db.session.add(chat)
+        except QuotaExceeded as e:
+            return quota_exceeded_response(e)
+        except UploadRejected as e:
+            return jsonify({'error': str(e)}), e.status
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @app.route("/upload-sessions/<upload_id>", methods=["GET"])
+    @login_required
+    def get_upload_session(upload_id):
+        """Which chunks the server already has, so a client can resume"""
+        session = resumable_uploads.get(upload_id, current_user.email)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        return jsonify({'success': True, **upload_session_json(session)})
+
+    @app.route("/upload-sessions/<upload_id>/chunks/<int:index>", methods=["PUT"])
+    @login_required
+    def put_upload_chunk(upload_id, index):
+        """Store one chunk; the raw body is the chunk, X-Chunk-SHA256 its checksum"""
+        session = resumable_uploads.get(upload_id, current_user.email)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        
+        try:
+            resumable_uploads.write_chunk(session, index, request.stream, request.headers.get('X-Chunk-SHA256', '').lower())
+            return jsonify({'success': True, 'index': index, 'expires_at': session.expires_at.isoformat()})
             
-            db.session.commit()
+        except UploadRejected as e:
+            return jsonify({'error': str(e)}), e.status
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @app.route("/upload-sessions/<upload_id>/complete", methods=["POST"])
+    @login_required
+    def complete_upload_session(upload_id):
+        """Turn a fully received upload into a document"""
+        session = resumable_uploads.get(upload_id, current_user.email)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        user_email, filename, file_type = session.user_email, session.filename, session.file_type
+        
+        try:
+            assembled = resumable_uploads.assemble(session)
+        except UploadRejected as e:
+            db.session.rollback()
+            if e.status == 422:
+                resumable_uploads.cancel(session)  # The file is wrong as a whole; start again
+            return jsonify({'error': str(e)}), e.status
+        
+        try:
+            # The part file is renamed into the blob store, not copied
+            resumable_uploads.finish(session)
+            [(document, chat, stored)] = register_uploads(user_email, [(filename, file_type, assembled)])
             
             return jsonify({
                 'success': True,
                 'document_id': document.id,
                 'chat_id': chat.id,
-                'filename': filename
+                'filename': filename,
+                'file_size': stored.size,
+                'sha256': stored.sha256
             })
             
         except Exception as e:
+            # The part file has been moved into the blob store or discarded, so the session can't be retried
             db.session.rollback()
-            # Clean up uploaded file if database save fails
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            resumable_uploads.cancel(session)
+            if isinstance(e, QuotaExceeded):
+                return quota_exceeded_response(e)
+            app.logger.error(f"Completing upload {upload_id} failed for {user_email}: {e}")
             return jsonify({'error': str(e)}), 500
 
+    @app.route("/upload-sessions/<upload_id>", methods=["DELETE"])
+    @login_required
+    def cancel_upload_session(upload_id):
+        session = resumable_uploads.get(upload_id, current_user.email)
+        if not session:
+            return jsonify({'error': 'Upload session not found'}), 404
+        resumable_uploads.cancel(session)
+        return jsonify({'success': True, 'message': 'Upload cancelled'})
+
     @app.route("/accepted-file-types", methods=["GET"])
     def accepted_file_types():
         """Get the list of accepted file types for uploads"""
         return jsonify({
             'accepted_formats': list(ALLOWED_EXTENSIONS),
             'max_file_size_mb': MAX_FILE_SIZE // (1024 * 1024),
+            'max_resumable_file_size_mb': app.config['RESUMABLE_MAX_FILE_SIZE'] // (1024 * 1024),  # Via /upload-sessions
             'file_types_description': {
                 'pdf': 'Portable Document Format',
                 'docx': 'Microsoft Word Document',
@@ -894,15 +1073,28 @@ def create_app():
     @app.route("/user-documents", methods=["GET"])
     @login_required
     def get_user_documents():
-        """Get all documents for the current user"""
+        """Get all documents for the current user.
+
+        ``file_exists`` is the state last verified by the upload scanner, not a
+        stat per document. The ETag follows the user's documents version, so a
+        repeat listing with If-None-Match is answered with a 304.
+        """
         try:
-            documents = Document.query.filter_by(user_email=current_user.email).order_by(Document.uploaded_at.desc()).all()
+            user_email = current_user.email
+            version = storage_ledger.documents_version(user_email)
+            etag = None
+            if version is not None:
+                etag = hashlib.sha256(f"{user_email}:{version}".encode()).hexdigest()[:32]
+                if request.if_none_match.contains(etag):
+                    response = app.response_class(status=304)
+                    response.set_etag(etag)
+                    response.headers['Cache-Control'] = 'private, no-cache'
+                    return response
+            
+            documents = Document.query.filter_by(user_email=user_email).order_by(Document.uploaded_at.desc()).all()
             
             docs_list = []
             for doc in documents:
-                # Check if file still exists on disk
-                file_exists = os.path.exists(doc.file_path)
-                
                 docs_list.append({
                     'id': doc.id,
                     'filename': doc.original_filename,
@@ -910,43 +1102,111 @@ def create_app():
                     'file_size': doc.file_size,
                     'file_type': doc.file_type,
                     'uploaded_at': doc.uploaded_at.isoformat(),
-                    'file_exists': file_exists,
+                    'file_exists': doc.file_exists,
                     'file_path': doc.file_path
                 })
             
-            return jsonify({
+            response = jsonify({
                 'success': True,
                 'documents': docs_list,
                 'total_count': len(docs_list)
             })
+            if etag is not None:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @app.route("/download-document/<int:document_id>", methods=["GET"])
+    @login_required
+    def download_document(document_id):
+        """Serve a document's file with Range and conditional GET support.
+
+        Files are handed to the server as a file object, so gunicorn can
+        sendfile() whole-file responses. With ``DOWNLOAD_ACCEL_PREFIX`` set,
+        nginx serves the file instead via X-Accel-Redirect. Add ``?download=1``
+        for an attachment rather than inline display.
+        """
+        document = Document.query.filter_by(id=document_id, user_email=current_user.email).first()
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        as_attachment = request.args.get('download') == '1'
+        
+        accel_prefix = app.config['DOWNLOAD_ACCEL_PREFIX']
+        if accel_prefix:
+            relative = os.path.relpath(document.file_path, app.config['UPLOAD_FOLDER'])
+            response = app.response_class(mimetype=document.file_type)
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative.replace(os.sep, '/'))
+            # Stored names come from secure_filename(), so plain ASCII
+            response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                                 filename=document.original_filename)
+            response.headers['Cache-Control'] = 'private'
+            return response
+        
+        try:
+            response = send_file(
+                document.file_path,
+                mimetype=document.file_type,
+                as_attachment=as_attachment,
+                download_name=document.original_filename,
+                conditional=True,  # Range, If-Range, If-None-Match and If-Modified-Since
+                etag=document.content_hash or True,  # Blob files are content-addressed: the hash is a strong ETag
+                max_age=app.config['DOWNLOAD_MAX_AGE']
+            )
+        except FileNotFoundError:
+            record_file_state(Document.id == document.id, False)
+            db.session.commit()
+            return jsonify({'error': 'Document file is missing'}), 404
+        
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+
+    def delete_documents(document_ids):
+        """Delete the current user's documents with their chats, text and index.
+
+        A fixed number of set-based statements regardless of how many chats
+        or documents there are. Files are queued for the janitor in the same
+        transaction and only removed after commit. Returns the deleted ids.
+        """
+        documents = db.session.query(Document.id, Document.content_hash, Document.file_path, Document.file_size) \
+            .filter(Document.id.in_(document_ids), Document.user_email == current_user.email).all()
+        if not documents:
+            return []
+        ids = [document.id for document in documents]
+        
+        chat_ids = select(Chat.id).where(Chat.document_id.in_(ids))
+        db.session.execute(delete(ChatMessage).where(ChatMessage.chat_id.in_(chat_ids)))
+        db.session.execute(delete(Chat).where(Chat.document_id.in_(ids)))
+        for model in (DocumentPage, DocumentChunk, DocumentIndex, DocumentExtraction):
+            db.session.execute(delete(model).where(model.document_id.in_(ids)))
+        db.session.execute(delete(Document).where(Document.id.in_(ids)))
+        storage_ledger.release(current_user.email, sum(d.file_size for d in documents), len(documents))
+        
+        for digest in release_blobs(Counter(d.content_hash for d in documents if d.content_hash)):
+            file_janitor.schedule_blob(digest)
+        for document in documents:
+            if not document.content_hash:
+                file_janitor.schedule_path(document.file_path)  # Uploaded before the blob store
+            file_janitor.schedule_path(vector_store.path_for(document.id))
+        db.session.commit()
+        
+        for document_id in ids:
+            index_cache.evict(document_id)
+            vector_store.evict(document_id)
+        file_janitor.wake()
+        return ids
+
     @app.route("/delete-document/<int:document_id>", methods=["DELETE"])
     @login_required
     def delete_document(document_id):
         """Delete a document and its associated files"""
         try:
-            document = Document.query.filter_by(id=document_id, user_email=current_user.email).first()
-            if not document:
+            if not delete_documents([document_id]):
                 return jsonify({'error': 'Document not found'}), 404
             
-            # Delete file from disk
-            if os.path.exists(document.file_path):
-                os.remove(document.file_path)
-                print(f"✅ File deleted from disk: {document.file_path}")
-            
-            # Delete associated chats and messages
-            chats = Chat.query.filter_by(document_id=document_id).all()
-            for chat in chats:
-                ChatMessage.query.filter_by(chat_id=chat.id).delete()
-                db.session.delete(chat)
-            
-            # Delete document from database
-            db.session.delete(document)
-            db.session.commit()
-            
             return jsonify({
                 'success': True,
                 'message': 'Document deleted successfully'
@@ -956,127 +1216,211 @@ def create_app():
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
+    @app.route("/delete-documents", methods=["POST"])
+    @login_required
+    def delete_documents_route():
+        """Delete several documents in one transaction: ``{"document_ids": [...]}``"""
+        document_ids = (request.get_json(silent=True) or {}).get('document_ids')
+        if not isinstance(document_ids, list) or not document_ids \
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in document_ids):
+            return jsonify({'error': 'document_ids must be a non-empty list of integers'}), 400
+        if len(document_ids) > MAX_BULK_DELETE:
+            return jsonify({'error': f'At most {MAX_BULK_DELETE} documents per request'}), 400
+        
+        try:
+            deleted = delete_documents(set(document_ids))
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        
+        return jsonify({
+            'success': True,
+            'deleted': sorted(deleted),
+            'not_found': sorted(set(document_ids) - set(deleted))
+        })
+
+    @app.route("/document-status/<int:document_id>", methods=["GET"])
+    @login_required
+    def document_status(document_id):
+        """Get the text extraction status of a document"""
+        document = Document.query.filter_by(id=document_id, user_email=current_user.email).first()
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        job = db.session.get(DocumentExtraction, document_id)
+        if not job:
+            return jsonify({'success': True, 'document_id': document_id, 'status': 'not_queued'})
+        
+        total_ms = None
+        if job.finished_at and job.queued_at:
+            total_ms = int((job.finished_at - job.queued_at).total_seconds() * 1000)
+        
+        return jsonify({
+            'success': True,
+            'document_id': document_id,
+            'status': job.status,
+            'page_count': job.page_count,
+            'char_count': job.char_count,
+            'chunk_count': job.chunk_count,
+            'parse_ms': job.parse_ms,
+            'index_ms': job.index_ms,
+            'total_ms': total_ms,
+            'error': job.error,
+            'queued_at': job.queued_at.isoformat() if job.queued_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None
+        })
+
     @app.route("/user-storage", methods=["GET"])
     @login_required
     def get_user_storage():
-        """Get storage information for the current user"""
+        """Storage used by the current user, from the ledger (one row lookup)"""
         try:
-            user_email = current_user.email
-            user_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-            
-            # Get user documents
-            documents = Document.query.filter_by(user_email=user_email).all()
-            
-            # Calculate total storage used
-            total_size = sum(doc.file_size for doc in documents)
-            total_files = len(documents)
-            
-            # Check if user directory exists
-            dir_exists = os.path.exists(user_dir)
-            dir_size = 0
-            
-            if dir_exists:
-                # Calculate actual directory size on disk
-                for root, dirs, files in os.walk(user_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        try:
-                            dir_size += os.path.getsize(file_path)
-                        except OSError:
-                            pass
-            
+            usage = storage_ledger.usage(current_user.email)
+            quota = usage['quota_bytes']
             return jsonify({
                 'success': True,
-                'user_email': user_email,
-                'user_directory': user_dir,
-                'directory_exists': dir_exists,
-                'total_documents': total_files,
-                'total_size_bytes': total_size,
-                'total_size_mb': round(total_size / (1024 * 1024), 2),
-                'actual_directory_size_bytes': dir_size,
-                'actual_directory_size_mb': round(dir_size / (1024 * 1024), 2),
+                'user_email': current_user.email,
+                'total_documents': usage['document_count'],
+                'total_size_bytes': usage['bytes_used'],
+                'total_size_mb': round(usage['bytes_used'] / (1024 * 1024), 2),
+                'quota_bytes': quota,
+                'quota_mb': round(quota / (1024 * 1024), 2) if quota else None,
+                'remaining_bytes': usage['remaining_bytes'],
+                'reconciled_at': usage['reconciled_at'],
                 'max_file_size_mb': MAX_FILE_SIZE // (1024 * 1024)
             })
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-    @app.route("/cleanup-orphaned-files", methods=["POST"])
+    @app.route("/cleanup-orphaned-files", methods=["GET", "POST"])
     @login_required
     def cleanup_orphaned_files():
-        """Clean up orphaned files that exist on disk but not in database"""
+        """Report the latest orphan scan; POST also schedules a new one (operators only)"""
+        # The scan covers every user's uploads, so only operators may start it or see its report
+        if current_user.email.lower() not in app.config['OPERATOR_EMAILS']:
+            return jsonify({'error': 'Operator access required'}), 403
         try:
-            user_email = current_user.email
-            user_dir = os.path.join(app.config['UPLOAD_FOLDER'], user_email)
-            
-            if not os.path.exists(user_dir):
-                return jsonify({'success': True, 'message': 'No user directory found', 'files_removed': 0})
-            
-            # Get all files in user directory
-            files_on_disk = []
-            for root, dirs, files in os.walk(user_dir):
-                for file in files:
-                    files_on_disk.append(os.path.join(root, file))
-            
-            # Get all files in database
-            documents = Document.query.filter_by(user_email=user_email).all()
-            db_files = [doc.file_path for doc in documents]
-            
-            # Find orphaned files
-            orphaned_files = [f for f in files_on_disk if f not in db_files]
-            
-            # Remove orphaned files
-            files_removed = 0
-            for orphaned_file in orphaned_files:
-                try:
-                    os.remove(orphaned_file)
-                    files_removed += 1
-                    print(f"🗑️ Orphaned file removed: {orphaned_file}")
-                except OSError as e:
-                    print(f"❌ Failed to remove orphaned file {orphaned_file}: {e}")
-            
+            if request.method == 'GET':
+                return jsonify({'success': True, 'last_scan': upload_scanner.report()})
+            # Comparing disk with the database is done incrementally by the scanner,
+            # which queues orphans for the file janitor; nothing is walked here
+            upload_scanner.request_pass()
+            removing = app.config['UPLOAD_SCAN_REMOVE_ORPHANS']
             return jsonify({
                 'success': True,
-                'message': f'Cleanup completed. {files_removed} orphaned files removed.',
-                'files_removed': files_removed,
-                'total_files_on_disk': len(files_on_disk),
-                'total_files_in_db': len(db_files),
-                'orphaned_files_found': len(orphaned_files)
-            })
+                'message': 'Orphan scan scheduled. ' + ('Orphaned files are removed in the background.' if removing
+                                                        else 'Orphaned files are reported, not removed.'),
+                'last_scan': upload_scanner.report()
+            }), 202
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
-    @app.route("/chat-message", methods=["POST"])
-    @login_required
-    def chat_message():
-        data = request.get_json()
+    def parse_chat_request():
+        """Validate a chat request body; returns (chat, message, document_ids, error_response)"""
+        data = request.get_json() or {}
         chat_id = data.get('chat_id')
         message_content = data.get('message')
         
         if not chat_id or not message_content:
-            return jsonify({'error': 'Missing chat_id or message'}), 400
+            return None, None, None, (jsonify({'error': 'Missing chat_id or message'}), 400)
         
         # Verify chat belongs to current user
         chat = Chat.query.filter_by(id=chat_id, user_email=current_user.email).first()
         if not chat:
-            return jsonify({'error': 'Chat not found'}), 404
+            return None, None, None, (jsonify({'error': 'Chat not found'}), 404)
+        
+        # Optionally search several of the user's documents at once
+        document_ids = data.get('document_ids')
+        if document_ids:
+            if not isinstance(document_ids, list) or not all(isinstance(i, int) for i in document_ids):
+                return None, None, None, (jsonify({'error': 'document_ids must be a list of document ids'}), 400)
+            document_ids = [doc_id for (doc_id,) in db.session.query(Document.id).filter(
+                Document.id.in_(document_ids),
+                Document.user_email == current_user.email
+            )]
+        else:
+            document_ids = [chat.document_id] if chat.document_id else []
+        
+        return chat, message_content, document_ids, None
+
+    def retrieve_clauses(document_ids, message_content):
+        """Retrieve the most relevant clauses of the chat's document(s)"""
+        if not document_ids:
+            return []
+        return search_clauses(document_ids, message_content, k=RETRIEVAL_TOP_K, mode=app.config['RETRIEVAL_MODE'])
+
+    def clause_sources(clauses):
+        return [
+            {'document_id': c['document_id'], 'page_number': c['page_number'], 'heading': c['heading'], 'score': c['score']}
+            for c in clauses
+        ]
+
+    def answer_cache_key(document_ids, message_content):
+        """Answer cache key and {document_id: content_hash}; the key is None when uncacheable"""
+        if not document_ids:
+            return None, {}
+        hashes = dict(db.session.query(Document.id, Document.content_hash).filter(Document.id.in_(document_ids)))
+        if not all(hashes.get(doc_id) for doc_id in document_ids):
+            return None, hashes  # Legacy uploads have no content hash
+        key = make_key(hashes.values(), message_content, response_engine.backend.version,
+                       app.config['RETRIEVAL_MODE'], RETRIEVAL_TOP_K)
+        return key, hashes
+
+    def cached_answer(key, hashes):
+        """Cached (response, sources) for this request's documents, or None"""
+        cached = answer_cache.get(key) if key else None
+        if cached is None:
+            return None
+        # Entries are shared by everyone with the same files, so map hashes back to this user's ids
+        document_ids = {content_hash: doc_id for doc_id, content_hash in hashes.items()}
+        sources = []
+        for source in cached['sources']:
+            source = dict(source)
+            source['document_id'] = document_ids[source.pop('content_hash')]
+            sources.append(source)
+        return cached['response'], sources
+
+    def cache_answer(key, hashes, response, clauses):
+        # Answers without clauses may just mean extraction hasn't finished yet
+        if not key or not clauses:
+            return
+        sources = clause_sources(clauses)
+        for source in sources:
+            source['content_hash'] = hashes[source.pop('document_id')]
+        answer_cache.put(key, {'response': response, 'sources': sources})
+
+    @app.route("/chat-message", methods=["POST"])
+    @login_required
+    def chat_message():
+        chat, message_content, document_ids, error = parse_chat_request()
+        if error:
+            return error
         
         try:
             # Save user message
             user_message = ChatMessage(
-                chat_id=chat_id,
+                chat_id=chat.id,
                 role='user',
                 content=message_content
             )
             db.session.add(user_message)
             
-            # Generate AI response (placeholder for now)
-            ai_response = generate_ai_response(message_content, chat.document_id)
+            cache_key, hashes = answer_cache_key(document_ids, message_content)
+            cached = cached_answer(cache_key, hashes)
+            if cached:
+                ai_response, sources = cached
+            else:
+                clauses = retrieve_clauses(document_ids, message_content)
+                ai_response = generate_ai_response(message_content, clauses)
+                sources = clause_sources(clauses)
+                cache_answer(cache_key, hashes, ai_response, clauses)
             
             # Save AI response
             ai_message = ChatMessage(
-                chat_id=chat_id,
+                chat_id=chat.id,
                 role='assistant',
                 content=ai_response
             )
@@ -1089,59 +1433,211 @@ def create_app():
             
             return jsonify({
                 'success': True,
-                'response': ai_response
+                'response': ai_response,
+                'sources': sources
             })
             
+        except EngineBusy as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 503
+        except EngineTimeout as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 504
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
-    def generate_ai_response(user_message, document_id):
-        """Placeholder function for AI response generation"""
-        # This would integrate with an actual AI service
-        responses = [
-            "Based on your document, I can see that this is an interesting topic. Could you be more specific about what you'd like to know?",
-            "I've analyzed the content and found several key points. What aspect would you like me to focus on?",
-            "The document contains valuable information about this subject. Let me know what specific questions you have.",
-            "I can help you understand this better. What particular section or concept would you like me to explain?",
-            "This is a comprehensive document with many insights. What specific area would you like to explore?"
-        ]
-        import random
-        return random.choice(responses)
+    @app.route("/chat-message/stream", methods=["POST"])
+    @login_required
+    def chat_message_stream():
+        """Stream the assistant's answer as Server-Sent Events.
+
+        Events: ``sources`` (retrieved clauses), ``token`` (answer text, in
+        order), then ``done`` once the full answer is saved, or ``error``.
+        """
+        chat, message_content, document_ids, error = parse_chat_request()
+        if error:
+            return error
+        
+        try:
+            cache_key, hashes = answer_cache_key(document_ids, message_content)
+            cached = cached_answer(cache_key, hashes)
+            if cached:
+                generation = None
+            else:
+                clauses = retrieve_clauses(document_ids, message_content)
+                generation = response_engine.submit(current_user.email, message_content, clauses)
+        except EngineBusy as e:
+            return jsonify({'error': str(e)}), 503
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+        
+        try:
+            # The question is saved up front so it survives a dropped stream
+            db.session.add(ChatMessage(chat_id=chat.id, role='user', content=message_content))
+            chat.updated_at = datetime.utcnow()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if generation:
+                generation.cancelled = True
+            return jsonify({'error': str(e)}), 500
+        
+        chat_id = chat.id
+        
+        def save_answer(parts):
+            ai_message = ChatMessage(chat_id=chat_id, role='assistant', content=''.join(parts))
+            db.session.add(ai_message)
+            db.session.query(Chat).filter_by(id=chat_id).update({'updated_at': datetime.utcnow()})
+            db.session.commit()
+            return ai_message
+        
+        def events():
+            parts = []
+            try:
+                if cached:
+                    response, sources = cached
+                    yield sse_event('sources', {'sources': sources})
+                    parts.append(response)
+                    yield sse_event('token', {'text': response})
+                else:
+                    yield sse_event('sources', {'sources': clause_sources(clauses)})
+                    for chunk in response_engine.iter_chunks(generation):
+                        parts.append(chunk)
+                        yield sse_event('token', {'text': chunk})
+                    cache_answer(cache_key, hashes, ''.join(parts), clauses)
+                ai_message = save_answer(parts)
+                yield sse_event('done', {'message_id': ai_message.id})
+            except GeneratorExit:
+                # Client went away mid-stream: keep what was generated so far
+                if parts:
+                    save_answer(parts)
+                raise
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Chat stream failed for chat {chat_id}: {e}")
+                yield sse_event('error', {'error': str(e)})
+        
+        return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx buffering the stream
+        })
+
+    def sse_event(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def generate_ai_response(user_message, clauses):
+        """Generate the full assistant answer through the shared response engine"""
+        return response_engine.generate(current_user.email, user_message, clauses)
+
+    @app.route("/system-stats")
+    @login_required
+    def system_stats():
+        """Queue depth, latency and hit-rate counters for the background workers and caches"""
+        return jsonify({
+            'ai_engine': response_engine.stats(),
+            'answer_cache': answer_cache.stats(),
+            'password_hashing': password_hasher.stats(),
+            'user_cache': user_cache.stats(),
+            'mail_outbox': mail_outbox.stats(),
+            'file_janitor': file_janitor.stats(),
+            'storage_ledger': {'corrected': storage_ledger.corrected},
+            'rate_limit': limiter.storage.stats() if limiter.enabled and hasattr(limiter.storage, 'stats') else {}
+        })
 
     @app.route("/get-chats")
     @login_required
     def get_chats():
-        chats = Chat.query.filter_by(user_email=current_user.email).order_by(Chat.updated_at.desc()).all()
-        chat_list = []
-        for chat in chats:
-            chat_data = {
-                'id': chat.id,
-                'title': chat.title,
-                'document_name': chat.document.original_filename if chat.document else 'General Chat',
-                'updated_at': chat.updated_at.strftime('%Y-%m-%d %H:%M'),
-                'message_count': chat.messages.count()
-            }
-            chat_list.append(chat_data)
-        return jsonify(chat_list)
+        """The user's chats, newest first, in pages of ``limit``.
+
+        One query: documents are outer-joined for their names and messages
+        counted with GROUP BY. Pass the ``X-Next-Cursor`` response header
+        back as ``cursor`` to fetch the next page.
+        """
+        limit = page_size(request.args.get('limit'))
+        query = db.session.query(
+            Chat.id, Chat.title, Chat.updated_at, Document.original_filename,
+            func.count(ChatMessage.id).label('message_count')
+        ).outerjoin(Document, Document.id == Chat.document_id) \
+         .outerjoin(ChatMessage, ChatMessage.chat_id == Chat.id) \
+         .filter(Chat.user_email == current_user.email) \
+         .group_by(Chat.id, Document.original_filename)
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                updated_at, chat_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(tuple_(Chat.updated_at, Chat.id) < (updated_at, chat_id))
+        
+        rows = query.order_by(Chat.updated_at.desc(), Chat.id.desc()).limit(limit + 1).all()
+        chat_list = [{
+            'id': row.id,
+            'title': row.title,
+            'document_name': row.original_filename or 'General Chat',
+            'updated_at': row.updated_at.strftime('%Y-%m-%d %H:%M'),
+            'message_count': row.message_count
+        } for row in rows[:limit]]
+        
+        response = jsonify(chat_list)
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            response.headers['X-Next-Cursor'] = encode_cursor(last.updated_at, last.id)
+        return response
 
     @app.route("/get-chat-messages/<int:chat_id>")
     @login_required
     def get_chat_messages(chat_id):
+        """A page of a chat's messages, oldest first.
+
+        Without parameters this is the latest ``limit`` messages. ``before``
+        pages back through older history; ``since`` returns only messages
+        newer than that cursor. ``X-Before-Cursor`` (when older messages
+        exist) and ``X-Since-Cursor`` (the newest message returned) response
+        headers carry the cursors for the next calls.
+        """
         chat = Chat.query.filter_by(id=chat_id, user_email=current_user.email).first()
         if not chat:
             return jsonify({'error': 'Chat not found'}), 404
         
-        messages = []
-        for msg in chat.messages:
-            message_data = {
-                'role': msg.role,
-                'content': msg.content,
-                'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M')
-            }
-            messages.append(message_data)
+        limit = page_size(request.args.get('limit'))
+        since, before = request.args.get('since'), request.args.get('before')
+        if since and before:
+            return jsonify({'error': 'Use either since or before, not both'}), 400
+        try:
+            position = decode_cursor(since or before) if (since or before) else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        key = tuple_(ChatMessage.created_at, ChatMessage.id)
+        query = ChatMessage.query.filter(ChatMessage.chat_id == chat.id)
+        if since:
+            rows = query.filter(key > position) \
+                .order_by(ChatMessage.created_at, ChatMessage.id).limit(limit + 1).all()
+            has_older, rows = False, rows[:limit]
+        else:
+            if before:
+                query = query.filter(key < position)
+            rows = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+            has_older, rows = len(rows) > limit, rows[:limit][::-1]
         
-        return jsonify(messages)
+        messages = [{
+            'id': msg.id,
+            'role': msg.role,
+            'content': msg.content,
+            'created_at': msg.created_at.strftime('%Y-%m-%d %H:%M')
+        } for msg in rows]
+        
+        response = jsonify(messages)
+        if has_older:
+            response.headers['X-Before-Cursor'] = encode_cursor(rows[0].created_at, rows[0].id)
+        if rows:
+            response.headers['X-Since-Cursor'] = encode_cursor(rows[-1].created_at, rows[-1].id)
+        elif since:
+            response.headers['X-Since-Cursor'] = since
+        return response
 
     # Test route to verify OTP generation works
     @app.route("/test-otp")
@@ -1161,32 +1657,46 @@ def create_app():
         
         return f"Test OTP generated: {test_otp} - Check terminal for details!"
 
+    @app.route("/healthz")
+    def healthz():
+        """Liveness: the process is serving requests. Never touches the database."""
+        return jsonify({'status': 'ok', 'boot': boot})
+
+    @app.route("/readyz")
+    def readyz():
+        """Readiness: the database answered the health monitor and the schema is up to date"""
+        db_monitor.available()  # Starts the monitor on the first probe
+        health = db_monitor.snapshot()
+        database_ok = health['available'] and health['last_ok_at'] is not None
+        if database_ok and not schema_state['ready']:
+            try:
+                with db.engine.connect() as connection:
+                    schema_state['ready'] = schema_ready(connection)
+            except Exception as e:
+                db_monitor.record_failure(e)
+                database_ok = False
+        checks = {'database': database_ok, 'schema': schema_state['ready']}
+        ready = all(checks.values())
+        return jsonify({'ready': ready, 'checks': checks, 'database': health, 'boot': boot}), 200 if ready else 503
+
     @app.route("/db-health")
     def db_health():
-        """Check database connection health"""
-        try:
-            # Test basic connection
-            db.session.execute("SELECT 1")
-            db.session.commit()
-            
-            # Test user table access
-            user_count = User.query.count()
-            
+        """Database health as last seen by the background monitor"""
+        health = db_monitor.snapshot()
+        if db_monitor.available():
             return jsonify({
                 'status': 'healthy',
                 'message': 'Database connection is working',
-                'user_count': user_count,
+                'monitor': health,
                 'timestamp': datetime.utcnow().isoformat()
             })
-            
-        except Exception as e:
-            print(f"❌ Database health check failed: {e}")
-            return jsonify({
-                'status': 'unhealthy',
-                'message': 'Database connection failed',
-                'error': str(e),
-                'timestamp': datetime.utcnow().isoformat()
-            }), 500
+        return jsonify({
+            'status': 'unhealthy',
+            'message': 'Database connection failed',
+            'error': health['last_error'],
+            'monitor': health,
+            'timestamp': datetime.utcnow().isoformat()
+        }), 503
 
     @app.route("/db-diagnostic")
     def db_diagnostic():
@@ -1694,10 +2204,85 @@ def create_app():
             print(f"❌ Error updating chat title: {e}")
             return jsonify({'error': str(e)}), 500
 
+
+    boot["create_app_ms"] = round((time.perf_counter() - boot_started) * 1000, 1)
+    print(f"🚀 App ready in {boot['create_app_ms']} ms (database connects on first use)")
+
     return app
 
 
+def wait_for_database(max_attempts=5, delay=2):
+    """Wait for database to become available"""
+    for attempt in range(max_attempts):
+        try:
+            print(f"🔄 Database connection attempt {attempt + 1}/{max_attempts}")
+            db.session.execute(text("SELECT 1"))
+            db.session.commit()
+            print("✅ Database connection successful")
+            return True
+        except Exception as e:
+            print(f"❌ Attempt {attempt + 1} failed: {str(e)[:100]}")
+            if attempt < max_attempts - 1:
+                print(f"⏳ Waiting {delay} seconds before retry...")
+                time.sleep(delay)
+            else:
+                print("❌ All database connection attempts failed")
+                return False
+    return False
+
+def init_database(app):
+    """One-time schema setup: wait for the database, create missing tables and
+    apply migrations. Returns True on success."""
+    with app.app_context():
+        try:
+            # Test connection with retry mechanism
+            print("🔍 Testing database connection...")
+            if not wait_for_database(max_attempts=5, delay=2):
+                raise Exception("Database connection failed after multiple attempts")
+
+            # Create all tables
+            print("🔨 Creating database tables...")
+            db.create_all()
+            print("✅ Database tables created")
+
+            # create_all() can't add columns or indexes to existing tables
+            with db.engine.connect() as connection:
+                upgrade_schema(connection)
+            print("✅ Database schema is up to date")
+            return True
+
+        except Exception as e:
+            error_msg = str(e)
+            print(f"❌ Database connection failed")
+            print(f"   🔍 Error details: {error_msg}")
+
+            # Provide specific error guidance
+            if "authentication failed" in error_msg.lower():
+                print("   🔧 Issue: Authentication failed - check username/password")
+            elif "connection refused" in error_msg.lower():
+                print("   🔧 Issue: Connection refused - check if database is running")
+            elif "ssl" in error_msg.lower():
+                print("   🔧 Issue: SSL connection problem - check network")
+            elif "timeout" in error_msg.lower():
+                print("   🔧 Issue: Connection timeout - check internet")
+            elif "database" in error_msg.lower() and "does not exist" in error_msg.lower():
+                print("   🔧 Issue: Database doesn't exist - check database name")
+            elif "psycopg2" in error_msg.lower():
+                print("   🔧 Issue: psycopg2 driver not installed")
+                print("   💡 Install with: pip install psycopg2-binary")
+            elif "no module named" in error_msg.lower():
+                print("   🔧 Issue: Missing Python module")
+                print("   💡 Install with: pip install -r requirements.txt")
+            else:
+                print(f"   🔧 Unknown error: {error_msg[:100]}...")
+
+            print("💡 Check your DATABASE_URL in .env file")
+            print("💡 Ensure your Neon database is running and accessible")
+            print("💡 Run: python test_database.py for detailed diagnostics")
+            return False
+
 if __name__ == "__main__":
     app = create_app()
+    init_database(app)  # The dev server sets up the schema itself; production runs scripts/migrate.py init
     print(f"🌐 Server starting at http://127.0.0.1:5000")
     app.run(debug=True) 
\ No newline at end of file
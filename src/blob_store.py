@@ -0,0 +1,158 @@
+import os
+from collections import Counter
+from sqlalchemy import insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Blob
+from upload_utils import HashingSpoolFile, StoredFile, spool_stream
+
+
+class BlobStore:
+    """Content-addressed file store: one file per distinct SHA-256.
+
+    Blobs live at ``<root>/<aa>/<bb>/<sha256>`` so no directory grows large
+    enough to make lookups slow.
+    """
+
+    def __init__(self, root, staging_dir):
+        self.root = root
+        self.staging_dir = staging_dir
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def stage(self, file) -> StoredFile:
+        """Hash an uploaded ``FileStorage`` into the staging folder.
+
+        Returns the staged file; ``adopt`` moves it into the store once a
+        reference to its blob is held.
+        """
+        spool = file.stream
+        if not isinstance(spool, HashingSpoolFile):
+            # Not spooled by UploadRequest - stage it once so we know its hash
+            spool = spool_stream(spool, self.staging_dir)
+        return spool.commit(spool.path)  # Keep the temp file when the request closes its streams
+
+    def adopt(self, path, size, digest):
+        """Move a staged, hashed file into the store and return ``(StoredFile, created)``.
+
+        Call it only while holding a reference from ``acquire_blobs``, so the
+        file janitor can't remove the blob in between. If the blob file
+        already exists the staged copy is discarded, so re-uploading a known
+        document costs no extra disk writes; a missing one is written again.
+        """
+        dest = self.path_for(digest)
+        if os.path.exists(dest):
+            os.remove(path)
+            return StoredFile(dest, size, digest), False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(path, dest)
+        return StoredFile(dest, size, digest), True
+
+    def discard(self, path):
+        """Remove a staged file that was never adopted"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, digest):
+        """Remove a blob file from disk, ignoring blobs that are already gone"""
+        try:
+            os.remove(self.path_for(digest))
+        except FileNotFoundError:
+            pass
+
+
+def acquire_blob(digest, size):
+    """Add a reference to a blob row, creating it on first use.
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    result = db.session.execute(
+        update(Blob).where(Blob.sha256 == digest).values(ref_count=Blob.ref_count + 1)
+    )
+    if result.rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(sha256=digest, size=size, ref_count=1))
+    except IntegrityError:
+        # A concurrent upload of the same content created the row first
+        db.session.execute(
+            update(Blob).where(Blob.sha256 == digest).values(ref_count=Blob.ref_count + 1)
+        )
+
+
+def acquire_blobs(stored_files):
+    """Add one reference per ``StoredFile`` in bulk, creating missing blob rows.
+
+    Runs in the caller's transaction, like ``acquire_blob``.
+    """
+    counts = Counter(stored.sha256 for stored in stored_files)
+    sizes = {stored.sha256: stored.size for stored in stored_files}
+    by_amount = {}
+    for digest, amount in counts.items():
+        by_amount.setdefault(amount, []).append(digest)
+    existing = set()
+    for amount, digests in by_amount.items():
+        existing.update(db.session.execute(
+            update(Blob).where(Blob.sha256.in_(digests)).values(ref_count=Blob.ref_count + amount)
+            .returning(Blob.sha256)
+        ).scalars())
+    new = [{"sha256": digest, "size": sizes[digest], "ref_count": amount}
+           for digest, amount in counts.items() if digest not in existing]
+    if not new:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(Blob), new)
+    except IntegrityError:
+        # A concurrent upload created some of them first
+        for row in new:
+            for _ in range(row["ref_count"]):
+                acquire_blob(row["sha256"], row["size"])
+
+
+def release_blobs(counts):
+    """Drop ``n`` references from each blob in ``{digest: n}``; return the digests
+    that are no longer referenced.
+
+    Runs in the caller's transaction; rows that reach zero are deleted and
+    their files are left to the file janitor (see ``claim_unreferenced_blob``).
+    """
+    if not counts:
+        return []
+    by_amount = {}
+    for digest, amount in counts.items():
+        by_amount.setdefault(amount, []).append(digest)
+    for amount, digests in by_amount.items():
+        db.session.execute(
+            update(Blob).where(Blob.sha256.in_(digests)).values(ref_count=Blob.ref_count - amount)
+        )
+    result = db.session.execute(
+        delete(Blob).where(Blob.sha256.in_(list(counts)), Blob.ref_count <= 0).returning(Blob.sha256)
+    )
+    return list(result.scalars())
+
+
+def claim_unreferenced_blob(digest) -> bool:
+    """Lock a blob's row and drop it if nothing references it; return True if the file may go.
+
+    Runs in the caller's transaction, which must remove the file before it
+    commits. A missing row is held with a placeholder insert, so an upload
+    acquiring the same blob waits until the file is gone and then writes it
+    again instead of trusting a file that is about to disappear.
+    """
+    blob = db.session.query(Blob).filter_by(sha256=digest).with_for_update().populate_existing().first()
+    if blob is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Blob(sha256=digest, size=0, ref_count=0))
+        except IntegrityError:
+            # An upload created the row first
+            return False
+    elif blob.ref_count > 0:
+        return False
+    db.session.execute(delete(Blob).where(Blob.sha256 == digest))
+    return True
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import text
+from extensions import db
+
+CLOSED = "closed"        # Database reachable, requests go through
+OPEN = "open"            # Database down, requests fail fast
+HALF_OPEN = "half_open"  # Probing whether it came back
+
+
+class DatabaseHealth:
+    """Background database monitor with a circuit breaker.
+
+    A daemon thread pings the database every ``DB_HEALTH_INTERVAL`` seconds.
+    ``DB_HEALTH_FAILURE_THRESHOLD`` consecutive failures (from pings or
+    reported by request handlers) open the circuit; while open, the monitor
+    probes every ``DB_HEALTH_RETRY_INTERVAL`` seconds and closes it again on
+    the first success. Request handlers only read the cached state.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_checked_at = None
+        self.last_ok_at = None
+        self.opened_at = None
+        self.last_latency_ms = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        app.config.setdefault("DB_HEALTH_INTERVAL", float(os.getenv("DB_HEALTH_INTERVAL", 5)))
+        app.config.setdefault("DB_HEALTH_RETRY_INTERVAL", float(os.getenv("DB_HEALTH_RETRY_INTERVAL", 2)))
+        app.config.setdefault("DB_HEALTH_FAILURE_THRESHOLD", int(os.getenv("DB_HEALTH_FAILURE_THRESHOLD", 2)))
+        app.extensions["db_health"] = self
+        self.app = app
+
+    def available(self):
+        """O(1): False only while the circuit is open"""
+        self._ensure_started()
+        return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.last_ok_at = datetime.utcnow()
+            if self.state != CLOSED:
+                print("✅ Database connection restored")
+            self.state = CLOSED
+            self.opened_at = None
+
+    def record_failure(self, error, wake=True):
+        """Count a failed database call; wakes the monitor to confirm quickly"""
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = str(error)[:500]
+            threshold = self.app.config["DB_HEALTH_FAILURE_THRESHOLD"] if self.app else 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= threshold):
+                if self.state == CLOSED:
+                    print(f"🚨 Database marked unavailable: {self.last_error[:100]}")
+                    self.opened_at = datetime.utcnow()
+                self.state = OPEN
+        if wake:
+            self._wake.set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "available": self.state != OPEN,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                "last_latency_ms": self.last_latency_ms,
+                "last_checked_at": self.last_checked_at.isoformat() if self.last_checked_at else None,
+                "last_ok_at": self.last_ok_at.isoformat() if self.last_ok_at else None,
+                "opened_at": self.opened_at.isoformat() if self.opened_at else None,
+            }
+
+    def _ensure_started(self):
+        if self._thread is not None or self.app is None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._monitor, name="db-health", daemon=True)
+                self._thread.start()
+
+    def _ping(self):
+        started = time.perf_counter()
+        with self.app.app_context():
+            with db.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        self.last_latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    def _monitor(self):
+        while True:
+            if self.state == OPEN:
+                with self._lock:
+                    self.state = HALF_OPEN
+            try:
+                self._ping()
+                self.record_success()
+            except Exception as e:
+                self.record_failure(e, wake=False)
+            self.last_checked_at = datetime.utcnow()
+
+            config = self.app.config
+            healthy = self.state == CLOSED and not self.consecutive_failures
+            interval = config["DB_HEALTH_INTERVAL"] if healthy else config["DB_HEALTH_RETRY_INTERVAL"]
+            self._wake.wait(interval)
+            self._wake.clear()
+
+
+db_monitor = DatabaseHealth()
@@ -1,7 +1,6 @@
 from flask import current_app, url_for
-from flask_mail import Message
 from itsdangerous import URLSafeTimedSerializer
-from extensions import mail
+from mail_outbox import mail_outbox
 
 RESET_SALT = "password-reset"
 
@@ -21,9 +20,8 @@ def verify_reset_token(token: str, max_age_seconds: int = 3600):
 
 def send_password_reset(email: str, token: str):
     reset_url = url_for("reset_password", token=token, _external=True)
-    msg = Message(
-        subject="Reset your password",
-        recipients=[email],
-        body=f"Use the link below to reset your password (valid for 1 hour):\n{reset_url}\nIf you didn't request this, ignore this email."
-    )
-    mail.send(msg) 
\ No newline at end of file
+    mail_outbox.enqueue(
+        email,
+        "Reset your password",
+        f"Use the link below to reset your password (valid for 1 hour):\n{reset_url}\nIf you didn't request this, ignore this email."
+    ) 
\ No newline at end of file
@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+EMBEDDING_DIM = 1024
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _hashed_features(text, dim):
+    """Signed bucket counts for the unigrams and bigrams of ``text``.
+
+    Features are hashed with CRC32 (stable across processes, unlike
+    ``hash()``); the low bits pick the bucket and the top bit the sign so
+    collisions tend to cancel out instead of piling up.
+    """
+    tokens = TOKEN.findall(text.lower())
+    counts = {}
+    for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        bucket = h % dim
+        counts[bucket] = counts.get(bucket, 0.0) + (1.0 if h >> 31 else -1.0)
+    return counts
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def embed_chunks(texts, dim=EMBEDDING_DIM):
+    """Embed clause texts as an L2-normalised float32 TF-IDF matrix.
+
+    IDF is computed over the document's own chunks and baked into the rows,
+    so queries only need hashing and normalising.
+    """
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for bucket, value in _hashed_features(text, dim).items():
+            matrix[row, bucket] = value
+    matrix = np.sign(matrix) * np.log1p(np.abs(matrix))  # sublinear tf
+    df = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(texts)) / (1 + df)) + 1.0
+    return _normalize_rows(matrix * idf.astype(np.float32)).astype(np.float32)
+
+
+def embed_query(text, dim=EMBEDDING_DIM):
+    vector = np.zeros(dim, dtype=np.float32)
+    for bucket, value in _hashed_features(text, dim).items():
+        vector[bucket] = value
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    return _normalize_rows(vector).astype(np.float32)
+
+
+def save_vectors(path, matrix):
+    """Write a chunk matrix as .npy, atomically replacing any previous one"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, matrix)
+    os.replace(tmp_path, path)
+
+
+class VectorStore:
+    """Per-document chunk matrices, memory-mapped from ``<root>/<document_id>.npy``"""
+
+    def __init__(self, max_open=128):
+        self.root = None
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.root = app.config["VECTOR_FOLDER"]
+        os.makedirs(self.root, exist_ok=True)
+        app.extensions["vector_store"] = self
+
+    def path_for(self, document_id):
+        return os.path.join(self.root, f"{document_id}.npy")
+
+    def _matrix(self, document_id):
+        with self._lock:
+            matrix = self._open.get(document_id)
+            if matrix is not None:
+                self._open.move_to_end(document_id)
+                return matrix
+        try:
+            matrix = np.load(self.path_for(document_id), mmap_mode="r")
+        except FileNotFoundError:
+            return None  # Not extracted yet
+        with self._lock:
+            self._open[document_id] = matrix
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return matrix
+
+    def search(self, document_ids, query, k=5):
+        """Top-``k`` ``(document_id, chunk_ordinal, score)`` across documents.
+
+        Each document costs one matrix-vector product; the scores are then
+        ranked together with a single argpartition.
+        """
+        owners, scores, queries = [], [], {}
+        for document_id in document_ids:
+            matrix = self._matrix(document_id)
+            if matrix is None or not matrix.shape[0]:
+                continue
+            dim = matrix.shape[1]
+            if dim not in queries:
+                queries[dim] = embed_query(query, dim)
+            owners.append((document_id, matrix.shape[0]))
+            scores.append(matrix @ queries[dim])
+        if not scores:
+            return []
+
+        scores = np.concatenate(scores)
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        bounds = np.cumsum([count for _, count in owners])
+        results = []
+        for position in top:
+            if scores[position] <= 0:
+                break  # Nothing in common with the query
+            owner = int(np.searchsorted(bounds, position, side="right"))
+            start = bounds[owner - 1] if owner else 0
+            results.append((owners[owner][0], int(position - start), float(scores[position])))
+        return results
+
+    def evict(self, document_id):
+        """Forget an open matrix; the file itself is left to the caller"""
+        with self._lock:
+            self._open.pop(document_id, None)
+
+
+vector_store = VectorStore()
@@ -0,0 +1,398 @@
+import atexit
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import insert, literal, select, update
+from extensions import db
+from models import Document, DocumentExtraction, DocumentPage, DocumentChunk, DocumentIndex
+from retrieval import build_clause_index, chunk_search_text
+from embeddings import embed_chunks, save_vectors, vector_store
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF extraction is skipped without pypdf
+    PdfReader = None
+
+
+class UnsupportedDocument(Exception):
+    """Raised when a document type has no text extractor"""
+
+
+# ---------------------------------------------------------------------------
+# Parsers - these run inside worker processes, so they must stay pure
+# (no Flask, no database) and return plain lists of page/section strings.
+# ---------------------------------------------------------------------------
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+TEXT_NS = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+
+def _extract_plain_text(path):
+    with open(path, "rb") as f:
+        text = f.read().decode("utf-8", errors="replace")
+    # Form feeds are the only page marker plain text has
+    return text.split("\f")
+
+
+def _extract_rtf(path):
+    with open(path, "rb") as f:
+        rtf = f.read().decode("latin-1")
+    # Drop destinations such as {\*\generator ...}, fonts and colour tables
+    rtf = re.sub(r"\{\\\*[^{}]*\}", "", rtf)
+    rtf = re.sub(r"\{\\(fonttbl|colortbl|stylesheet|info)[^{}]*(\{[^{}]*\}[^{}]*)*\}", "", rtf)
+    rtf = re.sub(r"\\'([0-9a-fA-F]{2})", lambda m: bytes.fromhex(m.group(1)).decode("cp1252", errors="replace"), rtf)
+    rtf = re.sub(r"\\(par|line)\b ?", "\n", rtf)
+    rtf = re.sub(r"\\page\b ?", "\f", rtf)
+    rtf = re.sub(r"\\[a-zA-Z]+-?\d* ?", "", rtf)
+    rtf = rtf.replace("\\{", "{").replace("\\}", "}").replace("\\\\", "\\")
+    rtf = rtf.replace("{", "").replace("}", "")
+    return rtf.split("\f")
+
+
+def _extract_docx(path):
+    with zipfile.ZipFile(path) as archive:
+        root = ET.fromstring(archive.read("word/document.xml"))
+    sections, paragraphs = [], []
+    for paragraph in root.iter(f"{W_NS}p"):
+        texts = []
+        for node in paragraph.iter():
+            if node.tag == f"{W_NS}t" and node.text:
+                texts.append(node.text)
+            elif node.tag == f"{W_NS}tab":
+                texts.append("\t")
+            elif node.tag == f"{W_NS}br" and node.get(f"{W_NS}type") == "page":
+                sections.append("\n".join(paragraphs))
+                paragraphs = []
+        paragraphs.append("".join(texts))
+    sections.append("\n".join(paragraphs))
+    return sections
+
+
+def _extract_odt(path):
+    with zipfile.ZipFile(path) as archive:
+        root = ET.fromstring(archive.read("content.xml"))
+    sections, paragraphs = [], []
+    for node in root.iter():
+        if node.tag == f"{TEXT_NS}soft-page-break":
+            sections.append("\n".join(paragraphs))
+            paragraphs = []
+        elif node.tag in (f"{TEXT_NS}p", f"{TEXT_NS}h"):
+            paragraphs.append("".join(node.itertext()))
+    sections.append("\n".join(paragraphs))
+    return sections
+
+
+def _extract_pptx(path):
+    slide_name = re.compile(r"ppt/slides/slide(\d+)\.xml$")
+    slides = []
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            match = slide_name.match(name)
+            if match:
+                root = ET.fromstring(archive.read(name))
+                text = "\n".join(node.text for node in root.iter(f"{A_NS}t") if node.text)
+                slides.append((int(match.group(1)), text))
+    return [text for _, text in sorted(slides)]
+
+
+def _extract_pdf(path):
+    if PdfReader is None:
+        raise UnsupportedDocument("PDF extraction requires the pypdf package")
+    reader = PdfReader(path)
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+EXTRACTORS = {
+    "txt": _extract_plain_text,
+    "md": _extract_plain_text,
+    "rtf": _extract_rtf,
+    "docx": _extract_docx,
+    "odt": _extract_odt,
+    "pptx": _extract_pptx,
+    "pdf": _extract_pdf,
+}
+
+
+def extract_pages(path, extension):
+    """Extract text from a document as a list of pages (or sections)"""
+    extractor = EXTRACTORS.get(extension.lower())
+    if extractor is None:
+        raise UnsupportedDocument(f"No text extractor for .{extension} files")
+    return [page.strip() for page in extractor(path)]
+
+
+def run_extraction(path, extension, vectors_path):
+    """Worker-process entry point: extract, chunk and index a document.
+
+    The clause embedding matrix is written straight to ``vectors_path``.
+    """
+    started = time.perf_counter()
+    pages = extract_pages(path, extension)
+    parsed = time.perf_counter()
+    chunks, index = build_clause_index(pages)
+    payload = index.to_bytes()
+    save_vectors(vectors_path, embed_chunks([chunk_search_text(chunk) for chunk in chunks]))
+    indexed = time.perf_counter()
+    return {
+        "pages": pages,
+        "chunks": chunks,
+        "index_payload": payload,
+        "term_count": len(index.term_ids),
+        "parse_ms": int((parsed - started) * 1000),
+        "index_ms": int((indexed - parsed) * 1000),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Service - owned by the web process
+# ---------------------------------------------------------------------------
+
+class ExtractionService:
+    """Runs text extraction for uploaded documents off the request path.
+
+    Parsing happens on a process pool; a small thread pool in the web process
+    waits on those results and writes them to the database, so request
+    threads only ever enqueue work. A run claims its job by moving it from
+    ``queued`` to ``running``, so submitting a job twice is harmless. A
+    background sweep resubmits jobs a crashed or restarted worker left
+    behind: ``queued`` ones, and ``running`` ones past ``EXTRACTION_LEASE``.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._processes = None
+        self._dispatchers = None
+        self._sweeper = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault("EXTRACTION_WORKERS", int(os.getenv("EXTRACTION_WORKERS", 2)))
+        app.config.setdefault("EXTRACTION_LEASE", float(os.getenv("EXTRACTION_LEASE", 3600)))  # Longest a run may take
+        app.config.setdefault("EXTRACTION_REQUEUE_AFTER", float(os.getenv("EXTRACTION_REQUEUE_AFTER", 60)))
+        app.config.setdefault("EXTRACTION_SWEEP_INTERVAL", float(os.getenv("EXTRACTION_SWEEP_INTERVAL", 300)))
+        app.extensions["extraction"] = self
+        app.before_request(self.start)
+        self.app = app
+
+    def start(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, name="extraction-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self.recover()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Extraction sweep error: {e}")
+                finally:
+                    db.session.remove()
+                time.sleep(self.app.config["EXTRACTION_SWEEP_INTERVAL"])
+
+    def recover(self, limit=1000):
+        """Resubmit abandoned jobs; needs an app context. Returns how many were submitted.
+
+        ``running`` jobs whose lease ran out go back to ``queued``. ``queued``
+        jobs older than ``EXTRACTION_REQUEUE_AFTER`` are submitted again; the
+        worker that queued them may be gone, and if it isn't, the claim in
+        ``_run`` makes the second submission a no-op.
+        """
+        now = datetime.utcnow()
+        config = self.app.config
+        db.session.execute(
+            update(DocumentExtraction)
+            .where(DocumentExtraction.status == "running",
+                   DocumentExtraction.started_at < now - timedelta(seconds=config["EXTRACTION_LEASE"]))
+            .values(status="queued", started_at=None),
+            execution_options={"synchronize_session": False}
+        )
+        rows = db.session.execute(
+            select(Document.id, Document.file_path, Document.original_filename)
+            .join(DocumentExtraction, DocumentExtraction.document_id == Document.id)
+            .where(DocumentExtraction.status == "queued",
+                   DocumentExtraction.queued_at <= now - timedelta(seconds=config["EXTRACTION_REQUEUE_AFTER"]))
+            .order_by(Document.id).limit(limit)
+        ).all()
+        db.session.commit()
+        if rows:
+            self.submit_many([(row.id, row.file_path, row.original_filename.rsplit('.', 1)[-1].lower())
+                              for row in rows])
+        return len(rows)
+
+    def _pools(self):
+        with self._lock:
+            if self._processes is None:
+                workers = self.app.config["EXTRACTION_WORKERS"]
+                # spawn, not fork: forking a threaded web worker can deadlock
+                self._processes = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._dispatchers = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="extraction"
+                )
+                atexit.register(self.shutdown)
+            return self._processes, self._dispatchers
+
+    def submit(self, document_id, path, extension):
+        """Queue a committed document for extraction and return immediately"""
+        _, dispatchers = self._pools()
+        return dispatchers.submit(self._run, document_id, path, extension)
+
+    def submit_many(self, jobs):
+        """Queue a committed batch of ``(document_id, path, extension)`` jobs"""
+        _, dispatchers = self._pools()
+        return [dispatchers.submit(self._run, *job) for job in jobs]
+
+    def _run(self, document_id, path, extension):
+        processes, _ = self._pools()
+        with self.app.app_context():
+            started = datetime.utcnow()
+            claimed = db.session.execute(
+                update(DocumentExtraction)
+                .where(DocumentExtraction.document_id == document_id, DocumentExtraction.status == "queued")
+                .values(status="running", started_at=started),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                return  # Already taken by another run, finished, or deleted
+
+            try:
+                if self._copy_duplicate(document_id, started):
+                    return
+                result = processes.submit(
+                    run_extraction, path, extension, vector_store.path_for(document_id)
+                ).result()
+                pages, chunks = result["pages"], result["chunks"]
+                # Lock the document so it can't be deleted before these rows commit
+                if db.session.query(Document.id).filter_by(id=document_id).with_for_update().first() is None:
+                    # Deleted while it was being extracted, maybe after the janitor removed its files
+                    db.session.rollback()
+                    try:
+                        os.remove(vector_store.path_for(document_id))
+                    except FileNotFoundError:
+                        pass
+                    return
+                job = self._claim(document_id, started)
+                if job is None:
+                    db.session.rollback()  # The lease ran out and another run took over
+                    return
+                if pages:
+                    db.session.execute(insert(DocumentPage), [
+                        {"document_id": document_id, "page_number": number, "content": content}
+                        for number, content in enumerate(pages, start=1)
+                    ])
+                if chunks:
+                    db.session.execute(insert(DocumentChunk), [
+                        dict(chunk, document_id=document_id) for chunk in chunks
+                    ])
+                db.session.add(DocumentIndex(
+                    document_id=document_id,
+                    chunk_count=len(chunks),
+                    term_count=result["term_count"],
+                    payload=result["index_payload"],
+                ))
+                job.status = "done"
+                job.page_count = len(pages)
+                job.char_count = sum(len(page) for page in pages)
+                job.chunk_count = len(chunks)
+                job.parse_ms = result["parse_ms"]
+                job.index_ms = result["index_ms"]
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+            except UnsupportedDocument as e:
+                db.session.rollback()
+                self._finish(document_id, started, status="unsupported", error=str(e))
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Text extraction failed for document {document_id}: {e}")
+                self._finish(document_id, started, status="failed", error=str(e)[:1000])
+
+    def _claim(self, document_id, started):
+        """Lock and return the job if the run that started at ``started`` still holds it"""
+        return db.session.query(DocumentExtraction).filter_by(
+            document_id=document_id, status="running", started_at=started
+        ).with_for_update().populate_existing().first()
+
+    def _finish(self, document_id, started, **values):
+        """Record a failed run, unless another run has taken the job over (or it was deleted)"""
+        db.session.execute(
+            update(DocumentExtraction)
+            .where(DocumentExtraction.document_id == document_id, DocumentExtraction.status == "running",
+                   DocumentExtraction.started_at == started)
+            .values(finished_at=datetime.utcnow(), **values),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.commit()
+
+    def _copy_duplicate(self, document_id, started):
+        """Reuse the results of a finished document with the same ``content_hash``.
+
+        Deduplicated uploads share one blob, so their text is the same; the
+        pages, clauses, index and vectors are copied instead of parsing the
+        file again. Commits and returns True if a copy was made (or the
+        document is gone); returns False when there is nothing to reuse.
+        """
+        content_hash = select(Document.content_hash).where(Document.id == document_id).scalar_subquery()
+        # FOR SHARE keeps the source from being deleted while it is copied
+        source = db.session.query(DocumentExtraction) \
+            .join(Document, Document.id == DocumentExtraction.document_id) \
+            .filter(Document.content_hash == content_hash, Document.id != document_id,
+                    DocumentExtraction.status == "done") \
+            .order_by(Document.id).with_for_update(read=True, of=Document).first()
+        if source is None:
+            return False
+        if db.session.query(Document.id).filter_by(id=document_id).with_for_update().first() is None:
+            db.session.rollback()  # Deleted before it was extracted
+            return True
+        job = self._claim(document_id, started)
+        if job is None:
+            db.session.rollback()  # The lease ran out and another run took over
+            return True
+        try:
+            shutil.copyfile(vector_store.path_for(source.document_id), vector_store.path_for(document_id))
+        except FileNotFoundError:
+            db.session.rollback()
+            return False
+
+        for model, columns in (
+            (DocumentPage, ("page_number", "content")),
+            (DocumentChunk, ("ordinal", "page_number", "heading", "content")),
+            (DocumentIndex, ("chunk_count", "term_count", "payload", "built_at")),
+        ):
+            db.session.execute(insert(model).from_select(
+                ("document_id",) + columns,
+                select(literal(document_id), *[getattr(model, column) for column in columns])
+                .where(model.document_id == source.document_id)
+            ))
+        job.status = "done"
+        job.page_count = source.page_count
+        job.char_count = source.char_count
+        job.chunk_count = source.chunk_count
+        job.parse_ms = job.index_ms = 0
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            if self._dispatchers is not None:
+                self._dispatchers.shutdown(wait=False, cancel_futures=True)
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._processes = self._dispatchers = None
+
+
+extraction_service = ExtractionService()
@@ -0,0 +1,140 @@
+import os
+import threading
+from sqlalchemy import delete, update
+from blob_store import BlobStore, claim_unreferenced_blob
+from extensions import db
+from models import FileDeletion
+
+
+class FileJanitor:
+    """Removes files of deleted documents once the deleting transaction commits.
+
+    Callers queue ``FileDeletion`` rows (``schedule_blob`` / ``schedule_path``)
+    in the same transaction that deletes the database rows, so a rollback
+    keeps the files and a crash after commit only delays their removal. A
+    background thread drains the table; rows are claimed with ``FOR UPDATE
+    SKIP LOCKED`` so several processes can share it, and deleted with a
+    guarded statement so a row drained twice (SQLite has no row locks) is
+    only counted once.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.blob_store = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wake = threading.Event()
+        self.removed = 0
+        self.kept = 0      # Blobs re-acquired by an upload before removal
+        self.failed = 0
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("FILE_JANITOR_INTERVAL", float(os.getenv("FILE_JANITOR_INTERVAL", 60)))
+        config.setdefault("FILE_JANITOR_BATCH_SIZE", int(os.getenv("FILE_JANITOR_BATCH_SIZE", 100)))
+        config.setdefault("FILE_JANITOR_MAX_ATTEMPTS", int(os.getenv("FILE_JANITOR_MAX_ATTEMPTS", 5)))
+        self.blob_store = BlobStore(config["BLOB_FOLDER"], config["UPLOAD_STAGING_FOLDER"])
+        app.extensions["file_janitor"] = self
+        # Deletions queued by a previous process are picked up once this one serves traffic
+        app.before_request(self.start)
+        self.app = app
+
+    def schedule_blob(self, digest):
+        """Queue a blob file; runs in the caller's transaction"""
+        db.session.add(FileDeletion(blob_sha256=digest))
+
+    def schedule_path(self, path):
+        """Queue a plain file; runs in the caller's transaction"""
+        db.session.add(FileDeletion(path=path))
+
+    def wake(self):
+        """Call after committing scheduled deletions"""
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="file-janitor", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        return {"removed": self.removed, "kept": self.kept, "failed": self.failed}
+
+    def _worker(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self.drain()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"File janitor error: {e}")
+                finally:
+                    db.session.remove()
+                self._wake.wait(self.app.config["FILE_JANITOR_INTERVAL"])
+                self._wake.clear()
+
+    def drain(self):
+        """Remove queued files until none are left; needs an app context"""
+        # Drains in one process take turns; across processes SKIP LOCKED splits the rows
+        with self._drain_lock:
+            self._drain()
+
+    def _drain(self):
+        config = self.app.config
+        last_id = 0  # Rows that fail are retried on the next drain, not in a tight loop
+        while True:
+            batch = FileDeletion.query.filter(FileDeletion.id > last_id).order_by(FileDeletion.id) \
+                .limit(config["FILE_JANITOR_BATCH_SIZE"]).with_for_update(skip_locked=True).all()
+            if not batch:
+                return
+            for deletion in batch:
+                last_id = deletion.id
+                try:
+                    self._remove(deletion)
+                except OSError as e:
+                    if deletion.attempts + 1 >= config["FILE_JANITOR_MAX_ATTEMPTS"]:
+                        if self._forget(deletion):
+                            self.failed += 1
+                            self.app.logger.error(f"Giving up on removing {deletion.blob_sha256 or deletion.path}: {e}")
+                    else:
+                        db.session.execute(
+                            update(FileDeletion).where(FileDeletion.id == deletion.id)
+                            .values(attempts=FileDeletion.attempts + 1, last_error=str(e)[:1000]),
+                            execution_options={"synchronize_session": False}
+                        )
+                else:
+                    self._forget(deletion)
+            db.session.commit()
+
+    def _forget(self, deletion):
+        """Delete the queue row; False if another drainer got to it first.
+
+        SKIP LOCKED is a no-op on SQLite, so two drainers can load the same
+        rows there; a guarded DELETE keeps the second one from failing.
+        """
+        return db.session.execute(
+            delete(FileDeletion).where(FileDeletion.id == deletion.id),
+            execution_options={"synchronize_session": False}
+        ).rowcount > 0
+
+    def _remove(self, deletion):
+        if deletion.blob_sha256:
+            # An upload of the same content may have re-acquired it since; the row
+            # stays locked until the file is gone and this batch commits
+            if not claim_unreferenced_blob(deletion.blob_sha256):
+                self.kept += 1
+                return
+            self.blob_store.remove(deletion.blob_sha256)
+        else:
+            try:
+                os.remove(deletion.path)
+            except FileNotFoundError:
+                pass
+        self.removed += 1
+
+
+file_janitor = FileJanitor()
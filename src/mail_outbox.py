@@ -0,0 +1,190 @@
+import os
+import smtplib
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from flask_mail import Message
+from extensions import db, mail
+from models import OutboxMessage
+
+
+PURGE_INTERVAL = 600  # Seconds between sweeps of delivered messages
+
+
+class MailOutbox:
+    """Transactional email outbox with a background delivery thread.
+
+    Request handlers only insert an ``OutboxMessage`` row. The worker claims
+    due rows in batches (``FOR UPDATE SKIP LOCKED``, so several processes can
+    share the table), sends them over one SMTP connection that is kept open
+    while there is traffic, and retries failures with exponential backoff.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._connections = None  # ExitStack holding the open SMTP connection
+        self._connection = None
+        self._last_used = 0.0
+        self._purged_at = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections_opened = 0
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("MAIL_OUTBOX_BATCH_SIZE", int(os.getenv("MAIL_OUTBOX_BATCH_SIZE", 20)))
+        config.setdefault("MAIL_OUTBOX_POLL_INTERVAL", float(os.getenv("MAIL_OUTBOX_POLL_INTERVAL", 10)))
+        config.setdefault("MAIL_OUTBOX_IDLE_TIMEOUT", float(os.getenv("MAIL_OUTBOX_IDLE_TIMEOUT", 30)))  # Close SMTP after this long unused
+        config.setdefault("MAIL_OUTBOX_MAX_ATTEMPTS", int(os.getenv("MAIL_OUTBOX_MAX_ATTEMPTS", 6)))
+        config.setdefault("MAIL_OUTBOX_RETRY_BASE", float(os.getenv("MAIL_OUTBOX_RETRY_BASE", 30)))  # Seconds; doubles per attempt
+        config.setdefault("MAIL_OUTBOX_LEASE", float(os.getenv("MAIL_OUTBOX_LEASE", 300)))
+        config.setdefault("MAIL_OUTBOX_RETENTION_HOURS", float(os.getenv("MAIL_OUTBOX_RETENTION_HOURS", 24)))
+        app.extensions["mail_outbox"] = self
+        # Messages left over from a previous process go out once this one serves traffic
+        app.before_request(self.start)
+        self.app = app
+
+    def enqueue(self, recipient, subject, body):
+        """Queue an email and commit; delivery happens in the background"""
+        message = OutboxMessage(recipient=recipient, subject=subject, body=body)
+        db.session.add(message)
+        db.session.commit()
+        self.start()
+        self._wake.set()
+        return message
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="mail-outbox", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "connections_opened": self.connections_opened,
+            "connected": self._connection is not None,
+        }
+
+    # -- worker -------------------------------------------------------------
+
+    def _worker(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self.drain()
+                    self._purge_sent()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Mail outbox delivery error: {e}")
+                finally:
+                    db.session.remove()
+
+                config = self.app.config
+                if self._connection is not None and time.monotonic() - self._last_used > config["MAIL_OUTBOX_IDLE_TIMEOUT"]:
+                    self._disconnect()
+                timeout = config["MAIL_OUTBOX_IDLE_TIMEOUT"] if self._connection is not None else config["MAIL_OUTBOX_POLL_INTERVAL"]
+                self._wake.wait(min(timeout, config["MAIL_OUTBOX_POLL_INTERVAL"]))
+                self._wake.clear()
+
+    def drain(self):
+        """Deliver messages that are due until none are left; needs an app context"""
+        due = datetime.utcnow()  # Retries scheduled during this drain wait for the next one
+        while True:
+            batch = self._claim(due)
+            if not batch:
+                return
+            for position, message in enumerate(batch):
+                if self._connection is None:
+                    try:
+                        self._connect()
+                    except Exception as e:
+                        # Server unreachable: back off the whole batch
+                        for pending in batch[position:]:
+                            self._retry(pending, e)
+                        break
+                try:
+                    self._send(Message(subject=message.subject, recipients=[message.recipient], body=message.body))
+                except Exception as e:
+                    self._retry(message, e)
+                    self._disconnect()  # Reconnect for the next message
+                else:
+                    message.status = 'sent'
+                    message.sent_at = datetime.utcnow()
+                    message.last_error = None
+                    self.sent += 1
+            self._last_used = time.monotonic()
+            db.session.commit()
+
+    def _send(self, message):
+        try:
+            self._connection.send(message)
+        except smtplib.SMTPServerDisconnected:
+            # The kept-alive connection was closed by the server; reconnect once
+            self._disconnect()
+            self._connect()
+            self._connection.send(message)
+
+    def _claim(self, due):
+        config = self.app.config
+        now = datetime.utcnow()
+        batch = OutboxMessage.query.filter(
+            OutboxMessage.status == 'pending',
+            OutboxMessage.next_attempt_at <= due
+        ).order_by(OutboxMessage.next_attempt_at).limit(config["MAIL_OUTBOX_BATCH_SIZE"]) \
+         .with_for_update(skip_locked=True).all()
+        for message in batch:
+            # Lease: if this process dies mid-send the message becomes due again
+            message.next_attempt_at = now + timedelta(seconds=config["MAIL_OUTBOX_LEASE"])
+            message.attempts += 1
+        db.session.commit()
+        return batch
+
+    def _retry(self, message, error):
+        config = self.app.config
+        message.last_error = str(error)[:1000]
+        if message.attempts >= config["MAIL_OUTBOX_MAX_ATTEMPTS"]:
+            message.status = 'failed'
+            self.failed += 1
+            self.app.logger.error(f"Giving up on email {message.id} to {message.recipient}: {error}")
+        else:
+            delay = config["MAIL_OUTBOX_RETRY_BASE"] * 2 ** (message.attempts - 1)
+            message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            self.retried += 1
+            print(f"⚠️ Email {message.id} to {message.recipient} failed, retrying in {int(delay)}s: {error}")
+
+    def _connect(self):
+        stack = ExitStack()
+        self._connection = stack.enter_context(mail.connect())
+        self._connections = stack
+        self.connections_opened += 1
+
+    def _disconnect(self):
+        stack, self._connections, self._connection = self._connections, None, None
+        if stack is not None:
+            try:
+                stack.close()
+            except Exception:
+                pass  # Server already dropped us
+
+    def _purge_sent(self):
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        # Bodies hold OTPs and reset links, so don't keep them around
+        cutoff = datetime.utcnow() - timedelta(hours=self.app.config["MAIL_OUTBOX_RETENTION_HOURS"])
+        OutboxMessage.query.filter(OutboxMessage.status == 'sent', OutboxMessage.sent_at < cutoff) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+
+mail_outbox = MailOutbox()
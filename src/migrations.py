@@ -0,0 +1,160 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from extensions import db
+from models import Blob
+
+# Everything here must be idempotent: ``db.create_all()`` builds new databases
+# straight from the models, so a migration may find its work already done.
+
+
+def add_column(conn, table, column, ddl):
+    """``ALTER TABLE ... ADD COLUMN`` unless the column exists.
+
+    A table that doesn't exist yet is skipped; ``create_all()`` builds it
+    from the model, column included.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return
+    if column not in {c["name"] for c in inspector.get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_index(conn, name, table, *columns):
+    """Build an index without blocking writes on PostgreSQL.
+
+    ``CONCURRENTLY`` can't run inside a transaction, so this commits ``conn``
+    (the build would otherwise wait on its locks) and runs the statement on a
+    separate autocommit connection, leaving ``conn``'s isolation level alone.
+    If a concurrent build fails it leaves an INVALID index behind; drop it and
+    run the migration again.
+    """
+    columns = ", ".join(columns)
+    if conn.dialect.name == "postgresql":
+        conn.commit()
+        with conn.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as ddl:
+            ddl.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+    else:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _blob_store_columns(conn):
+    # Databases from before the blob store have no blobs table for content_hash to reference
+    Blob.__table__.create(conn, checkfirst=True)
+    add_column(conn, "documents", "content_hash", "VARCHAR(64) REFERENCES blobs (sha256)")
+    create_index(conn, "ix_documents_content_hash", "documents", "content_hash")
+
+
+def _keyset_pagination_indexes(conn):
+    create_index(conn, "ix_chats_user_updated", "chats", "user_email", "updated_at", "id")
+    create_index(conn, "ix_chat_messages_chat_created", "chat_messages", "chat_id", "created_at", "id")
+
+
+def _ownership_indexes(conn):
+    # user_email lookups use the leading column of the composites, and
+    # chat_messages.chat_id is covered by ix_chat_messages_chat_created
+    create_index(conn, "ix_documents_user_uploaded", "documents", "user_email", "uploaded_at")
+    create_index(conn, "ix_chats_document_id", "chats", "document_id")
+
+
+def _document_file_state(conn):
+    # Constant defaults: PostgreSQL adds these without rewriting the table
+    add_column(conn, "documents", "file_exists", "BOOLEAN NOT NULL DEFAULT TRUE")
+    add_column(conn, "documents", "file_checked_at", "TIMESTAMP")
+    add_column(conn, "user_storage", "documents_version", "BIGINT NOT NULL DEFAULT 0")
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "Blob store column on documents", _blob_store_columns),
+    (2, "Keyset pagination indexes for chats and messages", _keyset_pagination_indexes),
+    (3, "Indexes for per-user documents and chats by document", _ownership_indexes),
+    (4, "Stored file state on documents and a per-user documents version", _document_file_state),
+]
+
+# Representative queries of the hot endpoints, for before/after query plans
+PLAN_QUERIES = {
+    "/user-documents": (
+        "SELECT * FROM documents WHERE user_email = :email ORDER BY uploaded_at DESC"
+    ),
+    "/get-chats": (
+        "SELECT chats.id, chats.title, chats.updated_at, documents.original_filename, count(chat_messages.id) "
+        "FROM chats LEFT OUTER JOIN documents ON documents.id = chats.document_id "
+        "LEFT OUTER JOIN chat_messages ON chat_messages.chat_id = chats.id "
+        "WHERE chats.user_email = :email GROUP BY chats.id, documents.original_filename "
+        "ORDER BY chats.updated_at DESC, chats.id DESC LIMIT 51"
+    ),
+    "/delete-document": (
+        "SELECT * FROM chats WHERE document_id = :document_id"
+    ),
+    "/get-chat-messages": (
+        "SELECT * FROM chat_messages WHERE chat_id = :chat_id "
+        "ORDER BY created_at DESC, id DESC LIMIT 51"
+    ),
+}
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+    conn.commit()
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def upgrade(conn, target=None):
+    """Apply pending migrations in order, each committed with its version row"""
+    done = []
+    for version, description, migrate in pending_migrations(conn):
+        if target is not None and version > target:
+            break
+        print(f"⬆️  {version:04d} {description}")
+        migrate(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+            {"v": version, "d": description, "t": datetime.utcnow()}
+        )
+        conn.commit()
+        done.append(version)
+    return done
+
+
+def query_plans(conn, email=None, document_id=None, chat_id=None):
+    """EXPLAIN output of ``PLAN_QUERIES`` for sample values taken from the data"""
+    if email is None:
+        email = conn.execute(text(
+            "SELECT user_email FROM documents GROUP BY user_email ORDER BY count(*) DESC LIMIT 1"
+        )).scalar() or "nobody@example.com"
+    if document_id is None:
+        document_id = conn.execute(text("SELECT max(id) FROM documents")).scalar() or 0
+    if chat_id is None:
+        chat_id = conn.execute(text("SELECT max(id) FROM chats")).scalar() or 0
+    params = {"email": email, "document_id": document_id, "chat_id": chat_id}
+    explain = "EXPLAIN" if conn.dialect.name == "postgresql" else "EXPLAIN QUERY PLAN"
+
+    plans = {}
+    for endpoint, sql in PLAN_QUERIES.items():
+        rows = conn.execute(text(f"{explain} {sql}"), params).fetchall()
+        # PostgreSQL returns one text column; SQLite returns (id, parent, notused, detail)
+        plans[endpoint] = [row[-1] for row in rows]
+    conn.rollback()
+    return plans
+
+
+def schema_ready(conn):
+    """Read-only check that every model table exists and no migration is pending"""
+    tables = set(inspect(conn).get_table_names())
+    if not set(db.metadata.tables) <= tables or "schema_migrations" not in tables:
+        return False
+    applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+    return all(version in applied for version, _, _ in MIGRATIONS)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from sqlalchemy import UniqueConstraint
-from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import password_hasher, HasherBusy
 from flask_login import UserMixin
 from extensions import db
 
@@ -16,6 +16,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     email_verified = db.Column(db.Boolean, default=False)
     phone_verified = db.Column(db.Boolean, default=False)
+    # Legacy OTP columns - codes now live in otp_codes (see otp_store.py)
     email_otp = db.Column(db.String(6), nullable=True)
     phone_otp = db.Column(db.String(6), nullable=True)
     email_otp_expires = db.Column(db.DateTime, nullable=True)
@@ -34,13 +35,15 @@ class User(UserMixin, db.Model):
         return self.email
 
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password, method="pbkdf2:sha256")
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password: str) -> bool:
         try:
             if not self.password_hash:
                 return False
-            return check_password_hash(self.password_hash, password)
+            return password_hasher.verify(self.password_hash, password)
+        except HasherBusy:
+            raise
         except Exception as e:
             print(f"Password check error: {e}")
             return False
@@ -49,6 +52,21 @@ class User(UserMixin, db.Model):
         """Check if the new password is the same as the current password"""
         return self.check_password(new_password)
 
+    def password_needs_rehash(self) -> bool:
+        """True when the stored hash predates the configured hashing parameters"""
+        return bool(self.password_hash) and password_hasher.needs_rehash(self.password_hash)
+
+class Blob(db.Model):
+    __tablename__ = "blobs"
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)  # Size in bytes
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Number of Document rows using this blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]} refs={self.ref_count}>'
+
 class Document(db.Model):
     __tablename__ = "documents"
     
@@ -59,21 +77,91 @@ class Document(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)  # Size in bytes
     file_type = db.Column(db.String(50), nullable=False)
+    content_hash = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True, index=True)  # SHA-256 of the stored blob
+    file_exists = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())  # Kept by upload_scanner
+    file_checked_at = db.Column(db.DateTime, nullable=True)  # When file_exists was last verified on disk
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref='documents', foreign_keys=[user_email])
     chats = db.relationship('Chat', backref='document', lazy='dynamic')
     
+    __table_args__ = (
+        # One user's documents, newest first; also serves plain user_email lookups
+        db.Index('ix_documents_user_uploaded', 'user_email', 'uploaded_at'),
+    )
+    
     def __repr__(self):
         return f'<Document {self.original_filename}>'
 
+class DocumentExtraction(db.Model):
+    __tablename__ = "document_extractions"
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed, unsupported
+    page_count = db.Column(db.Integer, nullable=True)
+    char_count = db.Column(db.Integer, nullable=True)
+    chunk_count = db.Column(db.Integer, nullable=True)
+    parse_ms = db.Column(db.Integer, nullable=True)  # Time spent parsing in the worker process
+    index_ms = db.Column(db.Integer, nullable=True)  # Time spent chunking, indexing and embedding in the worker process
+    error = db.Column(db.Text, nullable=True)
+    queued_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<DocumentExtraction {self.document_id}: {self.status}>'
+
+class DocumentPage(db.Model):
+    __tablename__ = "document_pages"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    page_number = db.Column(db.Integer, nullable=False)  # 1-based page, slide or section number
+    content = db.Column(db.Text, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint('document_id', 'page_number', name='uq_document_pages_document_page'),
+    )
+    
+    def __repr__(self):
+        return f'<DocumentPage {self.document_id}:{self.page_number}>'
+
+class DocumentChunk(db.Model):
+    __tablename__ = "document_chunks"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    ordinal = db.Column(db.Integer, nullable=False)  # Position of the clause in the document, 0-based
+    page_number = db.Column(db.Integer, nullable=False)  # Page the clause starts on
+    heading = db.Column(db.String(255), nullable=True)
+    content = db.Column(db.Text, nullable=False)
+    
+    __table_args__ = (
+        UniqueConstraint('document_id', 'ordinal', name='uq_document_chunks_document_ordinal'),
+    )
+    
+    def __repr__(self):
+        return f'<DocumentChunk {self.document_id}:{self.ordinal}>'
+
+class DocumentIndex(db.Model):
+    __tablename__ = "document_indexes"
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), primary_key=True)
+    chunk_count = db.Column(db.Integer, nullable=False)
+    term_count = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)  # Compressed BM25 postings, see retrieval.InvertedIndex
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DocumentIndex {self.document_id}: {self.chunk_count} chunks>'
+
 class Chat(db.Model):
     __tablename__ = "chats"
     
     id = db.Column(db.Integer, primary_key=True)
     user_email = db.Column(db.String(255), db.ForeignKey('users.email'), nullable=False)
-    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=True, index=True)
     title = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -82,6 +170,11 @@ class Chat(db.Model):
     user = db.relationship('User', backref='chats', foreign_keys=[user_email])
     messages = db.relationship('ChatMessage', backref='chat', lazy='dynamic', order_by='ChatMessage.created_at')
     
+    __table_args__ = (
+        # Serves the chat list (one user's chats, newest first) and user_email lookups
+        db.Index('ix_chats_user_updated', 'user_email', 'updated_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Chat {self.title}>'
 
@@ -94,5 +187,120 @@ class ChatMessage(db.Model):
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # Keyset pagination of one chat's messages
+        db.Index('ix_chat_messages_chat_created', 'chat_id', 'created_at', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<ChatMessage {self.role}: {self.content[:50]}...>' 
+
+class OutboxMessage(db.Model):
+    __tablename__ = "mail_outbox"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Also the delivery lease while sending
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # The delivery worker's claim query
+        db.Index('ix_mail_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} to {self.recipient}: {self.status}>'
+
+class OtpCode(db.Model):
+    __tablename__ = "otp_codes"
+    
+    identity = db.Column(db.String(255), primary_key=True)  # Email (or phone) the code was sent to
+    purpose = db.Column(db.String(20), primary_key=True, default='email')
+    code_hash = db.Column(db.String(64), nullable=False)  # HMAC of the code, never the code itself
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Swept once passed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<OtpCode {self.purpose} for {self.identity}>'
+
+class FileDeletion(db.Model):
+    __tablename__ = "file_deletions"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    blob_sha256 = db.Column(db.String(64), nullable=True)  # Removed only if the blob is still unreferenced
+    path = db.Column(db.String(500), nullable=True)  # Legacy upload or vector file
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FileDeletion {self.id}: {self.blob_sha256 or self.path}>'
+
+class UserStorage(db.Model):
+    __tablename__ = "user_storage"
+    
+    user_email = db.Column(db.String(255), db.ForeignKey('users.email'), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False, default=0)
+    bytes_used = db.Column(db.BigInteger, nullable=False, default=0)  # Sum of Document.file_size
+    quota_bytes = db.Column(db.BigInteger, nullable=True)  # Per-user override of STORAGE_QUOTA_MB
+    documents_version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # Bumped whenever /user-documents would change
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    reconciled_at = db.Column(db.DateTime, nullable=True)  # Last recounted from the documents table
+    
+    def __repr__(self):
+        return f'<UserStorage {self.user_email}: {self.bytes_used} bytes in {self.document_count} documents>'
+
+class StorageScan(db.Model):
+    __tablename__ = "storage_scans"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    phase = db.Column(db.String(20), nullable=False)  # See upload_scanner.PHASES; 'done' once finished
+    cursor = db.Column(db.String(255), nullable=True)  # Last shard finished within the phase
+    files_seen = db.Column(db.BigInteger, nullable=False, default=0)
+    orphans_found = db.Column(db.Integer, nullable=False, default=0)  # Files on disk no row refers to
+    orphans_queued = db.Column(db.Integer, nullable=False, default=0)  # Of those, handed to the file janitor
+    dangling_documents = db.Column(db.Integer, nullable=False, default=0)  # Document rows whose file is missing
+    dangling_sample = db.Column(db.Text, nullable=True)  # JSON list of the first few dangling document ids
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def __repr__(self):
+        return f'<StorageScan {self.id}: {self.phase} {self.cursor or ""}>'
+
+class UploadSession(db.Model):
+    __tablename__ = "upload_sessions"
+    
+    id = db.Column(db.String(32), primary_key=True)  # Random token, also names the part file
+    user_email = db.Column(db.String(255), db.ForeignKey('users.email'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)  # Already passed through secure_filename
+    file_type = db.Column(db.String(50), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    chunk_count = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)  # Optional whole-file checksum from the client
+    path = db.Column(db.String(500), nullable=False)  # Sparse part file the chunks are written into
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Pushed back by every chunk
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.filename}>'
+
+class UploadChunk(db.Model):
+    __tablename__ = "upload_chunks"
+    
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    index = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
     def __repr__(self):
-        return f'<ChatMessage {self.role}: {self.content[:50]}...>' 
\ No newline at end of file
+        return f'<UploadChunk {self.session_id}#{self.index}>'
@@ -0,0 +1,179 @@
+import hashlib
+import hmac
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update
+from extensions import db
+from models import OtpCode
+from otp_utils import generate_otp
+
+# verify() outcomes
+OTP_OK = "ok"
+OTP_INVALID = "invalid"
+OTP_EXPIRED = "expired"      # No live code: never issued, used, swept or past expiry
+OTP_LOCKED = "locked"        # Too many wrong guesses; a new code is needed
+
+
+class DatabaseOtpBackend:
+    """One row per (identity, purpose) in the narrow ``otp_codes`` table"""
+
+    def put(self, identity, purpose, code_hash, expires_at):
+        db.session.merge(OtpCode(
+            identity=identity, purpose=purpose, code_hash=code_hash,
+            attempts=0, expires_at=expires_at, created_at=datetime.utcnow()
+        ))
+        db.session.commit()
+
+    def attempt(self, identity, purpose, now):
+        """Count a guess; returns ``(code_hash, attempts)`` or None if no live code"""
+        row = db.session.execute(
+            update(OtpCode)
+            .where(OtpCode.identity == identity, OtpCode.purpose == purpose, OtpCode.expires_at > now)
+            .values(attempts=OtpCode.attempts + 1)
+            .returning(OtpCode.code_hash, OtpCode.attempts)
+        ).first()
+        db.session.commit()
+        return tuple(row) if row else None
+
+    def exists(self, identity, purpose, now):
+        return db.session.query(OtpCode.identity).filter(
+            OtpCode.identity == identity, OtpCode.purpose == purpose, OtpCode.expires_at > now
+        ).first() is not None
+
+    def delete(self, identity, purpose):
+        db.session.execute(delete(OtpCode).where(OtpCode.identity == identity, OtpCode.purpose == purpose))
+        db.session.commit()
+
+    def sweep(self, now):
+        deleted = db.session.execute(delete(OtpCode).where(OtpCode.expires_at <= now)).rowcount
+        db.session.commit()
+        return deleted
+
+
+class MemoryOtpBackend:
+    """Per-process store for development and single-worker deployments"""
+
+    def __init__(self):
+        self._codes = {}  # (identity, purpose) -> [code_hash, expires_at, attempts]
+        self._lock = threading.Lock()
+
+    def put(self, identity, purpose, code_hash, expires_at):
+        with self._lock:
+            self._codes[(identity, purpose)] = [code_hash, expires_at, 0]
+
+    def attempt(self, identity, purpose, now):
+        with self._lock:
+            entry = self._codes.get((identity, purpose))
+            if entry is None or entry[1] <= now:
+                return None
+            entry[2] += 1
+            return entry[0], entry[2]
+
+    def exists(self, identity, purpose, now):
+        with self._lock:
+            entry = self._codes.get((identity, purpose))
+            return entry is not None and entry[1] > now
+
+    def delete(self, identity, purpose):
+        with self._lock:
+            self._codes.pop((identity, purpose), None)
+
+    def sweep(self, now):
+        with self._lock:
+            expired = [key for key, entry in self._codes.items() if entry[1] <= now]
+            for key in expired:
+                del self._codes[key]
+            return len(expired)
+
+
+OTP_BACKENDS = {
+    "database": DatabaseOtpBackend,
+    "memory": MemoryOtpBackend,
+}
+
+
+class OtpStore:
+    """Issues and checks one-time codes with expiry and attempt limits.
+
+    Codes are stored as an HMAC keyed with ``SECRET_KEY``; each guess
+    atomically bumps the attempt counter and ``OTP_MAX_ATTEMPTS`` wrong
+    guesses burn the code. A background sweeper deletes expired codes every
+    ``OTP_SWEEP_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.backend = None
+        self._sweeper = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("OTP_STORE", os.getenv("OTP_STORE", "database"))
+        config.setdefault("OTP_EXPIRY_MINUTES", int(os.getenv("OTP_EXPIRY_MINUTES", 10)))
+        config.setdefault("OTP_MAX_ATTEMPTS", int(os.getenv("OTP_MAX_ATTEMPTS", 5)))
+        config.setdefault("OTP_SWEEP_INTERVAL", float(os.getenv("OTP_SWEEP_INTERVAL", 300)))
+        try:
+            self.backend = OTP_BACKENDS[config["OTP_STORE"]]()
+        except KeyError:
+            raise ValueError(f"Unknown OTP_STORE '{config['OTP_STORE']}'. Available: {', '.join(sorted(OTP_BACKENDS))}")
+        app.extensions["otp_store"] = self
+        app.before_request(self.start_sweeper)
+        self.app = app
+
+    def _hash(self, identity, code):
+        key = self.app.config["SECRET_KEY"].encode("utf-8")
+        return hmac.new(key, f"{identity}:{code}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def issue(self, identity, purpose="email"):
+        """Create (or replace) the code for ``identity``; returns ``(code, expires_at)``"""
+        code = generate_otp()
+        expires_at = datetime.utcnow() + timedelta(minutes=self.app.config["OTP_EXPIRY_MINUTES"])
+        self.backend.put(identity, purpose, self._hash(identity, code), expires_at)
+        return code, expires_at
+
+    def verify(self, identity, submitted, purpose="email"):
+        """Check a submitted code; a correct code is consumed"""
+        result = self.backend.attempt(identity, purpose, datetime.utcnow())
+        if result is None:
+            return OTP_EXPIRED
+        code_hash, attempts = result
+        if attempts > self.app.config["OTP_MAX_ATTEMPTS"]:
+            self.backend.delete(identity, purpose)
+            return OTP_LOCKED
+        if not hmac.compare_digest(code_hash, self._hash(identity, submitted or "")):
+            return OTP_INVALID
+        self.backend.delete(identity, purpose)
+        return OTP_OK
+
+    def has_active(self, identity, purpose="email"):
+        return self.backend.exists(identity, purpose, datetime.utcnow())
+
+    def sweep(self):
+        return self.backend.sweep(datetime.utcnow())
+
+    def start_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="otp-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_forever(self):
+        stop = threading.Event()
+        while not stop.wait(self.app.config["OTP_SWEEP_INTERVAL"]):
+            with self.app.app_context():
+                try:
+                    swept = self.sweep()
+                    if swept:
+                        print(f"🧹 Swept {swept} expired OTP code(s)")
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"OTP sweep failed: {e}")
+                finally:
+                    db.session.remove()
+
+
+otp_store = OtpStore()
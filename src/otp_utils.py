@@ -1,21 +1,14 @@
-import random
+import secrets
 import string
 import os
 from datetime import datetime, timedelta
 from flask import current_app
-from flask_mail import Message
-from extensions import mail
+from mail_outbox import mail_outbox
 import phonenumbers
 
 def generate_otp(length=6):
     """Generate a random OTP of specified length"""
-    return ''.join(random.choices(string.digits, k=length))
-
-def is_otp_expired(expires_at):
-    """Check if OTP has expired"""
-    if not expires_at:
-        return True
-    return datetime.utcnow() > expires_at
+    return ''.join(secrets.choice(string.digits) for _ in range(length))
 
 def get_otp_expiry_time(minutes=None):
     """Get OTP expiry time (default from env or 10 minutes)"""
@@ -39,11 +32,9 @@ def send_email_otp(email, otp):
             print(f"   OTP Code: {otp} (shown in terminal only)")
             return False
         
-        # Create and send email
-        msg = Message(
-            subject="Your ClauseEase AI Verification Code",
-            recipients=[email],
-            body=f"""
+        # Queue the email; the outbox worker delivers it in the background
+        subject = "Your ClauseEase AI Verification Code"
+        mail_outbox.enqueue(email, subject, f"""
 Your verification code is: {otp}
 
 This code will expire in 10 minutes.
@@ -52,18 +43,15 @@ If you didn't request this code, please ignore this email.
 
 Best regards,
 ClauseEase AI Team
-            """.strip()
-        )
+            """.strip())
         
-        print(f"📧 Sending email to: {email}")
-        print(f"📧 Email subject: {msg.subject}")
-        mail.send(msg)
-        print(f"✅ Email sent successfully to {email}")
+        print(f"📧 Email queued for: {email}")
+        print(f"📧 Email subject: {subject}")
         return True
         
     except Exception as e:
-        current_app.logger.error(f"Failed to send email OTP: {e}")
-        print(f"❌ EMAIL SENDING FAILED:")
+        current_app.logger.error(f"Failed to queue email OTP: {e}")
+        print(f"❌ EMAIL QUEUEING FAILED:")
         print(f"   Error: {e}")
         print(f"   Email: {email}")
         print(f"   OTP: {otp}")
@@ -71,14 +59,3 @@ ClauseEase AI Team
         print(f"   OTP Code: {otp} (shown in terminal only)")
         return False
 
-
-
-def verify_otp(user_otp, stored_otp, expires_at):
-    """Verify OTP code and check if expired"""
-    if not stored_otp or not user_otp:
-        return False
-    if is_otp_expired(expires_at):
-        return False
-    return user_otp == stored_otp
-
- 
\ No newline at end of file
@@ -0,0 +1,173 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+SCRYPT_DEFAULTS = ["32768", "8", "1"]  # werkzeug's n, r, p
+
+
+class HasherBusy(Exception):
+    """Raised when too many password hashes are already waiting"""
+
+
+def _hash_password(password, method):
+    started = time.time()
+    return generate_password_hash(password, method=method), started
+
+
+def _verify_password(pwhash, password):
+    started = time.time()
+    return check_password_hash(pwhash, password), started
+
+
+def method_prefix(method):
+    """Spell out werkzeug's defaults so configured methods compare with stored hashes"""
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        hash_name = parts[1] if len(parts) > 1 else "sha256"
+        iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    if parts[0] == "scrypt":
+        return ":".join(["scrypt"] + parts[1:] + SCRYPT_DEFAULTS[len(parts) - 1:])
+    return method
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a dedicated process pool.
+
+    At most ``PASSWORD_HASH_MAX_PENDING`` operations may be queued or running;
+    beyond that callers get ``HasherBusy`` straight away instead of tying up
+    a request thread. With ``PASSWORD_HASH_WORKERS = 0`` hashing runs inline.
+    """
+
+    def __init__(self):
+        self.method = "pbkdf2:sha256"
+        self.workers = 0
+        self.timeout = 10.0
+        self._prefix = method_prefix(self.method)
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "hashed": 0, "verified": 0, "rejected": 0, "timeouts": 0, "rehashed": 0,
+            "latency_ms_total": 0.0, "latency_ms_max": 0.0, "queue_wait_ms_total": 0.0,
+        }
+        self._pending = 0
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("PASSWORD_HASH_METHOD", os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256"))
+        config.setdefault("PASSWORD_HASH_WORKERS", int(os.getenv("PASSWORD_HASH_WORKERS", 2)))
+        config.setdefault("PASSWORD_HASH_MAX_PENDING", int(os.getenv("PASSWORD_HASH_MAX_PENDING", 16)))
+        config.setdefault("PASSWORD_HASH_TIMEOUT", float(os.getenv("PASSWORD_HASH_TIMEOUT", 10)))
+        self.method = config["PASSWORD_HASH_METHOD"]
+        self._prefix = method_prefix(self.method)
+        self.workers = config["PASSWORD_HASH_WORKERS"]
+        self.timeout = config["PASSWORD_HASH_TIMEOUT"]
+        self._slots = threading.BoundedSemaphore(config["PASSWORD_HASH_MAX_PENDING"])
+        app.extensions["password_hasher"] = self
+
+    def hash(self, password):
+        pwhash = self._run(_hash_password, password, self.method)
+        with self._lock:
+            self._stats["hashed"] += 1
+        return pwhash
+
+    def verify(self, pwhash, password):
+        ok = self._run(_verify_password, pwhash, password)
+        with self._lock:
+            self._stats["verified"] += 1
+        return ok
+
+    def needs_rehash(self, pwhash):
+        """True when a stored hash was made with other parameters than the configured ones"""
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def record_rehash(self):
+        with self._lock:
+            self._stats["rehashed"] += 1
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: forking a threaded web worker can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                atexit.register(self.shutdown)
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            submitted = time.time()
+            result, started = fn(*args)
+            self._record(submitted, started)
+            return result
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HasherBusy("Too many sign-ins in progress. Please try again in a moment.")
+        submitted = time.time()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            self._finished(None)
+            raise
+        # A timed-out job keeps its worker busy until it ends, so it keeps its slot until then
+        future.add_done_callback(self._finished)
+        try:
+            result, started = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise HasherBusy("Sign-in is taking too long. Please try again in a moment.")
+
+        self._record(submitted, started)
+        return result
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _record(self, submitted, started):
+        latency = (time.time() - started) * 1000
+        with self._lock:
+            self._stats["latency_ms_total"] += latency
+            self._stats["latency_ms_max"] = max(self._stats["latency_ms_max"], latency)
+            self._stats["queue_wait_ms_total"] += max(0.0, started - submitted) * 1000
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            pending = self._pending
+        operations = stats["hashed"] + stats["verified"]
+        return {
+            "method": self._prefix,
+            "workers": self.workers,
+            "pending": pending,
+            "hashed": stats["hashed"],
+            "verified": stats["verified"],
+            "rehashed": stats["rehashed"],
+            "rejected": stats["rejected"],
+            "timeouts": stats["timeouts"],
+            "avg_latency_ms": round(stats["latency_ms_total"] / operations, 1) if operations else 0,
+            "max_latency_ms": round(stats["latency_ms_max"], 1),
+            "avg_queue_wait_ms": round(stats["queue_wait_ms_total"] / operations, 1) if operations else 0,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+password_hasher = PasswordHasher()
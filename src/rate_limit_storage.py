@@ -0,0 +1,248 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from limits.storage import Storage, MovingWindowSupport
+
+
+PRUNE_INTERVAL = 60  # Seconds between sweeps of expired rows
+
+
+class _Lease:
+    """Entries reserved in the shared window and handed out without touching SQLite"""
+
+    __slots__ = ("row_id", "remaining", "until", "limit", "expiry")
+
+    def __init__(self, row_id, remaining, until, limit, expiry):
+        self.row_id = row_id
+        self.remaining = remaining
+        self.until = until
+        self.limit = limit
+        self.expiry = expiry
+
+    def covers(self, now, limit, expiry, amount):
+        return now < self.until and self.limit == limit and self.expiry == expiry and self.remaining >= amount
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    """Rate limit storage in a SQLite WAL file shared by every worker on the host.
+
+    Use it as ``RATELIMIT_STORAGE_URI = "sqlite:////path/to/ratelimit.db"``.
+    Each moving-window hit is checked and recorded in one ``BEGIN IMMEDIATE``
+    transaction, so workers can't both take the last slot.
+
+    Two in-process fast paths keep most hits off the file:
+
+    * When a key is well under its limit (``used < limit * lease_ratio`` and
+      ``limit >= lease_min_limit``) a hit reserves a few extra entries for
+      ``lease_seconds``; later hits in this process consume them from memory.
+      Reserved entries count against the limit for other workers, and unused
+      ones are handed back, so the limit is never exceeded; a leased hit may
+      leave the window up to ``lease_seconds`` early.
+    * A key found full is rejected locally until its oldest entry expires.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, lease_seconds=1.0, lease_ratio=0.5,
+                 lease_min_limit=10, lease_size=16, busy_timeout=5.0, **options):
+        # sqlite:////abs/path.db or sqlite:///relative.db, like SQLAlchemy URLs
+        self.path = uri.split("://", 1)[1][1:] if uri and "://" in uri else ""
+        if not self.path:
+            raise ValueError("SQLite rate limit storage needs a file path, e.g. sqlite:////tmp/ratelimit.db")
+        self.lease_seconds = float(lease_seconds)
+        self.lease_ratio = float(lease_ratio)
+        self.lease_min_limit = int(lease_min_limit)
+        self.lease_size = int(lease_size)
+        self.busy_timeout = float(busy_timeout)
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+        self._leases = {}      # key -> _Lease
+        self._full_until = {}  # key -> time the oldest entry in a full window expires
+        self._pruned_at = 0.0
+        self.fast_hits = 0
+        self.fast_rejects = 0
+        self.shared_hits = 0
+        self.shared_rejects = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        atexit.register(self._return_leases)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self):
+        """The process's connection; reopened after a fork, dropping the parent's leases"""
+        if self._db is not None and self._pid == os.getpid():
+            return self._db
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_entries ("
+            "id INTEGER PRIMARY KEY, key TEXT NOT NULL, ts REAL NOT NULL, amount INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_entries_key_ts ON rate_limit_entries (key, ts)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_entries_expires ON rate_limit_entries (expires_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._pid = os.getpid()
+        self._leases.clear()
+        self._full_until.clear()
+        return self._db
+
+    # -- moving window --------------------------------------------------------
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            lease = self._leases.get(key)
+            if lease is not None and lease.covers(now, limit, expiry, amount):
+                lease.remaining -= amount
+                self.fast_hits += 1
+                return True
+            if self._full_until.get(key, 0) > now:
+                self.fast_rejects += 1
+                return False
+
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._return_expired_leases(db, now, key)
+                used, oldest = db.execute(
+                    "SELECT COALESCE(SUM(amount), 0), MIN(ts) FROM rate_limit_entries WHERE key = ? AND ts > ? AND amount > 0",
+                    (key, now - expiry)
+                ).fetchone()
+                if used + amount > limit:
+                    db.execute("COMMIT")
+                    # Only other hits can land in the window before its oldest entry leaves
+                    self._full_until[key] = oldest + expiry
+                    self.shared_rejects += 1
+                    return False
+                extra = 0
+                if limit >= self.lease_min_limit:
+                    extra = max(0, min(self.lease_size, int(limit * self.lease_ratio) - used - amount))
+                row_id = db.execute(
+                    "INSERT INTO rate_limit_entries (key, ts, amount, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, now, amount + extra, now + expiry)
+                ).lastrowid
+                self._prune(db, now)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            if extra:
+                self._leases[key] = _Lease(row_id, extra, now + self.lease_seconds, limit, expiry)
+            self.shared_hits += 1
+            return True
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        with self._lock:
+            oldest, used = self._connect().execute(
+                "SELECT MIN(ts), COALESCE(SUM(amount), 0) FROM rate_limit_entries WHERE key = ? AND ts > ? AND amount > 0",
+                (key, now - expiry)
+            ).fetchone()
+            lease = self._leases.get(key)
+            if lease is not None and lease.until > now:
+                used -= lease.remaining  # Reserved, not used
+        return (oldest if oldest is not None else now), max(0, used)
+
+    def _return_expired_leases(self, db, now, key):
+        """Give unused reserved entries back; needs an open transaction"""
+        for lease_key in [k for k, lease in self._leases.items() if k == key or lease.until <= now]:
+            lease = self._leases.pop(lease_key)
+            if lease.remaining:
+                db.execute("UPDATE rate_limit_entries SET amount = amount - ? WHERE id = ?", (lease.remaining, lease.row_id))
+
+    def _return_leases(self):
+        with self._lock:
+            if not self._leases or self._db is None or self._pid != os.getpid():
+                return
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._return_expired_leases(self._db, float("inf"), None)
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                pass  # Unreturned entries just expire with the window
+
+    def _prune(self, db, now):
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        db.execute("DELETE FROM rate_limit_entries WHERE expires_at <= ?", (now,))
+        db.execute("DELETE FROM rate_limit_counters WHERE expires_at <= ?", (now,))
+        self._full_until = {k: until for k, until in self._full_until.items() if until > now}
+
+    # -- fixed window ---------------------------------------------------------
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        with self._lock:
+            return self._connect().execute(
+                "INSERT INTO rate_limit_counters (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, "
+                "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+                "RETURNING value",
+                (key, amount, now + expiry, now, now)
+            ).fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM rate_limit_counters WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT expires_at FROM rate_limit_counters WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return row[0] if row else now
+
+    # -- housekeeping ---------------------------------------------------------
+
+    def check(self):
+        try:
+            with self._lock:
+                self._connect().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._lock:
+            db = self._connect()
+            self._leases.clear()
+            self._full_until.clear()
+            deleted = db.execute("DELETE FROM rate_limit_entries").rowcount
+            deleted += db.execute("DELETE FROM rate_limit_counters").rowcount
+        return deleted
+
+    def clear(self, key):
+        with self._lock:
+            db = self._connect()
+            self._leases.pop(key, None)
+            self._full_until.pop(key, None)
+            db.execute("DELETE FROM rate_limit_entries WHERE key = ?", (key,))
+            db.execute("DELETE FROM rate_limit_counters WHERE key = ?", (key,))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "fast_hits": self.fast_hits,
+                "fast_rejects": self.fast_rejects,
+                "shared_hits": self.shared_hits,
+                "shared_rejects": self.shared_rejects,
+                "leases": len(self._leases),
+            }
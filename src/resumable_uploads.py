@@ -0,0 +1,239 @@
+import hashlib
+import os
+import secrets
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from extensions import db
+from file_janitor import file_janitor
+from models import UploadChunk, UploadSession
+from upload_utils import UPLOAD_CHUNK_SIZE, StoredFile
+
+SHA256_HEX = frozenset("0123456789abcdef")
+SPOOL_IN_MEMORY = 1024 * 1024  # Larger chunk bodies spill to the staging folder while they are verified
+
+
+class UploadRejected(Exception):
+    """The client sent something the upload protocol doesn't accept"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and set(value) <= SHA256_HEX
+
+
+def expire_sessions(limit=100, user_email=None):
+    """Drop sessions past ``expires_at``; runs in the caller's transaction.
+
+    Part files are queued for the file janitor, so they go once it commits.
+    """
+    query = select(UploadSession.id, UploadSession.path).where(UploadSession.expires_at < datetime.utcnow())
+    if user_email is not None:
+        query = query.where(UploadSession.user_email == user_email)
+    stale = db.session.execute(query.limit(limit)).all()
+    if not stale:
+        return 0
+    ids = [row.id for row in stale]
+    db.session.execute(delete(UploadChunk).where(UploadChunk.session_id.in_(ids)))
+    db.session.execute(delete(UploadSession).where(UploadSession.id.in_(ids)))
+    for row in stale:
+        file_janitor.schedule_path(row.path)
+    return len(stale)
+
+
+class ResumableUploads:
+    """Chunked uploads that survive dropped connections and worker restarts.
+
+    ``create`` makes a sparse part file of the final size in the staging
+    folder. Each chunk is checked against its SHA-256 and written at its own
+    offset, so chunks can arrive in any order, be retried, or go to different
+    workers. Received chunks are recorded in ``upload_chunks``. ``assemble``
+    hashes the finished file once; the caller then renames it into the blob
+    store, so the data is never copied. Sessions idle for
+    ``UPLOAD_SESSION_TTL`` seconds are expired.
+    """
+
+    def __init__(self):
+        self.app = None
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("RESUMABLE_MAX_FILE_SIZE", int(float(os.getenv("RESUMABLE_MAX_FILE_SIZE_MB", 200)) * 1024 * 1024))
+        config.setdefault("UPLOAD_CHUNK_BYTES", int(os.getenv("UPLOAD_CHUNK_BYTES", 4 * 1024 * 1024)))
+        config.setdefault("UPLOAD_SESSION_TTL", float(os.getenv("UPLOAD_SESSION_TTL", 86400)))
+        config.setdefault("UPLOAD_SESSIONS_PER_USER", int(os.getenv("UPLOAD_SESSIONS_PER_USER", 5)))
+        app.extensions["resumable_uploads"] = self
+        self.app = app
+
+    @property
+    def sessions_dir(self):
+        return os.path.join(self.app.config["UPLOAD_STAGING_FOLDER"], "sessions")
+
+    def _expires_at(self):
+        return datetime.utcnow() + timedelta(seconds=self.app.config["UPLOAD_SESSION_TTL"])
+
+    def create(self, user_email, filename, file_type, total_size, sha256=None, chunk_size=None):
+        """Start an upload; commits and returns the new ``UploadSession``"""
+        config = self.app.config
+        if not isinstance(total_size, int) or total_size <= 0:
+            raise UploadRejected("size must be a positive number of bytes")
+        if total_size > config["RESUMABLE_MAX_FILE_SIZE"]:
+            raise UploadRejected(f"File too large. Maximum size is {config['RESUMABLE_MAX_FILE_SIZE'] // (1024 * 1024)}MB", 413)
+        if sha256 is not None and not _is_sha256(sha256):
+            raise UploadRejected("sha256 must be 64 lowercase hex digits")
+        # Chunks travel as single requests, so they must fit under MAX_CONTENT_LENGTH
+        max_chunk = min(config["UPLOAD_CHUNK_BYTES"], config.get("MAX_CONTENT_LENGTH") or config["UPLOAD_CHUNK_BYTES"])
+        chunk_size = chunk_size or max_chunk
+        if not isinstance(chunk_size, int) or not 64 * 1024 <= chunk_size <= max_chunk:
+            raise UploadRejected(f"chunk_size must be between 65536 and {max_chunk} bytes")
+
+        expire_sessions(user_email=user_email)
+        active = db.session.query(func.count(UploadSession.id)).filter_by(user_email=user_email).scalar()
+        if active >= config["UPLOAD_SESSIONS_PER_USER"]:
+            db.session.commit()
+            raise UploadRejected("Too many unfinished uploads. Complete or cancel one first.", 429)
+
+        upload_id = secrets.token_hex(16)
+        path = os.path.join(self.sessions_dir, f"{upload_id}.part")
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        with open(path, "wb") as f:
+            f.truncate(total_size)  # Sparse: disk is only used as chunks arrive
+        session = UploadSession(
+            id=upload_id, user_email=user_email, filename=filename, file_type=file_type,
+            total_size=total_size, chunk_size=chunk_size, chunk_count=-(-total_size // chunk_size),
+            sha256=sha256, path=path, expires_at=self._expires_at()
+        )
+        db.session.add(session)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            os.remove(path)
+            raise
+        self._wake_janitor()  # Part files of sessions expired above
+        return session
+
+    def get(self, upload_id, user_email):
+        session = db.session.get(UploadSession, upload_id)
+        if session is None or session.user_email != user_email:
+            return None
+        return session
+
+    def received(self, session):
+        """Indexes of the chunks stored so far, ascending"""
+        return db.session.execute(
+            select(UploadChunk.index).where(UploadChunk.session_id == session.id).order_by(UploadChunk.index)
+        ).scalars().all()
+
+    def chunk_length(self, session, index):
+        if index == session.chunk_count - 1:
+            return session.total_size - session.chunk_size * index
+        return session.chunk_size
+
+    def _lock(self, session):
+        """``SELECT ... FOR UPDATE`` the session row; raises 410 once it is gone.
+
+        Chunk writes and completion both hold this lock while they touch the
+        part file, so a chunk can't change bytes that completion has hashed or
+        renamed into the blob store.
+        """
+        locked = db.session.query(UploadSession).filter_by(id=session.id) \
+            .with_for_update().populate_existing().first()
+        if locked is None:
+            raise UploadRejected("Upload session has expired or is already complete", 410)
+        return locked
+
+    def write_chunk(self, session, index, stream, sha256):
+        """Check one chunk, write it at its offset and record it; commits.
+
+        The body is spooled and verified first, so the session lock is only
+        held for the positioned write. A chunk whose bytes don't match
+        ``sha256`` is not recorded and the client simply sends it again.
+        Re-sending a stored chunk is harmless.
+        """
+        if not 0 <= index < session.chunk_count:
+            raise UploadRejected(f"Chunk index must be between 0 and {session.chunk_count - 1}")
+        if not _is_sha256(sha256):
+            raise UploadRejected("X-Chunk-SHA256 header with the chunk's SHA-256 is required")
+        expected = self.chunk_length(session, index)
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_IN_MEMORY, dir=self.app.config["UPLOAD_STAGING_FOLDER"]) as spool:
+            digest = hashlib.sha256()
+            written = 0
+            while written <= expected:
+                data = stream.read(min(UPLOAD_CHUNK_SIZE, expected + 1 - written))
+                if not data:
+                    break
+                digest.update(data)
+                written += len(data)
+                spool.write(data)
+            if written != expected:
+                raise UploadRejected(f"Chunk {index} must be exactly {expected} bytes")
+            if digest.hexdigest() != sha256:
+                raise UploadRejected(f"Chunk {index} failed its SHA-256 check; send it again", 422)
+
+            session = self._lock(session)
+            try:
+                with open(session.path, "r+b") as f:
+                    f.seek(index * session.chunk_size)
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, f, UPLOAD_CHUNK_SIZE)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except FileNotFoundError:
+                db.session.rollback()
+                raise UploadRejected("Upload session has expired", 410)
+
+        db.session.merge(UploadChunk(session_id=session.id, index=index, size=written, sha256=sha256))
+        session.expires_at = self._expires_at()
+        db.session.commit()
+
+    def assemble(self, session):
+        """Check the part file is complete and hash it; returns a ``StoredFile`` for ``BlobStore.adopt``.
+
+        Takes the session lock and leaves it held: the caller adopts the file
+        and drops the session in the same transaction, so no chunk write or
+        second completion can overlap.
+        """
+        session = self._lock(session)
+        count = db.session.query(func.count(UploadChunk.index)).filter_by(session_id=session.id).scalar()
+        if count != session.chunk_count:
+            raise UploadRejected(f"{session.chunk_count - count} chunks are still missing", 409)
+
+        digest = hashlib.sha256()
+        try:
+            with open(session.path, "rb") as f:
+                while True:
+                    data = f.read(1024 * 1024)
+                    if not data:
+                        break
+                    digest.update(data)
+        except FileNotFoundError:
+            raise UploadRejected("Upload session has expired", 410)
+        if session.sha256 and digest.hexdigest() != session.sha256:
+            raise UploadRejected("Assembled file doesn't match the sha256 given at start", 422)
+        return StoredFile(session.path, session.total_size, digest.hexdigest())
+
+    def finish(self, session):
+        """Drop the session rows; runs in the caller's transaction (the part file has been moved or is queued)"""
+        db.session.execute(delete(UploadChunk).where(UploadChunk.session_id == session.id))
+        db.session.execute(delete(UploadSession).where(UploadSession.id == session.id))
+
+    def cancel(self, session):
+        """Abandon an upload; commits"""
+        self.finish(session)
+        file_janitor.schedule_path(session.path)
+        db.session.commit()
+        self._wake_janitor()
+
+    def _wake_janitor(self):
+        janitor = self.app.extensions.get("file_janitor")
+        if janitor is not None:
+            janitor.wake()
+
+
+resumable_uploads = ResumableUploads()
@@ -0,0 +1,320 @@
+import heapq
+import math
+import re
+import struct
+import threading
+import zlib
+from array import array
+from collections import Counter, OrderedDict
+from sqlalchemy import and_, or_
+from extensions import db
+from models import DocumentChunk, DocumentIndex
+from embeddings import vector_store
+
+CLAUSE_MAX_CHARS = 1500
+CLAUSE_MIN_CHARS = 200
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_FORMAT_VERSION = 1
+RRF_K = 60  # Reciprocal rank fusion constant for hybrid retrieval
+
+# "1.", "1.2", "12.3.4)", "(a)", "(iv)", "A.", "Article 5", "Section 2.1", "Clause 7", "Schedule 1"
+CLAUSE_START = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*[.)]?\s|\([a-z0-9]{1,4}\)\s|[A-Z][.)]\s|"
+    r"(?:article|section|clause|schedule|annex|exhibit|appendix)\s+[\dIVXLC]+)",
+    re.IGNORECASE,
+)
+SENTENCE_END = re.compile(r"(?<=[.;:])\s+")
+TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been by can do does for from had has have if in into is it its
+may of on or shall such that the their then there these this those to under upon
+was were what when where which who will with within without would you your
+""".split())
+
+
+def _is_heading(line):
+    """Short lines in capitals or without closing punctuation read as headings"""
+    stripped = line.strip()
+    if not stripped or len(stripped) > 80:
+        return False
+    letters = [c for c in stripped if c.isalpha()]
+    if letters and all(c.isupper() for c in letters):
+        return True
+    return bool(CLAUSE_START.match(stripped)) and stripped[-1] not in ".;:,"
+
+
+def _split_long(text, max_chars):
+    """Split an oversized clause at sentence boundaries"""
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current = [], ""
+    for sentence in SENTENCE_END.split(text):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+        while len(current) > max_chars:
+            pieces.append(current[:max_chars])
+            current = current[max_chars:]
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_pages(pages, max_chars=CLAUSE_MAX_CHARS, min_chars=CLAUSE_MIN_CHARS):
+    """Split page texts into clause-sized chunks.
+
+    A new clause starts at numbered items ("4.2", "(b)", "Section 7") and at
+    headings; paragraph breaks end a clause once it is at least ``min_chars``
+    long. Returns dicts with ``page_number``, ``heading`` and ``content``.
+    """
+    chunks = []
+    lines, size, heading, page_start = [], 0, None, 1
+
+    def flush():
+        text = re.sub(r"[ \t]+", " ", "\n".join(lines)).strip()
+        if text:
+            for piece in _split_long(text, max_chars):
+                chunks.append({"page_number": page_start, "heading": heading, "content": piece})
+
+    for page_number, page in enumerate(pages, start=1):
+        for raw_line in page.splitlines():
+            line = raw_line.strip()
+            if not line:
+                if size >= min_chars:
+                    flush()
+                    lines, size = [], 0
+                continue
+            is_heading = _is_heading(line)
+            if lines and (is_heading or CLAUSE_START.match(line)):
+                flush()
+                lines, size = [], 0
+            if not lines:
+                page_start = page_number
+                if is_heading:
+                    heading = line[:255]
+            lines.append(line)
+            size += len(line)
+    flush()
+
+    for ordinal, chunk in enumerate(chunks):
+        chunk["ordinal"] = ordinal
+    return chunks
+
+
+def _stem(token):
+    """Very light suffix stripping so "terminate"/"termination" meet"""
+    for suffix in ("ations", "ation", "ings", "ing", "ies", "ed", "es", "s"):
+        if len(token) > len(suffix) + 3 and token.endswith(suffix):
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in TOKEN.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+class InvertedIndex:
+    """BM25 index over a document's chunks, stored as packed postings arrays.
+
+    Serialized layout (zlib-compressed)::
+
+        header   <IIIII version, chunk_count, term_count, posting_count, vocab_bytes
+        terms    newline-joined UTF-8 vocabulary, sorted
+        offsets  uint32[term_count + 1] - start of each term's postings
+        chunks   uint32[posting_count]  - chunk ordinals, ascending per term
+        tfs      uint16[posting_count]  - term frequency in that chunk
+        lengths  uint32[chunk_count]    - token count per chunk
+    """
+
+    HEADER = struct.Struct("<IIIII")
+
+    def __init__(self, terms, offsets, chunk_ids, tfs, lengths):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.chunk_ids = chunk_ids
+        self.tfs = tfs
+        self.lengths = lengths
+        self.chunk_count = len(lengths)
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        # BM25 length normalisation depends only on the chunk, so compute it once
+        avg = self.avg_length or 1.0
+        self.norms = [BM25_K1 * (1 - BM25_B + BM25_B * length / avg) for length in lengths]
+
+    @classmethod
+    def build(cls, chunk_texts):
+        postings = {}
+        lengths = array("I")
+        for ordinal, text in enumerate(chunk_texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((ordinal, min(tf, 0xFFFF)))
+
+        terms = sorted(postings)
+        offsets, chunk_ids, tfs = array("I", [0]), array("I"), array("H")
+        for term in terms:
+            for ordinal, tf in postings[term]:
+                chunk_ids.append(ordinal)
+                tfs.append(tf)
+            offsets.append(len(chunk_ids))
+        return cls(terms, offsets, chunk_ids, tfs, lengths)
+
+    def to_bytes(self):
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        vocab = "\n".join(terms).encode("utf-8")
+        header = self.HEADER.pack(INDEX_FORMAT_VERSION, self.chunk_count, len(terms), len(self.chunk_ids), len(vocab))
+        body = b"".join([
+            header, vocab, self.offsets.tobytes(), self.chunk_ids.tobytes(),
+            self.tfs.tobytes(), self.lengths.tobytes(),
+        ])
+        return zlib.compress(body, 6)
+
+    @classmethod
+    def from_bytes(cls, payload):
+        body = zlib.decompress(payload)
+        version, chunk_count, term_count, posting_count, vocab_len = cls.HEADER.unpack_from(body)
+        if version != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version {version}")
+        pos = cls.HEADER.size
+        vocab = body[pos:pos + vocab_len].decode("utf-8")
+        pos += vocab_len
+        terms = vocab.split("\n") if term_count else []
+
+        def take(typecode, count):
+            nonlocal pos
+            values = array(typecode)
+            end = pos + count * values.itemsize
+            values.frombytes(body[pos:end])
+            pos = end
+            return values
+
+        offsets = take("I", term_count + 1)
+        chunk_ids = take("I", posting_count)
+        tfs = take("H", posting_count)
+        lengths = take("I", chunk_count)
+        return cls(terms, offsets, chunk_ids, tfs, lengths)
+
+    def search(self, query, k=5):
+        """Return up to ``k`` ``(chunk_ordinal, score)`` pairs, best first"""
+        if not self.chunk_count:
+            return []
+        scores = {}
+        n = self.chunk_count
+        norms = self.norms
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            df = end - start
+            weight = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+            for ordinal, tf in zip(self.chunk_ids[start:end], self.tfs[start:end]):
+                scores[ordinal] = scores.get(ordinal, 0.0) + weight * tf / (tf + norms[ordinal])
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def chunk_search_text(chunk):
+    """Text a chunk is indexed under: its heading plus its content"""
+    return f"{chunk['heading'] or ''}\n{chunk['content']}"
+
+
+def build_clause_index(pages):
+    """Chunk extracted pages and build their index: returns ``(chunks, index)``"""
+    chunks = chunk_pages(pages)
+    index = InvertedIndex.build(chunk_search_text(chunk) for chunk in chunks)
+    return chunks, index
+
+
+class IndexCache:
+    """Small per-process LRU of deserialized indexes, keyed by document id"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, document_id, loader):
+        with self._lock:
+            index = self._entries.get(document_id)
+            if index is not None:
+                self._entries.move_to_end(document_id)
+                return index
+        payload = loader(document_id)
+        if payload is None:
+            return None
+        index = InvertedIndex.from_bytes(payload)
+        with self._lock:
+            self._entries[document_id] = index
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def evict(self, document_id):
+        with self._lock:
+            self._entries.pop(document_id, None)
+
+
+index_cache = IndexCache()
+
+
+def _bm25_search(document_ids, query, k):
+    def load(doc_id):
+        return db.session.query(DocumentIndex.payload).filter_by(document_id=doc_id).scalar()
+
+    hits = []
+    for document_id in document_ids:
+        index = index_cache.get(document_id, load)
+        if index is not None:
+            hits.extend((document_id, ordinal, score) for ordinal, score in index.search(query, k))
+    return heapq.nlargest(k, hits, key=lambda hit: hit[2])
+
+
+def _fuse(*rankings):
+    """Reciprocal rank fusion of several ``(document_id, ordinal, score)`` rankings"""
+    fused = {}
+    for ranking in rankings:
+        for rank, (document_id, ordinal, _) in enumerate(ranking):
+            key = (document_id, ordinal)
+            fused[key] = fused.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(((d, o, score) for (d, o), score in fused.items()), key=lambda hit: -hit[2])
+
+
+def search_clauses(document_ids, query, k=5, mode="hybrid"):
+    """Top-``k`` clauses across documents for ``query`` as dicts, best first.
+
+    ``mode`` is ``"bm25"`` (keyword), ``"vector"`` (hashed embeddings) or
+    ``"hybrid"`` (both, combined with reciprocal rank fusion).
+    """
+    if mode == "bm25":
+        hits = _bm25_search(document_ids, query, k)
+    elif mode == "vector":
+        hits = vector_store.search(document_ids, query, k)
+    else:
+        hits = _fuse(_bm25_search(document_ids, query, k), vector_store.search(document_ids, query, k))[:k]
+    if not hits:
+        return []
+
+    wanted = {}
+    for document_id, ordinal, _ in hits:
+        wanted.setdefault(document_id, []).append(ordinal)
+    rows = DocumentChunk.query.filter(or_(*[
+        and_(DocumentChunk.document_id == document_id, DocumentChunk.ordinal.in_(ordinals))
+        for document_id, ordinals in wanted.items()
+    ])).all()
+    by_key = {(row.document_id, row.ordinal): row for row in rows}
+    return [
+        {
+            "document_id": document_id,
+            "ordinal": ordinal,
+            "page_number": by_key[(document_id, ordinal)].page_number,
+            "heading": by_key[(document_id, ordinal)].heading,
+            "content": by_key[(document_id, ordinal)].content,
+            "score": round(score, 4),
+        }
+        for document_id, ordinal, score in hits
+        if (document_id, ordinal) in by_key
+    ]
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Document, User, UserStorage
+
+
+class QuotaExceeded(Exception):
+    """The upload would take the user over their storage quota"""
+
+    def __init__(self, used, quota, size):
+        super().__init__(f"Storage quota exceeded: {used + size} of {quota} bytes")
+        self.used = used
+        self.quota = quota
+        self.size = size
+
+
+class StorageLedger:
+    """Per-user document count and bytes, kept in ``user_storage``.
+
+    ``charge`` and ``release`` run in the caller's transaction, so the ledger
+    moves with the document rows. The quota check is part of the same
+    conditional UPDATE, so concurrent uploads can't overshoot it. A
+    background scan corrects drift against the documents table and
+    backfills missing rows, first when the app serves its first request and
+    then every ``STORAGE_RECONCILE_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.corrected = 0
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("STORAGE_QUOTA_MB", float(os.getenv("STORAGE_QUOTA_MB", 500)))  # Default per user; 0 = unlimited
+        config.setdefault("STORAGE_RECONCILE_INTERVAL", float(os.getenv("STORAGE_RECONCILE_INTERVAL", 3600)))
+        app.extensions["storage_ledger"] = self
+        app.before_request(self.start)
+        self.app = app
+
+    @property
+    def default_quota(self):
+        quota_mb = self.app.config["STORAGE_QUOTA_MB"] if self.app else 0
+        return int(quota_mb * 1024 * 1024) or None
+
+    def charge(self, user_email, size, count=1):
+        """Add an upload to the ledger; raises ``QuotaExceeded`` and changes nothing if it doesn't fit"""
+        limit = func.coalesce(UserStorage.quota_bytes, self.default_quota)  # NULL = unlimited
+        for _ in range(2):
+            result = db.session.execute(
+                update(UserStorage)
+                .where(UserStorage.user_email == user_email,
+                       or_(limit.is_(None), UserStorage.bytes_used + size <= limit))
+                .values(bytes_used=UserStorage.bytes_used + size,
+                        document_count=UserStorage.document_count + count,
+                        documents_version=UserStorage.documents_version + 1)
+            )
+            if result.rowcount:
+                return
+            row = db.session.get(UserStorage, user_email, populate_existing=True)
+            if row is not None:
+                raise QuotaExceeded(row.bytes_used, row.quota_bytes or self.default_quota, size)
+            try:
+                # First upload: start the row from what the documents table says
+                with db.session.begin_nested():
+                    db.session.add(self._counted_row(user_email))
+            except IntegrityError:
+                pass  # A concurrent upload created it; retry the update
+        raise RuntimeError(f"Could not update storage ledger for {user_email}")
+
+    def release(self, user_email, size, count=1):
+        """Take deleted documents off the ledger; runs in the caller's transaction.
+
+        Users without a row yet are left to the reconciliation scan.
+        """
+        db.session.execute(
+            update(UserStorage)
+            .where(UserStorage.user_email == user_email)
+            .values(bytes_used=UserStorage.bytes_used - size,
+                    document_count=UserStorage.document_count - count,
+                    documents_version=UserStorage.documents_version + 1)
+        )
+
+    def touch(self, user_emails):
+        """Bump the documents version of users whose listing changed otherwise; caller's transaction"""
+        db.session.execute(
+            update(UserStorage)
+            .where(UserStorage.user_email.in_(list(user_emails)))
+            .values(documents_version=UserStorage.documents_version + 1)
+        )
+
+    def documents_version(self, user_email):
+        """Changes with every upload, delete or file state change; None until the user has a row"""
+        row = db.session.get(UserStorage, user_email)
+        return row.documents_version if row is not None else None
+
+    def usage(self, user_email):
+        """One primary-key lookup"""
+        row = db.session.get(UserStorage, user_email)
+        quota = (row.quota_bytes if row is not None else None) or self.default_quota
+        used = row.bytes_used if row is not None else 0
+        return {
+            "document_count": row.document_count if row is not None else 0,
+            "bytes_used": used,
+            "quota_bytes": quota,
+            "remaining_bytes": max(quota - used, 0) if quota else None,
+            "reconciled_at": row.reconciled_at.isoformat() if row is not None and row.reconciled_at else None,
+        }
+
+    def _counted_row(self, user_email):
+        count, total = db.session.query(func.count(Document.id), func.coalesce(func.sum(Document.file_size), 0)) \
+            .filter(Document.user_email == user_email).one()
+        return UserStorage(user_email=user_email, document_count=count, bytes_used=total,
+                           reconciled_at=datetime.utcnow())
+
+    # -- reconciliation -------------------------------------------------------
+
+    def reconcile(self):
+        """Fix rows that disagree with the documents table; returns how many changed.
+
+        Users without a row get one, even with no documents, so every user
+        has a documents version. Rows that already agreed get their
+        ``reconciled_at`` moved up to when they were checked.
+        """
+        checked_at = datetime.utcnow()
+        totals = select(
+            Document.user_email,
+            func.count(Document.id).label("count"),
+            func.sum(Document.file_size).label("bytes")
+        ).group_by(Document.user_email).subquery()
+        drifted = db.session.execute(
+            select(User.email)
+            .outerjoin(totals, totals.c.user_email == User.email)
+            .outerjoin(UserStorage, UserStorage.user_email == User.email)
+            .where(or_(
+                UserStorage.user_email.is_(None),
+                UserStorage.document_count != func.coalesce(totals.c.count, 0),
+                UserStorage.bytes_used != func.coalesce(totals.c.bytes, 0),
+            ))
+        ).scalars().all()
+        db.session.commit()
+
+        corrected = 0
+        for user_email in drifted:
+            # Lock the row first so the recount sees any upload that was holding it
+            row = db.session.query(UserStorage).filter_by(user_email=user_email).with_for_update().first()
+            counted = self._counted_row(user_email)
+            if row is None:
+                db.session.add(counted)
+            elif (row.document_count, row.bytes_used) != (counted.document_count, counted.bytes_used):
+                print(f"🧮 Storage ledger for {user_email}: {row.bytes_used} -> {counted.bytes_used} bytes")
+                row.document_count, row.bytes_used = counted.document_count, counted.bytes_used
+                row.reconciled_at = counted.reconciled_at
+            else:
+                db.session.rollback()
+                continue
+            db.session.commit()
+            corrected += 1
+        # Rows fixed above were stamped later than checked_at
+        db.session.execute(
+            update(UserStorage)
+            .where(or_(UserStorage.reconciled_at.is_(None), UserStorage.reconciled_at < checked_at))
+            .values(reconciled_at=checked_at)
+        )
+        db.session.commit()
+        self.corrected += corrected
+        return corrected
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._reconcile_forever, name="storage-ledger", daemon=True)
+                self._thread.start()
+
+    def _reconcile_forever(self):
+        # The first pass runs straight away, so rows are backfilled right after a deploy
+        while True:
+            with self.app.app_context():
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Storage reconciliation failed: {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(self.app.config["STORAGE_RECONCILE_INTERVAL"])
+
+
+storage_ledger = StorageLedger()
@@ -0,0 +1,330 @@
+import heapq
+import json
+import os
+import stat
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, select, update
+from extensions import db
+from file_janitor import file_janitor
+from models import Blob, Document, StorageScan
+from resumable_uploads import expire_sessions
+from storage_ledger import storage_ledger
+
+# A pass runs these in order; each step handles a bounded slice and saves a cursor
+PHASES = ("blobs", "uploads", "documents", "vectors", "staging")
+DANGLING_SAMPLE_SIZE = 100
+HEX_PREFIXES = [f"{i:02x}" for i in range(256)]
+
+
+def scan_files(path):
+    """Yield ``os.DirEntry`` for every file under ``path``, streaming with ``os.scandir``"""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from scan_files(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+def record_file_state(condition, exists):
+    """Store whether the files of the matching documents are on disk.
+
+    Runs in the caller's transaction. Owners of documents whose state flips
+    get their documents version bumped, so cached listings are refetched.
+    """
+    changed = db.session.execute(
+        select(Document.user_email).where(condition, Document.file_exists != exists).distinct()
+    ).scalars().all()
+    db.session.execute(
+        update(Document).where(condition).values(file_exists=exists, file_checked_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False}
+    )
+    if changed:
+        storage_ledger.touch(changed)
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class UploadScanner:
+    """Background comparison of the upload folders with the database.
+
+    Finds files no row refers to (orphans, handed to the file janitor once
+    older than ``UPLOAD_SCAN_GRACE`` seconds) and ``Document`` rows whose file
+    is missing (dangling, recorded in ``Document.file_exists``). Each comparison is a set difference over one shard:
+    a blob hash prefix, one legacy user directory or a batch of rows. Progress
+    is checkpointed in ``storage_scans``, so a pass survives restarts and is
+    shared by all workers; the row lock keeps two processes off the same pass.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._requested = False
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault("UPLOAD_SCAN_INTERVAL", float(os.getenv("UPLOAD_SCAN_INTERVAL", 86400)))  # Between passes
+        config.setdefault("UPLOAD_SCAN_PAUSE", float(os.getenv("UPLOAD_SCAN_PAUSE", 0.2)))  # Between steps of a pass
+        config.setdefault("UPLOAD_SCAN_SHARDS_PER_STEP", int(os.getenv("UPLOAD_SCAN_SHARDS_PER_STEP", 8)))
+        config.setdefault("UPLOAD_SCAN_BATCH_SIZE", int(os.getenv("UPLOAD_SCAN_BATCH_SIZE", 1000)))
+        config.setdefault("UPLOAD_SCAN_GRACE", float(os.getenv("UPLOAD_SCAN_GRACE", 3600)))
+        config.setdefault("UPLOAD_SCAN_STAGING_MAX_AGE", float(os.getenv("UPLOAD_SCAN_STAGING_MAX_AGE", 86400)))
+        config.setdefault("UPLOAD_SCAN_REMOVE_ORPHANS", os.getenv("UPLOAD_SCAN_REMOVE_ORPHANS", "false").lower() == "true")
+        app.extensions["upload_scanner"] = self
+        app.before_request(self.start)
+        self.app = app
+
+    def request_pass(self):
+        """Start a pass now instead of waiting for ``UPLOAD_SCAN_INTERVAL``"""
+        self._requested = True
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="upload-scanner", daemon=True)
+                self._thread.start()
+
+    def report(self):
+        """The latest pass, finished or not; needs an app context"""
+        scan = StorageScan.query.order_by(StorageScan.id.desc()).first()
+        if scan is None:
+            return None
+        return {
+            "id": scan.id,
+            "phase": scan.phase,
+            "cursor": scan.cursor,
+            "files_seen": scan.files_seen,
+            "orphans_found": scan.orphans_found,
+            "orphans_queued": scan.orphans_queued,
+            "dangling_documents": scan.dangling_documents,
+            "dangling_sample": json.loads(scan.dangling_sample or "[]"),
+            "started_at": scan.started_at.isoformat() if scan.started_at else None,
+            "finished_at": scan.finished_at.isoformat() if scan.finished_at else None,
+        }
+
+    # -- driving a pass -------------------------------------------------------
+
+    def _worker(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    active = self.step()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Upload scan error: {e}")
+                    active = False
+                finally:
+                    db.session.remove()
+                if active:
+                    time.sleep(self.app.config["UPLOAD_SCAN_PAUSE"])
+                    continue
+                self._wake.wait(min(self.app.config["UPLOAD_SCAN_INTERVAL"], 300))
+                self._wake.clear()
+
+    def step(self):
+        """Advance the current pass by one bounded step; returns False when idle"""
+        scan = StorageScan.query.filter(StorageScan.finished_at.is_(None)) \
+            .order_by(StorageScan.id.desc()).with_for_update(skip_locked=True).first()
+        if scan is None:
+            if StorageScan.query.filter(StorageScan.finished_at.is_(None)).first() is not None:
+                db.session.rollback()
+                return False  # Another process is on this pass
+            last = StorageScan.query.order_by(StorageScan.id.desc()).first()
+            due = datetime.utcnow() - timedelta(seconds=self.app.config["UPLOAD_SCAN_INTERVAL"])
+            if last is not None and last.finished_at > due and not self._requested:
+                db.session.rollback()
+                return False
+            self._requested = False
+            scan = StorageScan(phase=PHASES[0])
+            db.session.add(scan)
+            db.session.flush()
+
+        if getattr(self, f"_scan_{scan.phase}")(scan):
+            position = PHASES.index(scan.phase) + 1
+            scan.cursor = None
+            if position < len(PHASES):
+                scan.phase = PHASES[position]
+            else:
+                scan.phase = "done"
+                scan.finished_at = datetime.utcnow()
+                print(f"🔎 Upload scan {scan.id}: {scan.files_seen} files, {scan.orphans_found} orphans, "
+                      f"{scan.dangling_documents} dangling documents")
+        scan.updated_at = datetime.utcnow()
+        db.session.commit()
+        janitor = self.app.extensions.get("file_janitor")
+        if janitor is not None and scan.orphans_queued:
+            janitor.wake()
+        return True
+
+    def _orphans(self, scan, found, queue):
+        """Count orphans and hand them to the file janitor (same transaction as the checkpoint)"""
+        scan.orphans_found += len(found)
+        if not self.app.config["UPLOAD_SCAN_REMOVE_ORPHANS"]:
+            return
+        for item in found:
+            queue(item)
+        scan.orphans_queued += len(found)
+
+    def _dangling(self, scan, document_ids):
+        if not document_ids:
+            return
+        scan.dangling_documents += len(document_ids)
+        sample = json.loads(scan.dangling_sample or "[]")
+        sample.extend(sorted(document_ids)[:DANGLING_SAMPLE_SIZE - len(sample)])
+        scan.dangling_sample = json.dumps(sample)
+
+    def _old_enough(self):
+        return time.time() - self.app.config["UPLOAD_SCAN_GRACE"]
+
+    # -- phases: each returns True once the phase is complete ------------------
+
+    def _scan_blobs(self, scan):
+        """Blob files vs ``blobs`` rows, one two-hex-digit prefix per shard"""
+        root = self.app.config["BLOB_FOLDER"]
+        start = HEX_PREFIXES.index(scan.cursor) + 1 if scan.cursor else 0
+        cutoff = self._old_enough()
+        for prefix in HEX_PREFIXES[start:start + self.app.config["UPLOAD_SCAN_SHARDS_PER_STEP"]]:
+            on_disk = {entry.name: entry.stat().st_mtime for entry in scan_files(os.path.join(root, prefix))}
+            # Hex digits sort before 'g', so this range is exactly the prefix
+            in_db = set(db.session.execute(
+                select(Blob.sha256).where(Blob.sha256 >= prefix, Blob.sha256 < prefix + "g")
+            ).scalars())
+            scan.files_seen += len(on_disk)
+            self._orphans(scan, [d for d in on_disk.keys() - in_db if on_disk[d] < cutoff], file_janitor.schedule_blob)
+            missing = in_db - on_disk.keys()
+            in_prefix = and_(Document.content_hash >= prefix, Document.content_hash < prefix + "g")
+            record_file_state(and_(in_prefix, Document.content_hash.notin_(missing)) if missing else in_prefix, True)
+            for chunk in _chunks(missing, 500):
+                dangling = Document.content_hash.in_(chunk)
+                self._dangling(scan, db.session.execute(select(Document.id).where(dangling)).scalars().all())
+                record_file_state(dangling, False)
+            scan.cursor = prefix
+        return scan.cursor == HEX_PREFIXES[-1]
+
+    def _scan_uploads(self, scan):
+        """Files in legacy per-user directories vs rows that still point at them"""
+        root = self.app.config["UPLOAD_FOLDER"]
+        try:
+            with os.scandir(root) as entries:
+                users = sorted(entry.name for entry in entries
+                               if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."))
+        except FileNotFoundError:
+            return True
+        remaining = [name for name in users if scan.cursor is None or name > scan.cursor]
+        cutoff = self._old_enough()
+        for name in remaining[:self.app.config["UPLOAD_SCAN_SHARDS_PER_STEP"]]:
+            on_disk = {entry.path: entry.stat().st_mtime for entry in scan_files(os.path.join(root, name))}
+            in_db = set(db.session.execute(
+                select(Document.file_path).where(Document.user_email == name, Document.content_hash.is_(None))
+            ).scalars())
+            scan.files_seen += len(on_disk)
+            self._orphans(scan, [p for p in on_disk.keys() - in_db if on_disk[p] < cutoff], file_janitor.schedule_path)
+            scan.cursor = name
+        return len(remaining) <= self.app.config["UPLOAD_SCAN_SHARDS_PER_STEP"]
+
+    def _scan_documents(self, scan):
+        """Legacy rows (no blob) whose file is gone, in id order"""
+        after = int(scan.cursor or 0)
+        rows = db.session.execute(
+            select(Document.id, Document.file_path)
+            .where(Document.content_hash.is_(None), Document.id > after)
+            .order_by(Document.id).limit(self.app.config["UPLOAD_SCAN_BATCH_SIZE"])
+        ).all()
+        missing = {row.id for row in rows if not os.path.exists(row.file_path)}
+        self._dangling(scan, list(missing))
+        record_file_state(Document.id.in_(missing), False)
+        record_file_state(Document.id.in_([row.id for row in rows if row.id not in missing]), True)
+        if rows:
+            scan.cursor = str(rows[-1].id)
+        return len(rows) < self.app.config["UPLOAD_SCAN_BATCH_SIZE"]
+
+    def _scan_vectors(self, scan):
+        """Embedding files of deleted documents, one range of document ids per step.
+
+        Files are named by document id, so up to the highest id in the table a
+        step looks up just the names in its range instead of listing a folder
+        that may hold millions of them. Files above that id have no row at all;
+        those are found by listing the folder, a batch at a time.
+        """
+        root = self.app.config["VECTOR_FOLDER"]
+        size = self.app.config["UPLOAD_SCAN_BATCH_SIZE"]
+        after = int(scan.cursor or 0)
+        highest = db.session.execute(select(func.max(Document.id))).scalar() or 0
+        if after < highest:
+            ids = list(range(after + 1, min(after + size, highest) + 1))
+            known = set(db.session.execute(
+                select(Document.id).where(Document.id > after, Document.id <= ids[-1])
+            ).scalars())
+        else:
+            try:
+                with os.scandir(root) as entries:
+                    stems = (entry.name[:-4] for entry in entries if entry.name.endswith(".npy"))
+                    ids = heapq.nsmallest(size, (int(stem) for stem in stems if stem.isdigit() and int(stem) > after))
+            except FileNotFoundError:
+                ids = []
+            known = set()
+        cutoff = self._old_enough()
+        orphans = []
+        for document_id in ids:
+            path = os.path.join(root, f"{document_id}.npy")
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            scan.files_seen += 1
+            if document_id not in known and mtime < cutoff:
+                orphans.append(path)
+        self._orphans(scan, orphans, file_janitor.schedule_path)
+        if ids:
+            scan.cursor = str(ids[-1])
+        return after >= highest and len(ids) < size
+
+    def _scan_staging(self, scan):
+        """Spool files left behind by uploads that never finished, then expired resumable sessions.
+
+        Spool names are random, so each step takes the next batch in name order
+        after the cursor; only those are stat'ed.
+        """
+        size = self.app.config["UPLOAD_SCAN_BATCH_SIZE"]
+        cutoff = time.time() - self.app.config["UPLOAD_SCAN_STAGING_MAX_AGE"]
+        folder = self.app.config["UPLOAD_STAGING_FOLDER"]
+        try:
+            with os.scandir(folder) as entries:
+                names = heapq.nsmallest(size, (entry.name for entry in entries
+                                               if scan.cursor is None or entry.name > scan.cursor))
+        except FileNotFoundError:
+            names = []
+        if names:
+            stale = []
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    info = os.lstat(path)
+                except FileNotFoundError:
+                    continue  # Finished while we looked
+                if stat.S_ISREG(info.st_mode) and info.st_mtime < cutoff:
+                    stale.append(path)
+            scan.files_seen += len(stale)
+            self._orphans(scan, stale, file_janitor.schedule_path)
+            scan.cursor = names[-1]
+            return False
+        # expire_sessions queues the part files itself; they live in the "sessions" subfolder skipped above
+        return expire_sessions(limit=size) < size
+
+
+upload_scanner = UploadScanner()
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+from typing import NamedTuple
+from flask import Request, current_app
+
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB
+
+
+class StoredFile(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+
+
+class HashingSpoolFile:
+    """Temp file that counts and hashes bytes as the multipart parser writes them.
+
+    The file lives in the upload staging folder (same filesystem as the final
+    location) so committing it is a single atomic rename.
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        self._file = os.fdopen(fd, "w+b")
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def commit(self, dest_path) -> StoredFile:
+        """Close the spool and rename it to ``dest_path``"""
+        self._file.close()
+        os.replace(self.path, dest_path)
+        self.committed = True
+        return StoredFile(dest_path, self.size, self.hexdigest())
+
+    def close(self):
+        """Close the spool, discarding the temp file unless it was committed"""
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush/readline etc. go straight to the temp file
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request class that spools uploaded files straight into the staging folder"""
+
+    @property
+    def max_content_length(self):
+        """``MAX_CONTENT_LENGTH``, unless ``ENDPOINT_BODY_LIMITS`` has one for this endpoint"""
+        limits = current_app.config.get("ENDPOINT_BODY_LIMITS") or {}
+        if self.endpoint in limits:
+            return limits[self.endpoint]
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        staging_dir = current_app.config["UPLOAD_STAGING_FOLDER"]
+        return HashingSpoolFile(staging_dir)
+
+
+def spool_stream(stream, staging_dir, chunk_size=UPLOAD_CHUNK_SIZE) -> HashingSpoolFile:
+    """Copy ``stream`` into a new spool in one chunked pass, hashing as it goes"""
+    spool = HashingSpoolFile(staging_dir)
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def stream_to_file(stream, dest_path, staging_dir, chunk_size=UPLOAD_CHUNK_SIZE) -> StoredFile:
+    """Copy ``stream`` to ``dest_path`` in one chunked pass, hashing as it goes"""
+    spool = spool_stream(stream, staging_dir, chunk_size)
+    try:
+        return spool.commit(dest_path)
+    finally:
+        spool.close()
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from extensions import db
+from models import User
+
+# Everything templates and routes read from current_user
+SNAPSHOT_FIELDS = (
+    "email", "first_name", "last_name", "phone", "gender", "date_of_birth",
+    "created_at", "email_verified", "phone_verified",
+)
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of a user's profile fields, safe to share across requests"""
+
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("UserSnapshot is read-only; load the User model to make changes")
+
+    def get_id(self):
+        return self.email
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.email}>"
+
+
+class UserCache:
+    """Per-process TTL + LRU cache of ``UserSnapshot`` objects for the session loader.
+
+    Changes committed through this process evict the entry immediately;
+    other workers see them once ``USER_CACHE_TTL`` seconds have passed.
+    """
+
+    def __init__(self):
+        self.ttl = 30.0
+        self.max_entries = 4096
+        self._entries = OrderedDict()  # email -> (expires_at, snapshot)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        app.config.setdefault("USER_CACHE_TTL", float(os.getenv("USER_CACHE_TTL", 30)))
+        app.config.setdefault("USER_CACHE_SIZE", int(os.getenv("USER_CACHE_SIZE", 4096)))
+        self.ttl = app.config["USER_CACHE_TTL"]
+        self.max_entries = app.config["USER_CACHE_SIZE"]
+        if not event.contains(db.session, "after_commit", _evict_committed_users):
+            event.listen(User, "after_update", _mark_user_changed)
+            event.listen(User, "after_delete", _mark_user_changed)
+            event.listen(db.session, "after_commit", _evict_committed_users)
+        app.extensions["user_cache"] = self
+
+    def get(self, email):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(email)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def put(self, user):
+        snapshot = UserSnapshot(user)
+        with self._lock:
+            self._entries[snapshot.email] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(snapshot.email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+
+user_cache = UserCache()
+
+
+def _mark_user_changed(mapper, connection, target):
+    # Evicted on commit, so a concurrent load can't re-cache the old row
+    object_session(target).info.setdefault("changed_users", set()).add(target.email)
+
+
+def _evict_committed_users(session):
+    for email in session.info.pop("changed_users", ()):
+        user_cache.invalidate(email)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures: the full app on SQLite with a logged-in user, and bare apps for testing one service
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from flask import Flask
+
+from app import create_app
+from extensions import db
+from models import User
+
+EMAIL = "u@example.com"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "app_config(**config): config overrides for the app fixture")
+
+
+def add_user(email=EMAIL, **fields):
+    """Add a user to the current session; the caller commits"""
+    user = User(email=email, first_name="U", last_name="X", gender="other",
+                date_of_birth=date(1990, 1, 1), password_hash="x", **fields)
+    db.session.add(user)
+    return user
+
+
+@pytest.fixture
+def app(request, tmp_path):
+    """The whole application on SQLite with one verified user.
+
+    Tests override config with ``@pytest.mark.app_config(...)`` on the test
+    or the module; the marker closest to the test wins.
+    """
+    config = {}
+    for marker in reversed(list(request.node.iter_markers("app_config"))):
+        config.update(marker.kwargs)
+    uploads = tmp_path / "uploads"
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {},
+        "WTF_CSRF_ENABLED": False,
+        "RATELIMIT_ENABLED": False,
+        "UPLOAD_FOLDER": str(uploads),
+        "UPLOAD_STAGING_FOLDER": str(uploads / ".incoming"),
+        "BLOB_FOLDER": str(uploads / ".blobs"),
+        "VECTOR_FOLDER": str(uploads / ".vectors"),
+        **config
+    })
+    with app.app_context():
+        db.create_all()
+        add_user(email_verified=True)
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def login(app):
+    """Returns a test client with a session for the given user"""
+    def login(email=EMAIL):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = email
+            session["_fresh"] = True
+        return client
+    return login
+
+
+@pytest.fixture
+def client(login):
+    return login()
+
+
+@pytest.fixture
+def bare_app(tmp_path):
+    """Returns a factory for a plain Flask app with just the given services and one user"""
+    def make(*services, **config):
+        app = Flask(__name__)
+        app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}", **config)
+        db.init_app(app)
+        for service in services:
+            service.init_app(app)
+        with app.app_context():
+            db.create_all()
+            add_user()
+            db.session.commit()
+        return app
+    return make
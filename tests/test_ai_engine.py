@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the batching AI response engine
+"""
+
+import asyncio
+
+import pytest
+
+from ai_engine import EngineBusy, EngineTimeout, ResponseEngine, StubBackend
+
+CLAUSES = [{
+    "document_id": 1, "ordinal": 0, "page_number": 2, "heading": "3. FEES",
+    "content": "3.1 The Customer shall pay all invoices within 45 days.", "score": 1.0,
+}]
+
+
+class RecordingBackend(StubBackend):
+    """Stub backend that remembers which questions were batched together"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.batches = []
+
+    async def generate_batch(self, prompts, emit):
+        self.batches.append([question for question, _ in prompts])
+        await super().generate_batch(prompts, emit)
+
+
+class SlowBackend(StubBackend):
+    async def generate_batch(self, prompts, emit):
+        await asyncio.sleep(1)
+
+
+def make_engine(backend, **limits):
+    engine = ResponseEngine()
+    engine.configure(backend, **limits)
+    return engine
+
+
+def test_generate_matches_streamed_chunks():
+    engine = make_engine(StubBackend())
+
+    answer = engine.generate("a@x.com", "When are invoices due?", CLAUSES)
+    streamed = "".join(engine.iter_chunks(engine.submit("a@x.com", "When are invoices due?", CLAUSES)))
+
+    assert answer == streamed
+    assert "45 days" in answer
+
+
+def test_batches_are_filled_round_robin_across_users():
+    backend = RecordingBackend(batch_latency=0.05)
+    engine = make_engine(backend, max_batch_size=2, max_in_flight=1, batch_window=0.05)
+
+    requests = [engine.submit("busy@x.com", f"busy {i}", CLAUSES) for i in range(3)]
+    requests.append(engine.submit("other@x.com", "other 0", CLAUSES))
+    for request in requests:
+        request.future.result(timeout=5)
+
+    assert backend.batches[0] == ["busy 0", "other 0"]
+    assert engine.stats()["completed"] == 4
+
+
+def test_per_user_limit_rejects_with_engine_busy():
+    engine = make_engine(StubBackend(batch_latency=0.2), max_pending_per_user=1)
+
+    engine.submit("a@x.com", "first", CLAUSES)
+    with pytest.raises(EngineBusy):
+        engine.submit("a@x.com", "second", CLAUSES)
+    engine.submit("b@x.com", "someone else", CLAUSES)
+
+
+def test_slow_backend_times_out():
+    engine = make_engine(SlowBackend(), timeout=0.05)
+
+    with pytest.raises(EngineTimeout):
+        engine.generate("a@x.com", "anything", CLAUSES)
+    assert engine.stats()["timeouts"] == 1
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the answer cache
+"""
+
+import time
+
+from answer_cache import AnswerCache, make_key
+
+
+def make_cache(path=None, max_entries=1024, ttl=60):
+    cache = AnswerCache()
+    cache.max_entries = max_entries
+    cache.ttl = ttl
+    cache.path = path
+    if path:
+        cache._open_disk()
+    return cache
+
+
+def test_key_ignores_case_punctuation_and_document_order():
+    a = make_key(["h2", "h1"], "What is the termination clause?", "stub-1")
+    b = make_key(["h1", "h2"], "what is the  TERMINATION clause", "stub-1")
+
+    assert a == b
+    assert a != make_key(["h1", "h2"], "What is the termination clause?", "stub-2")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = make_cache(max_entries=2)
+    cache.put("a", {"response": "A"})
+    cache.put("b", {"response": "B"})
+    cache.get("a")
+    cache.put("c", {"response": "C"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"response": "A"}
+    assert cache.stats()["hits"] == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = make_cache(ttl=0.01)
+    cache.put("a", {"response": "A"})
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    make_cache(path).put("a", {"response": "A", "sources": []})
+
+    restarted = make_cache(path)
+
+    assert restarted.get("a") == {"response": "A", "sources": []}
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Tests for the multi-file /upload-documents endpoint
+"""
+
+import io
+import time
+
+import pytest
+
+from extensions import db
+from models import Chat, Document, DocumentExtraction
+
+pytestmark = pytest.mark.app_config(EXTRACTION_WORKERS=1)
+
+
+def wait_for_extractions(app, timeout=30):
+    """Let the background jobs finish before the next test re-binds the shared service"""
+    deadline = time.time() + timeout
+    with app.app_context():
+        while DocumentExtraction.query.filter(DocumentExtraction.status.in_(["queued", "running"])).count():
+            assert time.time() < deadline, "extraction did not finish"
+            time.sleep(0.05)
+            db.session.remove()
+
+
+def upload(client, url, files, field="files"):
+    data = {field: [(io.BytesIO(body), name) for name, body in files]}
+    return client.post(url, data=data, content_type="multipart/form-data")
+
+
+def test_results_are_per_file_and_in_order(app, client):
+    response = upload(client, "/upload-documents", [
+        ("a.txt", b"first"), ("tool.exe", b"MZ"), ("b.md", b"second"), ("c.txt", b"first"),
+    ])
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["uploaded"], body["rejected"]) == (3, 1)
+    results = body["results"]
+    assert [(r["filename"], r["status"]) for r in results] == [
+        ("a.txt", "uploaded"), ("tool.exe", "rejected"), ("b.md", "uploaded"), ("c.txt", "uploaded"),
+    ]
+    assert results[1]["error"] == "File type not allowed"
+    assert all("deduplicated" not in r for r in results)  # Would tell whether anyone else has the same file
+    with app.app_context():
+        ids = [r["document_id"] for r in results if r["status"] == "uploaded"]
+        assert [d.original_filename for d in Document.query.order_by(Document.id)] == ["a.txt", "b.md", "c.txt"]
+        assert sorted(d.id for d in Document.query) == sorted(ids)
+        assert Chat.query.count() == 3
+    wait_for_extractions(app)
+
+
+def test_only_rejected_files_is_a_bad_request(client):
+    response = upload(client, "/upload-documents", [("tool.exe", b"MZ")])
+
+    assert response.status_code == 400
+    assert response.get_json()["results"] == [
+        {"filename": "tool.exe", "status": "rejected", "error": "File type not allowed"}
+    ]
+
+
+@pytest.mark.app_config(BATCH_UPLOAD_MAX_FILES=2)
+def test_file_count_is_capped(app, client):
+    response = upload(client, "/upload-documents", [("a.txt", b"a"), ("b.txt", b"b"), ("c.txt", b"c")])
+
+    assert response.status_code == 400
+    assert "At most 2 files" in response.get_json()["error"]
+    with app.app_context():
+        assert Document.query.count() == 0
+
+
+@pytest.mark.app_config(MAX_CONTENT_LENGTH=4096, ENDPOINT_BODY_LIMITS={"upload_documents": 64 * 1024})
+def test_batch_body_limit_overrides_max_content_length(app, client):
+    files = [(f"{i}.txt", bytes([65 + i]) * 3000) for i in range(3)]
+
+    assert upload(client, "/upload-documents", files).status_code == 200
+    assert upload(client, "/upload-document", files[:2], field="file").status_code == 413  # Still the global limit
+    assert upload(client, "/upload-documents", files * 8).status_code == 413
+    wait_for_extractions(app)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed blob store and blob references
+"""
+
+import hashlib
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+from blob_store import BlobStore, acquire_blob, acquire_blobs
+from extensions import db
+from models import Blob
+from upload_utils import StoredFile
+
+
+def test_acquire_blobs_counts_duplicates_and_creates_missing_rows(bare_app):
+    app = bare_app()
+
+    with app.app_context():
+        acquire_blob("a" * 64, 1)
+        db.session.commit()
+
+        acquire_blobs([StoredFile("/x", 1, "a" * 64), StoredFile("/y", 5, "b" * 64), StoredFile("/y", 5, "b" * 64)])
+        db.session.commit()
+
+        assert [(b.sha256, b.size, b.ref_count) for b in Blob.query.order_by(Blob.sha256)] == [
+            ("a" * 64, 1, 2), ("b" * 64, 5, 2)
+        ]
+
+
+def test_adopt_keeps_one_copy_and_rewrites_missing_blobs(tmp_path):
+    staging = tmp_path / "incoming"
+    staging.mkdir()
+    store = BlobStore(str(tmp_path / "blobs"), str(staging))
+    body = b"same content"
+    digest = hashlib.sha256(body).hexdigest()
+
+    first = store.stage(FileStorage(io.BytesIO(body), "a.txt"))
+    assert (first.size, first.sha256) == (len(body), digest)
+    stored, created = store.adopt(*first)
+    assert created and stored.path == store.path_for(digest)
+
+    second = store.stage(FileStorage(io.BytesIO(body), "b.txt"))
+    assert store.adopt(*second) == (stored, False)
+    assert not os.path.exists(second.path)  # The duplicate was discarded
+
+    os.remove(stored.path)  # e.g. removed by the janitor before this upload took its reference
+    third = store.stage(FileStorage(io.BytesIO(body), "c.txt"))
+    assert store.adopt(*third) == (stored, True)
+    with open(stored.path, "rb") as f:
+        assert f.read() == body
+    assert os.listdir(staging) == []
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the Server-Sent Events chat endpoint with the stub AI backend
+"""
+
+import json
+
+import pytest
+
+from conftest import EMAIL
+from extensions import db
+from models import Chat, ChatMessage, Document, DocumentChunk, DocumentIndex
+from retrieval import build_clause_index
+
+PAGES = ["1. CONFIDENTIALITY\n1.1 Each party keeps Confidential Information secret for five years."]
+
+pytestmark = pytest.mark.app_config(AI_BACKEND="stub", RETRIEVAL_MODE="bm25")
+
+
+@pytest.fixture
+def chat(app, tmp_path):
+    """A chat about one indexed document; returns (chat_id, document_id)"""
+    with app.app_context():
+        document = Document(user_email=EMAIL, filename="nda.txt", original_filename="nda.txt",
+                            file_path=str(tmp_path / "uploads" / "nda.txt"), file_size=1, file_type="text/plain")
+        db.session.add(document)
+        db.session.flush()
+        chunks, index = build_clause_index(PAGES)
+        db.session.add_all([DocumentChunk(document_id=document.id, **chunk) for chunk in chunks])
+        db.session.add(DocumentIndex(document_id=document.id, chunk_count=len(chunks),
+                                     term_count=len(index.term_ids), payload=index.to_bytes()))
+        chat = Chat(user_email=EMAIL, document_id=document.id, title="Chat about nda.txt")
+        db.session.add(chat)
+        db.session.commit()
+        return chat.id, document.id
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_sends_sources_tokens_then_done_and_saves_the_answer(app, client, chat):
+    chat_id, document_id = chat
+
+    response = client.post("/chat-message/stream", json={"chat_id": chat_id, "message": "How long is confidentiality?"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = parse_events(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[0] == "sources" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+
+    sources = events[0][1]["sources"]
+    assert sources and sources[0]["document_id"] == document_id
+    answer = "".join(payload["text"] for name, payload in events if name == "token")
+    assert answer
+    with app.app_context():
+        messages = ChatMessage.query.filter_by(chat_id=chat_id).order_by(ChatMessage.id).all()
+        assert [(m.role, m.content) for m in messages] == [
+            ("user", "How long is confidentiality?"), ("assistant", answer)
+        ]
+        assert events[-1][1]["message_id"] == messages[-1].id
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the database health monitor's circuit breaker
+"""
+
+import shutil
+import time
+
+from flask import Flask
+from sqlalchemy.pool import NullPool
+
+from db_health import CLOSED, HALF_OPEN, OPEN, DatabaseHealth
+from extensions import db
+
+
+class RecordingHealth(DatabaseHealth):
+    """Remembers the circuit state each ping ran in"""
+
+    def __init__(self):
+        super().__init__()
+        self.ping_states = []
+
+    def _ping(self):
+        self.ping_states.append(self.state)
+        super()._ping()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_circuit_opens_fails_fast_probes_and_closes(tmp_path):
+    folder = tmp_path / "db"
+    folder.mkdir()
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{folder / 'health.db'}",
+        SQLALCHEMY_ENGINE_OPTIONS={"poolclass": NullPool},  # Every ping opens the file again
+        DB_HEALTH_INTERVAL=0.02,
+        DB_HEALTH_RETRY_INTERVAL=0.2,  # Slow enough to observe each step
+        DB_HEALTH_FAILURE_THRESHOLD=3,
+    )
+    db.init_app(app)
+    health = RecordingHealth()
+    health.init_app(app)
+
+    assert health.available()
+    wait_for(lambda: health.last_ok_at is not None)
+
+    shutil.rmtree(folder)  # SQLite can't open a file in a missing folder
+    wait_for(lambda: health.consecutive_failures >= 1)
+    assert health.state == CLOSED and health.available()  # Below the threshold
+    wait_for(lambda: health.state == OPEN)
+    assert health.consecutive_failures >= 3 and health.opened_at is not None
+
+    started = time.perf_counter()
+    assert not health.available()
+    assert time.perf_counter() - started < 0.01  # Read from the cached state
+
+    wait_for(lambda: HALF_OPEN in health.ping_states)
+    assert health.snapshot()["state"] in (OPEN, HALF_OPEN)
+
+    folder.mkdir()
+    wait_for(lambda: health.state == CLOSED)
+    assert health.available()
+    assert health.consecutive_failures == 0 and health.opened_at is None
+
+
+def test_request_failures_count_toward_the_threshold():
+    app = Flask(__name__)
+    app.config["DB_HEALTH_FAILURE_THRESHOLD"] = 2
+    health = DatabaseHealth()
+    health.init_app(app)
+
+    health.record_failure(RuntimeError("connection reset"), wake=False)
+    assert health.state == CLOSED
+    health.record_failure(RuntimeError("connection reset"), wake=False)
+    assert health.state == OPEN and health.snapshot()["last_error"] == "connection reset"
+
+    health.record_success()
+    assert health.state == CLOSED and health.consecutive_failures == 0
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for /download-document: ownership, Range, conditional GETs and X-Accel-Redirect
+"""
+
+import hashlib
+import os
+
+import pytest
+
+from conftest import EMAIL, add_user
+from extensions import db
+from models import Blob, Document
+
+BODY = b"0123456789abcdefghij"
+DIGEST = hashlib.sha256(BODY).hexdigest()
+
+
+@pytest.fixture
+def document(app):
+    """A stored blob owned by the test user, and a second user; returns (document_id, path)"""
+    with app.app_context():
+        add_user("other@example.com", email_verified=True)
+        path = os.path.join(app.config["BLOB_FOLDER"], DIGEST[:2], DIGEST[2:4], DIGEST)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(BODY)
+        db.session.add(Blob(sha256=DIGEST, size=len(BODY), ref_count=1))
+        document = Document(user_email=EMAIL, filename="a.txt", original_filename="a.txt",
+                            file_path=path, file_size=len(BODY), file_type="text/plain", content_hash=DIGEST)
+        db.session.add(document)
+        db.session.commit()
+        return document.id, path
+
+
+def test_other_users_document_is_not_found(login, document):
+    document_id, _ = document
+
+    response = login("other@example.com").get(f"/download-document/{document_id}")
+
+    assert response.status_code == 404
+
+
+def test_range_and_conditional_requests(client, document):
+    document_id, _ = document
+
+    response = client.get(f"/download-document/{document_id}")
+    assert response.status_code == 200 and response.data == BODY
+    assert response.headers["ETag"] == f'"{DIGEST}"'
+    assert "private" in response.headers["Cache-Control"]
+
+    response = client.get(f"/download-document/{document_id}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 0-9/{len(BODY)}"
+    assert response.data == BODY[:10]
+
+    response = client.get(f"/download-document/{document_id}", headers={"If-None-Match": f'"{DIGEST}"'})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_missing_file_is_recorded(app, client, document):
+    document_id, path = document
+    os.remove(path)
+
+    response = client.get(f"/download-document/{document_id}")
+
+    assert response.status_code == 404
+    with app.app_context():
+        assert db.session.get(Document, document_id).file_exists is False
+
+
+@pytest.mark.app_config(DOWNLOAD_ACCEL_PREFIX="/protected-uploads/")
+def test_accel_redirect_hands_the_file_to_nginx(client, document):
+    document_id, _ = document
+
+    response = client.get(f"/download-document/{document_id}?download=1")
+
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == f"/protected-uploads/.blobs/{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}"
+    assert response.headers["Content-Disposition"] == "attachment; filename=a.txt"
+    assert response.data == b""
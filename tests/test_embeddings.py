@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for hashed clause embeddings and memory-mapped vector search
+"""
+
+import os
+
+import numpy as np
+from embeddings import VectorStore, embed_chunks, save_vectors
+
+
+def make_store(tmp_path):
+    store = VectorStore()
+    store.root = str(tmp_path)
+    return store
+
+
+def test_chunk_matrix_rows_are_unit_length():
+    matrix = embed_chunks(["Payment is due within 30 days.", "Either party may terminate."])
+
+    assert matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+
+
+def test_search_ranks_across_documents(tmp_path):
+    store = make_store(tmp_path)
+    save_vectors(store.path_for(1), embed_chunks([
+        "The Customer shall pay all invoices within 45 days.",
+        "This Agreement is governed by the laws of England.",
+    ]))
+    save_vectors(store.path_for(2), embed_chunks([
+        "Either party may terminate this Agreement on 30 days written notice.",
+        "Confidential information must be kept secret.",
+    ]))
+
+    hits = store.search([1, 2, 3], "terminate the agreement with written notice", k=2)
+
+    assert hits[0][:2] == (2, 0)
+    assert all(score > 0 for _, _, score in hits)
+
+
+def test_removed_document_is_no_longer_searched(tmp_path):
+    store = make_store(tmp_path)
+    save_vectors(store.path_for(7), embed_chunks(["Late payments accrue interest."]))
+    assert store.search([7], "late payment interest")
+
+    os.remove(store.path_for(7))  # As the file janitor does after the delete commits
+    store.evict(7)
+
+    assert store.search([7], "late payment interest") == []
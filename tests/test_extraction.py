@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for text extraction parsers and the background extraction service
+"""
+
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import EMAIL
+from embeddings import vector_store
+from extensions import db
+from extraction import EXTRACTORS, ExtractionService, UnsupportedDocument, extract_pages, run_extraction
+from models import Blob, Document, DocumentChunk, DocumentExtraction, DocumentIndex, DocumentPage
+
+TEXT = b"1. TERM\nThis Agreement lasts two years.\f2. FEES\nInvoices are due within 30 days."
+
+
+def test_extractors_cover_the_text_formats():
+    assert {"txt", "md", "rtf", "docx", "odt", "pptx", "pdf"} <= set(EXTRACTORS)
+    assert EXTRACTORS["txt"] is EXTRACTORS["md"]
+
+
+def test_plain_text_pages_split_on_form_feeds(tmp_path):
+    path = tmp_path / "a.md"
+    path.write_bytes(b"  first page \n\fsecond page\n")
+
+    assert extract_pages(str(path), "MD") == ["first page", "second page"]
+    with pytest.raises(UnsupportedDocument):
+        extract_pages(str(path), "ppt")
+
+
+def test_run_extraction_indexes_and_writes_vectors(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(TEXT)
+    vectors = tmp_path / "vectors" / "1.npy"
+
+    result = run_extraction(str(path), "txt", str(vectors))
+
+    assert result["pages"] == ["1. TERM\nThis Agreement lasts two years.", "2. FEES\nInvoices are due within 30 days."]
+    assert [chunk["heading"] for chunk in result["chunks"]] == ["1. TERM", "2. FEES"]
+    assert result["term_count"] > 0 and result["index_payload"]
+    assert vectors.exists()
+
+    with pytest.raises(FileNotFoundError):
+        run_extraction(str(tmp_path / "missing.txt"), "txt", str(tmp_path / "vectors" / "2.npy"))
+    assert not (tmp_path / "vectors" / "2.npy").exists()
+
+
+@pytest.fixture
+def service():
+    service = ExtractionService()
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def app(bare_app, service, tmp_path):
+    return bare_app(vector_store, service, VECTOR_FOLDER=str(tmp_path / "vectors"), EXTRACTION_WORKERS=1)
+
+
+def add_document(path, content_hash=None):
+    if content_hash and not db.session.get(Blob, content_hash):
+        db.session.add(Blob(sha256=content_hash, size=1, ref_count=1))
+    document = Document(user_email=EMAIL, filename=os.path.basename(path), original_filename=os.path.basename(path),
+                        file_path=path, file_size=1, file_type="text/plain", content_hash=content_hash)
+    db.session.add(document)
+    db.session.flush()
+    db.session.add(DocumentExtraction(document_id=document.id))
+    db.session.commit()
+    return document.id
+
+
+def test_service_marks_jobs_done_failed_or_unsupported(app, service, tmp_path):
+    good = tmp_path / "good.txt"
+    good.write_bytes(TEXT)
+    broken = tmp_path / "broken.docx"
+    broken.write_bytes(b"not a zip file")
+
+    with app.app_context():
+        jobs = [(add_document(str(good)), str(good), "txt"),
+                (add_document(str(broken)), str(broken), "docx"),
+                (add_document(str(tmp_path / "old.ppt")), str(tmp_path / "old.ppt"), "ppt")]
+        assert [db.session.get(DocumentExtraction, job[0]).status for job in jobs] == ["queued"] * 3
+
+        for future in service.submit_many(jobs):
+            future.result(timeout=60)
+        db.session.expire_all()
+
+        done, failed, unsupported = [db.session.get(DocumentExtraction, job[0]) for job in jobs]
+        assert (done.status, done.page_count, done.chunk_count) == ("done", 2, 2)
+        assert done.started_at <= done.finished_at
+        assert DocumentPage.query.filter_by(document_id=done.document_id).count() == 2
+        assert failed.status == "failed" and failed.error
+        assert unsupported.status == "unsupported" and "No text extractor" in unsupported.error
+        assert DocumentPage.query.filter(DocumentPage.document_id != done.document_id).count() == 0
+
+
+def test_deduplicated_upload_reuses_the_extracted_pages(app, service, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(TEXT)
+    digest = hashlib.sha256(TEXT).hexdigest()
+
+    with app.app_context():
+        first = add_document(str(path), digest)
+        service.submit(first, str(path), "txt").result(timeout=60)
+        second = add_document(str(path), digest)
+        path.unlink()  # Only a copy can succeed now
+        service.submit(second, str(path), "txt").result(timeout=60)
+        db.session.expire_all()
+
+        job = db.session.get(DocumentExtraction, second)
+        assert (job.status, job.page_count, job.chunk_count, job.parse_ms) == ("done", 2, 2, 0)
+        for model in (DocumentPage, DocumentChunk, DocumentIndex):
+            assert model.query.filter_by(document_id=second).count() == model.query.filter_by(document_id=first).count()
+        assert os.path.exists(vector_store.path_for(second))
+
+
+def test_restarted_service_resubmits_abandoned_jobs(app, tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(TEXT)
+    with app.app_context():
+        # Left behind by a worker that died: one never picked up, one mid-run
+        queued, running = add_document(str(path)), add_document(str(path))
+        job = db.session.get(DocumentExtraction, running)
+        job.status, job.started_at = "running", datetime.utcnow() - timedelta(hours=2)
+        db.session.commit()
+
+    app.config.update(EXTRACTION_REQUEUE_AFTER=0, EXTRACTION_LEASE=3600)
+    restarted = ExtractionService()
+    restarted.init_app(app)
+    try:
+        app.test_client().get("/")  # The first request starts the sweep
+        with app.app_context():
+            deadline = time.time() + 60
+            while {db.session.get(DocumentExtraction, i).status for i in (queued, running)} != {"done"}:
+                assert time.time() < deadline, "abandoned jobs were not resubmitted"
+                time.sleep(0.05)
+                db.session.expire_all()
+            assert restarted.recover() == 0
+            assert DocumentPage.query.filter_by(document_id=queued).count() == 2
+    finally:
+        restarted.shutdown()
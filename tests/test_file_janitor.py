@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for deferred file removal and bulk blob release
+"""
+
+import os
+
+import pytest
+from sqlalchemy import delete
+
+from blob_store import acquire_blob, claim_unreferenced_blob, release_blobs
+from extensions import db
+from file_janitor import FileJanitor
+from models import Blob, FileDeletion
+
+
+def make_app(bare_app, tmp_path):
+    janitor = FileJanitor()
+    app = bare_app(janitor, BLOB_FOLDER=str(tmp_path / "blobs"), UPLOAD_STAGING_FOLDER=str(tmp_path / "incoming"))
+    return app, janitor
+
+
+def write_blob(janitor, digest):
+    path = janitor.blob_store.path_for(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    return path
+
+
+def test_release_blobs_reports_only_unreferenced(bare_app, tmp_path):
+    app, _ = make_app(bare_app, tmp_path)
+
+    with app.app_context():
+        for digest, refs in (("a" * 64, 2), ("b" * 64, 2), ("c" * 64, 1)):
+            for _ in range(refs):
+                acquire_blob(digest, 1)
+        db.session.commit()
+
+        released = release_blobs({"a" * 64: 2, "b" * 64: 1, "c" * 64: 1})
+        db.session.commit()
+
+        assert sorted(released) == ["a" * 64, "c" * 64]
+        assert [(b.sha256, b.ref_count) for b in Blob.query.all()] == [("b" * 64, 1)]
+
+
+def test_files_go_only_after_commit_and_reacquired_blobs_stay(bare_app, tmp_path):
+    app, janitor = make_app(bare_app, tmp_path)
+    gone, reacquired = "d" * 64, "e" * 64
+    plain = tmp_path / "legacy.pdf"
+    plain.write_bytes(b"x")
+
+    with app.app_context():
+        gone_path, kept_path = write_blob(janitor, gone), write_blob(janitor, reacquired)
+
+        janitor.schedule_path(str(plain))
+        db.session.rollback()  # Rolled back deletions never happen
+        janitor.drain()
+        assert plain.exists()
+
+        janitor.schedule_path(str(plain))
+        janitor.schedule_blob(gone)
+        janitor.schedule_blob(reacquired)
+        acquire_blob(reacquired, 1)  # Uploaded again before the janitor ran
+        db.session.commit()
+        janitor.drain()
+
+        assert not plain.exists() and not os.path.exists(gone_path)
+        assert os.path.exists(kept_path)
+        assert FileDeletion.query.count() == 0
+        assert janitor.stats() == {"removed": 2, "kept": 1, "failed": 0}
+        assert [b.sha256 for b in Blob.query.all()] == [reacquired]  # No placeholder row is left behind
+
+
+def test_claim_keeps_referenced_blobs(bare_app, tmp_path):
+    app, _ = make_app(bare_app, tmp_path)
+
+    with app.app_context():
+        acquire_blob("a" * 64, 1)
+        db.session.commit()
+
+        assert not claim_unreferenced_blob("a" * 64)
+        assert claim_unreferenced_blob("b" * 64)  # No row: held by a placeholder until commit
+        db.session.commit()
+
+        assert [(b.sha256, b.ref_count) for b in Blob.query.all()] == [("a" * 64, 1)]
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_rows_drained_by_someone_else_meanwhile_are_skipped(bare_app, tmp_path):
+    app, janitor = make_app(bare_app, tmp_path)
+    paths = [tmp_path / f"{i}.pdf" for i in range(3)]
+    for path in paths:
+        path.write_bytes(b"x")
+    remove = janitor._remove
+
+    def racing_remove(deletion):
+        # SKIP LOCKED does nothing on SQLite, so another drainer may have loaded
+        # the same batch; here it finishes every row while this one starts on them
+        if deletion.id == 1:
+            with db.engine.begin() as connection:
+                connection.execute(delete(FileDeletion))
+        remove(deletion)
+
+    with app.app_context():
+        for path in paths:
+            janitor.schedule_path(str(path))
+        db.session.commit()
+        janitor._remove = racing_remove
+        janitor.drain()
+
+        assert FileDeletion.query.count() == 0
+        assert not any(path.exists() for path in paths)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for outbox email delivery against a local SMTP sink
+"""
+
+import socket
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+from extensions import db, mail
+from mail_outbox import MailOutbox
+from models import OutboxMessage
+
+
+class Sink:
+    """aiosmtpd handler that records messages and SMTP sessions"""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_sink():
+    sink = Sink()
+    controller = aiosmtpd_controller.Controller(sink, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield sink, controller.port
+    controller.stop()
+
+
+def make_app(bare_app, port):
+    outbox = MailOutbox()
+    app = bare_app(mail, outbox, MAIL_SERVER="127.0.0.1", MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+                   MAIL_DEFAULT_SENDER="noreply@clauseease.test", MAIL_OUTBOX_RETRY_BASE=0)
+    return app, outbox
+
+
+def queue(recipient):
+    db.session.add(OutboxMessage(recipient=recipient, subject="Your code", body="123456"))
+    db.session.commit()
+
+
+def test_batch_is_delivered_over_one_connection(bare_app, smtp_sink):
+    sink, port = smtp_sink
+    app, outbox = make_app(bare_app, port)
+
+    with app.app_context():
+        for n in range(3):
+            queue(f"user{n}@example.com")
+        outbox.drain()
+
+        assert [rcpt for rcpt, _ in sink.messages] == [[f"user{n}@example.com"] for n in range(3)]
+        assert sink.sessions == 1
+        assert {m.status for m in OutboxMessage.query.all()} == {"sent"}
+
+
+def test_unreachable_server_backs_off_and_retries(bare_app, smtp_sink):
+    sink, port = smtp_sink
+    app, outbox = make_app(bare_app, free_port())
+
+    with app.app_context():
+        queue("user@example.com")
+        outbox.drain()
+        message = OutboxMessage.query.one()
+        assert (message.status, message.attempts) == ("pending", 1)
+        assert message.last_error
+
+        app.config["MAIL_PORT"] = port
+        mail.init_app(app)
+        outbox.drain()
+
+        assert OutboxMessage.query.one().status == "sent"
+        assert len(sink.messages) == 1
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for versioned schema migrations on a database created before them
+"""
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+import models  # noqa: F401  registers the tables create_all() builds
+from extensions import db
+from migrations import MIGRATIONS, pending_migrations, upgrade, query_plans, schema_ready
+
+OLD_SCHEMA = [
+    "CREATE TABLE documents (id INTEGER PRIMARY KEY, user_email VARCHAR(255) NOT NULL, filename VARCHAR(255) NOT NULL, "
+    "original_filename VARCHAR(255) NOT NULL, file_path VARCHAR(500) NOT NULL, file_size INTEGER NOT NULL, "
+    "file_type VARCHAR(50) NOT NULL, uploaded_at DATETIME)",
+    "CREATE TABLE chats (id INTEGER PRIMARY KEY, user_email VARCHAR(255) NOT NULL, document_id INTEGER, "
+    "title VARCHAR(255) NOT NULL, created_at DATETIME, updated_at DATETIME)",
+    "CREATE TABLE chat_messages (id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, role VARCHAR(20) NOT NULL, "
+    "content TEXT NOT NULL, created_at DATETIME)",
+]
+
+
+def make_app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'old.db'}"
+    db.init_app(app)
+    with app.app_context(), db.engine.begin() as conn:
+        for statement in OLD_SCHEMA:
+            conn.execute(text(statement))
+    return app
+
+
+def test_upgrade_adds_columns_and_indexes_once(tmp_path):
+    app = make_app(tmp_path)
+
+    with app.app_context(), db.engine.connect() as conn:
+        assert len(pending_migrations(conn)) == len(MIGRATIONS)
+        assert upgrade(conn) == [version for version, _, _ in MIGRATIONS]
+        assert upgrade(conn) == []
+
+        inspector = inspect(conn)
+        assert inspector.has_table("blobs")  # Referenced by documents.content_hash
+        assert {"content_hash", "file_exists"} <= {c["name"] for c in inspector.get_columns("documents")}
+        assert {"ix_documents_user_uploaded", "ix_documents_content_hash"} <= {i["name"] for i in inspector.get_indexes("documents")}
+        assert {"ix_chats_user_updated", "ix_chats_document_id"} <= {i["name"] for i in inspector.get_indexes("chats")}
+
+
+def test_query_plans_use_the_new_indexes(tmp_path):
+    app = make_app(tmp_path)
+
+    with app.app_context(), db.engine.connect() as conn:
+        before = query_plans(conn, email="u@x.com")
+        upgrade(conn)
+        after = query_plans(conn, email="u@x.com")
+
+    assert before["/user-documents"][0].startswith("SCAN documents")
+    assert "ix_documents_user_uploaded" in after["/user-documents"][0]
+    assert "ix_chats_document_id" in after["/delete-document"][0]
+    assert "ix_chat_messages_chat_created" in after["/get-chat-messages"][0]
+
+
+def test_schema_ready_needs_every_table_and_migration(tmp_path):
+    app = make_app(tmp_path)
+
+    with app.app_context(), db.engine.connect() as conn:
+        upgrade(conn)
+        assert not schema_ready(conn)  # Tables added since the old schema are missing
+
+        db.create_all()
+        assert schema_ready(conn)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for one-time code storage on both backends
+"""
+
+import pytest
+
+from conftest import EMAIL
+from otp_store import OTP_EXPIRED, OTP_INVALID, OTP_LOCKED, OTP_OK, OtpStore
+
+
+@pytest.fixture(params=["database", "memory"])
+def store(request, bare_app):
+    store = OtpStore()
+    app = bare_app(store, SECRET_KEY="test", OTP_STORE=request.param, OTP_MAX_ATTEMPTS=3)
+    with app.app_context():
+        yield store
+
+
+def wrong(code):
+    return "000000" if code != "000000" else "111111"
+
+
+def test_correct_code_is_consumed(store):
+    code, _ = store.issue(EMAIL)
+
+    assert store.has_active(EMAIL)
+    assert store.verify(EMAIL, wrong(code)) == OTP_INVALID
+    assert store.verify(EMAIL, code) == OTP_OK
+    assert not store.has_active(EMAIL)
+    assert store.verify(EMAIL, code) == OTP_EXPIRED  # Already used
+
+
+def test_code_is_burnt_after_max_attempts(store):
+    code, _ = store.issue(EMAIL)
+
+    for _ in range(3):
+        assert store.verify(EMAIL, wrong(code)) == OTP_INVALID
+    assert store.verify(EMAIL, code) == OTP_LOCKED  # Even the right code, once over the limit
+    assert store.verify(EMAIL, code) == OTP_EXPIRED
+
+    code, _ = store.issue(EMAIL)  # A new code starts counting again
+    assert store.verify(EMAIL, code) == OTP_OK
+
+
+def test_codes_are_per_purpose(store):
+    code, _ = store.issue(EMAIL, purpose="email")
+
+    assert store.verify(EMAIL, code, purpose="password_reset") == OTP_EXPIRED
+    assert store.verify(EMAIL, code, purpose="email") == OTP_OK
+
+
+def test_expired_codes_are_rejected_and_swept(store):
+    store.app.config["OTP_EXPIRY_MINUTES"] = 0
+    expired, _ = store.issue(EMAIL)
+    store.issue("other@example.com")
+    store.app.config["OTP_EXPIRY_MINUTES"] = 10
+    live, _ = store.issue("third@example.com")
+
+    assert not store.has_active(EMAIL)
+    assert store.verify(EMAIL, expired) == OTP_EXPIRED
+    assert store.sweep() == 2
+    assert store.sweep() == 0
+    assert store.verify("third@example.com", live) == OTP_OK
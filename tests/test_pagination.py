@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for keyset cursors and the paginated chat endpoints
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import EMAIL
+from extensions import db
+from models import Chat, ChatMessage
+from pagination import decode_cursor, encode_cursor
+
+NOON = datetime(2024, 5, 1, 12, 0, 0, 123456)
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor(NOON, 42)
+
+    assert "=" not in cursor and "|" not in cursor
+    assert decode_cursor(cursor) == (NOON, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90LWEtY3Vyc29y", encode_cursor(NOON, 1)[:-3]])
+def test_malformed_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_get_chats_pages_break_ties_by_id(app, client):
+    with app.app_context():
+        # Same updated_at for all: only the id orders them
+        db.session.add_all([Chat(user_email=EMAIL, title=f"chat {i}", updated_at=NOON) for i in range(5)])
+        db.session.commit()
+
+    titles, cursor = [], None
+    while True:
+        response = client.get("/get-chats", query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        titles += [chat["title"] for chat in response.get_json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert titles == ["chat 4", "chat 3", "chat 2", "chat 1", "chat 0"]
+    assert client.get("/get-chats", query_string={"cursor": "!!!"}).status_code == 400
+
+
+def test_get_chat_messages_before_and_since(app, client):
+    with app.app_context():
+        chat = Chat(user_email=EMAIL, title="chat")
+        db.session.add(chat)
+        db.session.flush()
+        # m1 and m2 share a timestamp, so the id orders them
+        times = [NOON, NOON + timedelta(seconds=1), NOON + timedelta(seconds=1), NOON + timedelta(seconds=2)]
+        db.session.add_all([ChatMessage(chat_id=chat.id, role="user", content=f"m{i}", created_at=t)
+                            for i, t in enumerate(times)])
+        db.session.commit()
+        chat_id = chat.id
+    url = f"/get-chat-messages/{chat_id}"
+
+    latest = client.get(url, query_string={"limit": 2})
+    assert [m["content"] for m in latest.get_json()] == ["m2", "m3"]
+    older = client.get(url, query_string={"limit": 2, "before": latest.headers["X-Before-Cursor"]})
+    assert [m["content"] for m in older.get_json()] == ["m0", "m1"]
+    assert "X-Before-Cursor" not in older.headers
+
+    since = older.headers["X-Since-Cursor"]  # Just after m1
+    newer = client.get(url, query_string={"since": since})
+    assert [m["content"] for m in newer.get_json()] == ["m2", "m3"]
+    nothing = client.get(url, query_string={"since": newer.headers["X-Since-Cursor"]})
+    assert nothing.get_json() == []
+    assert nothing.headers["X-Since-Cursor"] == newer.headers["X-Since-Cursor"]
+
+    assert client.get(url, query_string={"since": since, "before": since}).status_code == 400
+    assert client.get(url, query_string={"before": "!!!"}).status_code == 400
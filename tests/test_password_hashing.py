@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for password hashing parameters and rehash detection
+"""
+
+import time
+
+import pytest
+
+from flask import Flask
+from werkzeug.security import generate_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from password_hashing import HasherBusy, PasswordHasher, method_prefix
+
+
+def test_method_prefix_fills_in_werkzeug_defaults():
+    assert method_prefix("pbkdf2") == f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+    assert method_prefix("pbkdf2:sha256:1000") == "pbkdf2:sha256:1000"
+    assert method_prefix("scrypt") == "scrypt:32768:8:1"
+    assert method_prefix("scrypt:16384") == "scrypt:16384:8:1"
+
+
+def test_inline_hasher_round_trips_and_flags_old_hashes():
+    hasher = PasswordHasher()  # Not bound to an app: hashes inline
+
+    pwhash = hasher.hash("Passw0rd!")
+
+    assert hasher.verify(pwhash, "Passw0rd!")
+    assert not hasher.verify(pwhash, "wrong")
+    assert not hasher.needs_rehash(pwhash)
+    assert hasher.needs_rehash(generate_password_hash("Passw0rd!", method="pbkdf2:sha256:1000"))
+    assert hasher.stats()["verified"] == 2
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_TIMEOUT=0.001)
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+    try:
+        with pytest.raises(HasherBusy, match="too long"):
+            hasher.hash("Passw0rd!")  # Still starting the worker process
+        with pytest.raises(HasherBusy, match="Too many"):
+            hasher.hash("Passw0rd!")  # The worker is still busy with the first one
+        assert hasher.stats()["pending"] == 1
+
+        deadline = time.time() + 30
+        while hasher.stats()["pending"] and time.time() < deadline:
+            time.sleep(0.05)
+        hasher.timeout = 30
+        assert hasher.verify(hasher.hash("Passw0rd!"), "Passw0rd!")
+    finally:
+        hasher.shutdown()
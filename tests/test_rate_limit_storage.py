@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared SQLite rate limit storage
+"""
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter, FixedWindowRateLimiter
+
+import rate_limit_storage  # noqa: F401  registers sqlite://
+
+
+def workers(tmp_path, count=2, **options):
+    """Storages on one file, standing in for separate gunicorn workers"""
+    uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    return [storage_from_string(uri, **options) for _ in range(count)]
+
+
+def test_moving_window_is_shared_between_workers(tmp_path):
+    first, second = workers(tmp_path)
+    login = parse("5/minute")
+    limiters = [MovingWindowRateLimiter(first), MovingWindowRateLimiter(second)]
+
+    allowed = [limiters[n % 2].hit(login, "login", "1.2.3.4") for n in range(8)]
+
+    assert allowed == [True] * 5 + [False] * 3
+    assert limiters[0].hit(login, "login", "5.6.7.8")
+    assert first.stats()["fast_hits"] == 0  # Small limits always go to the shared file
+    assert limiters[1].get_window_stats(login, "login", "1.2.3.4").remaining == 0
+
+
+def test_leased_hits_never_exceed_the_limit(tmp_path):
+    first, second = workers(tmp_path, lease_seconds=60)
+    upload = parse("20/minute")
+    limiters = [MovingWindowRateLimiter(first), MovingWindowRateLimiter(second)]
+
+    allowed = sum(limiters[n % 2].hit(upload, "upload", "1.2.3.4") for n in range(40))
+
+    assert allowed == 20
+    assert first.stats()["fast_hits"] + second.stats()["fast_hits"] > 0
+    assert first.stats()["fast_rejects"] > 0
+
+
+def test_unused_leases_are_handed_back(tmp_path):
+    first, second = workers(tmp_path, lease_seconds=0)
+    upload = parse("20/minute")
+
+    assert MovingWindowRateLimiter(first).hit(upload, "upload", "1.2.3.4")
+    assert MovingWindowRateLimiter(second).get_window_stats(upload, "upload", "1.2.3.4").remaining == 10
+
+    # Any later trip to the shared file returns expired leases
+    MovingWindowRateLimiter(first).hit(upload, "upload", "9.9.9.9")
+
+    assert MovingWindowRateLimiter(second).get_window_stats(upload, "upload", "1.2.3.4").remaining == 19
+
+
+def test_fixed_window_counters(tmp_path):
+    first, second = workers(tmp_path)
+    limit = parse("2/minute")
+
+    assert FixedWindowRateLimiter(first).hit(limit, "reset")
+    assert FixedWindowRateLimiter(second).hit(limit, "reset")
+    assert not FixedWindowRateLimiter(first).hit(limit, "reset")
+    assert first.check()
+    assert first.reset() > 0
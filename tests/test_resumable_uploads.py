@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for resumable chunked uploads
+"""
+
+import hashlib
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import EMAIL
+from extensions import db
+from models import FileDeletion, UploadChunk, UploadSession
+from blob_store import BlobStore
+from resumable_uploads import ResumableUploads, UploadRejected, expire_sessions
+
+CHUNK = 64 * 1024
+
+
+def make_app(bare_app, tmp_path):
+    uploads = ResumableUploads()
+    app = bare_app(uploads, UPLOAD_STAGING_FOLDER=str(tmp_path / "incoming"), MAX_CONTENT_LENGTH=10 * 1024 * 1024)
+    return app, uploads
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_chunks_in_any_order_assemble_in_place(bare_app, tmp_path):
+    app, uploads = make_app(bare_app, tmp_path)
+    body = os.urandom(CHUNK * 2 + 1000)
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+
+    with app.app_context():
+        session = uploads.create(EMAIL, "big.pdf", "application/pdf", len(body), sha256=sha256(body), chunk_size=CHUNK)
+        assert session.chunk_count == 3
+
+        uploads.write_chunk(session, 2, io.BytesIO(chunks[2]), sha256(chunks[2]))
+        with pytest.raises(UploadRejected) as error:
+            uploads.write_chunk(session, 0, io.BytesIO(chunks[0]), sha256(b"other"))
+        assert error.value.status == 422
+        with pytest.raises(UploadRejected) as error:
+            uploads.write_chunk(session, 1, io.BytesIO(chunks[1] + b"extra"), sha256(chunks[1] + b"extra"))
+        assert error.value.status == 400
+        with pytest.raises(UploadRejected) as error:
+            uploads.assemble(session)
+        assert error.value.status == 409
+        db.session.rollback()
+
+        for index in (0, 1, 1):  # A retried chunk is simply stored again
+            uploads.write_chunk(session, index, io.BytesIO(chunks[index]), sha256(chunks[index]))
+        assert uploads.received(session) == [0, 1, 2]
+
+        assembled = uploads.assemble(session)
+        assert (assembled.path, assembled.size, assembled.sha256) == (session.path, len(body), sha256(body))
+        with open(session.path, "rb") as f:
+            assert f.read() == body
+
+
+def test_expired_sessions_are_dropped_with_their_files_queued(bare_app, tmp_path):
+    app, uploads = make_app(bare_app, tmp_path)
+    app.config["UPLOAD_SESSIONS_PER_USER"] = 1
+
+    with app.app_context():
+        stale = uploads.create(EMAIL, "a.pdf", "application/pdf", 10)
+        stale_path = stale.path
+        uploads.write_chunk(stale, 0, io.BytesIO(b"0123456789"), sha256(b"0123456789"))
+        with pytest.raises(UploadRejected) as error:
+            uploads.create(EMAIL, "b.pdf", "application/pdf", 10)
+        assert error.value.status == 429
+
+        stale.expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        fresh = uploads.create(EMAIL, "b.pdf", "application/pdf", 10)  # Expires the stale one first
+
+        assert [s.id for s in UploadSession.query.all()] == [fresh.id]
+        assert UploadChunk.query.count() == 0
+        assert [d.path for d in FileDeletion.query.all()] == [stale_path]
+        assert expire_sessions() == 0
+
+
+def test_chunk_sent_after_completion_is_rejected(bare_app, tmp_path):
+    app, uploads = make_app(bare_app, tmp_path)
+    blob_store = BlobStore(str(tmp_path / "blobs"), app.config["UPLOAD_STAGING_FOLDER"])
+    body = b"a" * 100
+
+    with app.app_context():
+        session = uploads.create(EMAIL, "a.pdf", "application/pdf", len(body))
+        uploads.write_chunk(session, 0, io.BytesIO(body), sha256(body))
+
+        assembled = uploads.assemble(session)
+        stored, _ = blob_store.adopt(assembled.path, assembled.size, assembled.sha256)
+        uploads.finish(session)
+        db.session.commit()
+
+        with pytest.raises(UploadRejected) as error:
+            uploads.write_chunk(session, 0, io.BytesIO(b"b" * 100), sha256(b"b" * 100))
+        assert error.value.status == 410
+        with open(stored.path, "rb") as f:
+            assert f.read() == body  # The blob still matches its name
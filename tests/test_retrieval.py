@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for clause chunking and the BM25 inverted index
+"""
+
+from retrieval import InvertedIndex, build_clause_index, chunk_pages
+
+AGREEMENT = [
+    """MASTER SERVICES AGREEMENT
+
+1. DEFINITIONS
+1.1 "Services" means the services described in Schedule 1.
+
+2. TERM AND TERMINATION
+2.1 This Agreement commences on the Effective Date.
+2.2 Either party may terminate this Agreement on 30 days written notice.""",
+    """3. FEES
+3.1 The Customer shall pay all invoices within 45 days.
+3.2 Late payments accrue interest at 2% per month.""",
+]
+
+
+def test_chunks_follow_clause_numbering_and_headings():
+    chunks = chunk_pages(AGREEMENT)
+
+    contents = [chunk["content"] for chunk in chunks]
+    assert any(c.startswith("2.2 Either party may terminate") for c in contents)
+    assert [chunk["ordinal"] for chunk in chunks] == list(range(len(chunks)))
+
+    fees = next(chunk for chunk in chunks if chunk["content"].startswith("3.1"))
+    assert fees["page_number"] == 2
+    assert fees["heading"] == "3. FEES"
+
+
+def test_long_clauses_are_split_at_sentences():
+    sentence = "The Supplier shall maintain insurance at its own cost. "
+    chunks = chunk_pages(["4.1 " + sentence * 60], max_chars=500)
+
+    assert len(chunks) > 1
+    assert all(len(chunk["content"]) <= 500 for chunk in chunks)
+
+
+def test_bm25_ranks_matching_clause_first():
+    chunks, index = build_clause_index(AGREEMENT)
+
+    ordinal, _ = index.search("how do I terminate the agreement?", k=3)[0]
+
+    assert chunks[ordinal]["content"].startswith("2.2")
+
+
+def test_index_round_trips_through_bytes():
+    _, index = build_clause_index(AGREEMENT)
+
+    restored = InvertedIndex.from_bytes(index.to_bytes())
+
+    assert restored.term_ids == index.term_ids
+    assert restored.search("invoices payment", k=2) == index.search("invoices payment", k=2)
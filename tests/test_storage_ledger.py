@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for per-user storage accounting and quotas
+"""
+
+import time
+
+import pytest
+
+from conftest import EMAIL
+from extensions import db
+from models import Document, UserStorage
+from storage_ledger import StorageLedger, QuotaExceeded
+
+
+def make_app(bare_app, quota_bytes):
+    ledger = StorageLedger()
+    return bare_app(ledger, STORAGE_QUOTA_MB=quota_bytes / (1024 * 1024)), ledger
+
+
+def add_document(size):
+    db.session.add(Document(user_email=EMAIL, filename="f", original_filename="f", file_path="/f",
+                            file_size=size, file_type="text/plain"))
+
+
+def test_charge_enforces_quota_and_release_frees_it(bare_app):
+    app, ledger = make_app(bare_app, quota_bytes=100)
+
+    with app.app_context():
+        add_document(60)  # Uploaded before the ledger existed
+        db.session.commit()
+
+        ledger.charge(EMAIL, 30)
+        add_document(30)
+        db.session.commit()
+        assert ledger.usage(EMAIL)["bytes_used"] == 90
+
+        with pytest.raises(QuotaExceeded) as error:
+            ledger.charge(EMAIL, 20)
+        db.session.rollback()
+        assert (error.value.used, error.value.quota) == (90, 100)
+
+        ledger.release(EMAIL, 60)
+        db.session.commit()
+        ledger.charge(EMAIL, 20)
+        db.session.commit()
+        assert ledger.usage(EMAIL) | {"reconciled_at": None} == {
+            "document_count": 2, "bytes_used": 50, "quota_bytes": 100,
+            "remaining_bytes": 50, "reconciled_at": None,
+        }
+
+
+def test_per_user_quota_overrides_default(bare_app):
+    app, ledger = make_app(bare_app, quota_bytes=100)
+
+    with app.app_context():
+        ledger.charge(EMAIL, 10)
+        db.session.get(UserStorage, EMAIL).quota_bytes = 1000
+        db.session.commit()
+
+        ledger.charge(EMAIL, 500)
+        assert ledger.usage(EMAIL)["remaining_bytes"] == 490
+
+
+def test_reconcile_fixes_drift_and_backfills(bare_app):
+    app, ledger = make_app(bare_app, quota_bytes=0)
+
+    with app.app_context():
+        add_document(40)
+        add_document(2)
+        db.session.commit()
+        assert ledger.reconcile() == 1  # Row created from the documents table
+        assert ledger.usage(EMAIL)["bytes_used"] == 42
+
+        db.session.get(UserStorage, EMAIL).bytes_used = 7
+        db.session.commit()
+        assert ledger.reconcile() == 1
+        fixed_at = ledger.usage(EMAIL)["reconciled_at"]
+        assert ledger.reconcile() == 0
+        assert ledger.usage(EMAIL)["reconciled_at"] > fixed_at  # Stamped even with nothing to fix
+        assert ledger.usage(EMAIL) | {"reconciled_at": None} == {
+            "document_count": 2, "bytes_used": 42, "quota_bytes": None,
+            "remaining_bytes": None, "reconciled_at": None,
+        }
+
+
+def test_first_request_backfills_users_without_documents(bare_app):
+    app, ledger = make_app(bare_app, quota_bytes=0)
+
+    app.test_client().get("/")  # Starts the reconciliation thread
+    deadline = time.time() + 10
+    with app.app_context():
+        while db.session.get(UserStorage, EMAIL) is None:
+            assert time.time() < deadline, "ledger row was not backfilled"
+            time.sleep(0.05)
+            db.session.remove()
+        assert ledger.documents_version(EMAIL) == 0
+        assert ledger.usage(EMAIL)["reconciled_at"] is not None
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Tests for the background orphan / dangling-document scan
+"""
+
+import os
+import time
+
+import pytest
+
+from blob_store import acquire_blob
+from conftest import EMAIL, add_user
+from extensions import db
+from models import Document, FileDeletion, StorageScan, UserStorage
+from upload_scanner import PHASES, UploadScanner
+
+OLD = time.time() - 7200
+
+
+def make_app(bare_app, tmp_path):
+    uploads = tmp_path / "uploads"
+    scanner = UploadScanner()
+    app = bare_app(scanner, UPLOAD_FOLDER=str(uploads), BLOB_FOLDER=str(uploads / ".blobs"),
+                   VECTOR_FOLDER=str(uploads / ".vectors"), UPLOAD_STAGING_FOLDER=str(uploads / ".incoming"),
+                   UPLOAD_SCAN_SHARDS_PER_STEP=64, UPLOAD_SCAN_BATCH_SIZE=2, UPLOAD_SCAN_REMOVE_ORPHANS=True)
+    return app, scanner
+
+
+def touch(path, mtime=OLD):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def blob_path(app, digest):
+    return os.path.join(app.config["BLOB_FOLDER"], digest[:2], digest[2:4], digest)
+
+
+def add_document(file_path, content_hash=None):
+    document = Document(user_email=EMAIL, filename="f", original_filename="f", file_path=file_path,
+                        file_size=1, file_type="text/plain", content_hash=content_hash)
+    db.session.add(document)
+    db.session.flush()
+    return document.id
+
+
+def run_pass(scanner):
+    """Step until the current (or a new) pass has finished"""
+    steps = 0
+    while scanner.step():
+        steps += 1
+        if StorageScan.query.order_by(StorageScan.id.desc()).first().finished_at:
+            break
+    return steps
+
+
+def test_pass_finds_orphans_and_dangling_documents(bare_app, tmp_path):
+    app, scanner = make_app(bare_app, tmp_path)
+    kept, orphan, missing = "a" * 64, "b" * 64, "c" * 64
+    user_dir = tmp_path / "uploads" / EMAIL
+
+    with app.app_context():
+        touch(blob_path(app, kept))
+        acquire_blob(kept, 1)
+        add_document(blob_path(app, kept), kept)
+        orphan_blob = touch(blob_path(app, orphan))
+        touch(blob_path(app, "d" * 64), mtime=time.time())  # Mid-upload: inside the grace period
+        acquire_blob(missing, 1)
+        dangling_blob_doc = add_document(blob_path(app, missing), missing)
+
+        legacy = touch(user_dir / "kept.pdf")
+        add_document(legacy)
+        orphan_legacy = touch(user_dir / "orphan.pdf")
+        dangling_legacy = [add_document(str(user_dir / f"gone{i}.pdf")) for i in range(3)]
+
+        live_vector = touch(tmp_path / "uploads" / ".vectors" / f"{dangling_blob_doc}.npy")
+        orphan_vector = touch(tmp_path / "uploads" / ".vectors" / "999.npy")
+        stale_spool = touch(tmp_path / "uploads" / ".incoming" / "tmp123", mtime=OLD - 86400)
+        touch(tmp_path / "uploads" / ".incoming" / "tmp456")  # Younger than UPLOAD_SCAN_STAGING_MAX_AGE
+        db.session.commit()
+
+        steps = run_pass(scanner)
+
+        report = scanner.report()
+        # 256 blob shards at 64 per step, 4 legacy rows at 2 per step, vector ids 1-6 then the file above them,
+        # 2 spool files then the session expiry
+        assert steps == 4 + 1 + 3 + 4 + 2
+        assert report["phase"] == "done" and report["finished_at"]
+        assert report["files_seen"] == 3 + 2 + 2 + 1
+        assert report["orphans_found"] == report["orphans_queued"] == 4
+        assert report["dangling_documents"] == 4
+        assert sorted(report["dangling_sample"]) == sorted([dangling_blob_doc] + dangling_legacy)
+        assert sorted(d.id for d in Document.query.filter_by(file_exists=False)) == report["dangling_sample"]
+
+        queued = {d.blob_sha256 or d.path for d in FileDeletion.query.all()}
+        assert queued == {orphan, orphan_legacy, orphan_vector, stale_spool}
+        assert os.path.exists(orphan_blob) and os.path.exists(live_vector)  # Removal is the janitor's job
+
+        assert scanner.step() is False  # The next pass waits for UPLOAD_SCAN_INTERVAL
+        app.config["UPLOAD_SCAN_INTERVAL"] = 0
+        assert scanner.step() is True
+        assert StorageScan.query.count() == 2
+
+
+def test_pass_resumes_from_checkpoint(bare_app, tmp_path):
+    app, scanner = make_app(bare_app, tmp_path)
+    app.config["UPLOAD_SCAN_SHARDS_PER_STEP"] = 16
+
+    with app.app_context():
+        for prefix in ("0a", "f0"):
+            touch(blob_path(app, prefix + "0" * 62))
+        assert scanner.step()
+        scan = StorageScan.query.one()
+        assert (scan.phase, scan.cursor, scan.files_seen) == ("blobs", "0f", 1)
+
+        # A different process (here: a fresh scanner) picks the pass up where it stopped
+        other = UploadScanner()
+        other.app = app
+        run_pass(other)
+        scan = StorageScan.query.one()
+        assert (scan.phase, scan.files_seen, scan.orphans_found) == ("done", 2, 2)
+
+
+def test_vector_phase_checkpoints_by_document_id(bare_app, tmp_path):
+    app, scanner = make_app(bare_app, tmp_path)
+    vectors = tmp_path / "uploads" / ".vectors"
+
+    with app.app_context():
+        ids = [add_document(f"/f{i}") for i in range(5)]
+        db.session.delete(db.session.get(Document, ids[2]))
+        db.session.add(StorageScan(phase="vectors"))
+        db.session.commit()
+        for document_id in ids + [40, 41, 42]:
+            touch(vectors / f"{document_id}.npy")
+
+        cursors = []
+        while StorageScan.query.one().phase == "vectors":
+            scanner.step()
+            cursors.append(StorageScan.query.one().cursor)
+
+        # Id ranges up to the highest row, then the folder listing for the files above it
+        assert cursors == ["2", "4", "5", "41", None]
+        queued = {d.path for d in FileDeletion.query.all()}
+        assert queued == {str(vectors / f"{document_id}.npy") for document_id in (ids[2], 40, 41, 42)}
+
+
+def test_file_state_is_recorded_and_bumps_documents_version(bare_app, tmp_path):
+    app, scanner = make_app(bare_app, tmp_path)
+    app.config["UPLOAD_SCAN_INTERVAL"] = 0
+    digest = "e" * 64
+
+    with app.app_context():
+        db.session.add(UserStorage(user_email=EMAIL))
+        acquire_blob(digest, 1)
+        document_id = add_document(blob_path(app, digest), digest)
+        db.session.commit()
+
+        run_pass(scanner)
+        document = db.session.get(Document, document_id)
+        assert document.file_exists is False and document.file_checked_at is not None
+        assert db.session.get(UserStorage, EMAIL).documents_version == 1
+
+        run_pass(scanner)  # Unchanged state leaves cached listings valid
+        assert db.session.get(UserStorage, EMAIL).documents_version == 1
+
+        touch(blob_path(app, digest))
+        run_pass(scanner)
+        assert db.session.get(Document, document_id).file_exists is True
+        assert db.session.get(UserStorage, EMAIL).documents_version == 2
+
+
+@pytest.mark.app_config(OPERATOR_EMAILS={"ops@example.com"})
+def test_only_operators_can_start_a_pass(app, login):
+    with app.app_context():
+        add_user("ops@example.com", email_verified=True)
+        db.session.commit()
+
+    assert login().post("/cleanup-orphaned-files").status_code == 403
+    response = login("ops@example.com").post("/cleanup-orphaned-files")
+    assert response.status_code == 202
+    assert "reported, not removed" in response.get_json()["message"]  # Removal is opt-in
+    assert login().get("/cleanup-orphaned-files").status_code == 403
+    report = login("ops@example.com").get("/cleanup-orphaned-files").get_json()["last_scan"]
+    assert report is None or report["phase"] in PHASES + ("done",)
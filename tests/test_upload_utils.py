@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Tests for the single-pass upload helpers
+"""
+
+import hashlib
+import io
+import os
+
+from upload_utils import HashingSpoolFile, stream_to_file
+
+
+def test_stream_to_file_hashes_and_renames(tmp_path):
+    data = os.urandom(200_000)
+    dest = tmp_path / "doc.pdf"
+
+    stored = stream_to_file(io.BytesIO(data), str(dest), str(tmp_path), chunk_size=4096)
+
+    assert stored.size == len(data)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    assert dest.read_bytes() == data
+    assert sorted(os.listdir(tmp_path)) == ["doc.pdf"]
+
+
+def test_uncommitted_spool_is_discarded(tmp_path):
+    spool = HashingSpoolFile(str(tmp_path))
+    spool.write(b"partial upload")
+    assert os.listdir(tmp_path)
+
+    spool.close()
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for the session user cache and its commit-time invalidation
+"""
+
+import pytest
+
+from conftest import EMAIL
+from extensions import db
+from models import User
+from user_cache import user_cache
+
+
+@pytest.fixture
+def app(bare_app):
+    app = bare_app(user_cache)
+    user_cache.invalidate(EMAIL)
+    return app
+
+
+def test_snapshot_is_read_only(app):
+    with app.app_context():
+        snapshot = user_cache.put(db.session.get(User, EMAIL))
+
+    assert user_cache.get(EMAIL) is snapshot and snapshot.get_id() == EMAIL
+    with pytest.raises(AttributeError):
+        snapshot.email_verified = True
+
+
+@pytest.mark.parametrize("field, value", [("email_verified", True), ("password_hash", "changed")])
+def test_committed_changes_evict_the_snapshot(app, field, value):
+    with app.app_context():
+        user = db.session.get(User, EMAIL)
+        user_cache.put(user)
+
+        setattr(user, field, value)
+        db.session.flush()
+        assert user_cache.get(EMAIL) is not None  # Only evicted once the change commits
+        db.session.rollback()
+        assert user_cache.get(EMAIL) is not None  # Rolled back: nothing changed
+
+        user = db.session.get(User, EMAIL)
+        setattr(user, field, value)
+        db.session.commit()
+        assert user_cache.get(EMAIL) is None
+
+        assert user_cache.put(db.session.get(User, EMAIL)).email_verified is (field == "email_verified")